@@ -0,0 +1,276 @@
+#
+# Licensed to Elasticsearch under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Shared execution of Google API requests."""
+
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Optional
+
+from googleapiclient.discovery import Resource
+
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+
+from .transport import get_transport
+from .utils import ETC_DIR
+
+BATCH_LIMITS = {
+    'directory': 1000,
+    'drive': 100,
+    'gmail': 100,
+}
+DEFAULT_BATCH_LIMIT = 100
+DISCOVERY_DIR = ETC_DIR / 'discovery'
+DISCOVERY_URL = 'https://{api}.googleapis.com/$discovery/rest?version={version}'
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# 403 responses with these reasons are quota errors rather than permission errors
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded')
+# requests per minute per user, by the API prefix of the request method id, e.g. "directory.users.insert"
+DEFAULT_QUOTAS = {
+    'reports': 2400,
+    'directory': 2400,
+    'drive': 12000,
+    'gmail': 150,
+    'forms': 300,
+}
+
+
+@lru_cache(maxsize=None)
+def load_discovery_document(api: str, version: str) -> str:
+    """
+    Load the discovery document of an API once per process, from the documents bundled with googleapiclient or the
+    local discovery cache, only fetching it from Google if it is in neither.
+
+    Parameters:
+        api (str): The API name, e.g. "admin".
+        version (str): The API version, e.g. "directory_v1".
+
+    Returns:
+        str: The discovery document.
+    """
+    document = get_static_doc(api, version)
+    if document is not None:
+        return document
+
+    path = DISCOVERY_DIR / f'{api}.{version}.json'
+    if path.exists():
+        return path.read_text()
+
+    logging.info(f'Fetching discovery document for {api} {version}')
+    response = get_transport().get(DISCOVERY_URL.format(api=api, version=version))
+    response.raise_for_status()
+    DISCOVERY_DIR.mkdir(parents=True, exist_ok=True)
+    path.write_text(response.text)
+    return response.text
+
+
+@dataclass
+class TokenBucket:
+    """Token bucket allowing a steady rate of requests with bursts up to its capacity."""
+
+    rate: float
+    capacity: float
+    tokens: float = field(init=False)
+    updated: float = field(init=False, default_factory=time.monotonic)
+    lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        self.tokens = self.capacity
+
+    @classmethod
+    def per_minute(cls, requests: float) -> 'TokenBucket':
+        """Build a bucket from a quota in requests per minute, allowing a second of burst."""
+        rate = requests / 60
+        return cls(rate=rate, capacity=max(rate, 1))
+
+    def acquire(self) -> float:
+        """Take a token, waiting for one if the bucket is empty, and return the seconds waited."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            # a negative balance reserves the token, so concurrent callers queue up behind each other
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def get_api(request: Any) -> str:
+    """Return the API of a request from its method id."""
+    method_id = getattr(request, 'methodId', None) or ''
+    return method_id.split('.')[0] or 'default'
+
+
+def is_retryable(err: Exception) -> bool:
+    """Return a boolean indicating if the error is transient."""
+    if not isinstance(err, HttpError):
+        return isinstance(err, (ConnectionError, TimeoutError))
+    if err.status_code in RETRYABLE_STATUS_CODES:
+        return True
+    return err.status_code == 403 and any(reason in str(err.error_details) for reason in RATE_LIMIT_REASONS)
+
+
+@dataclass
+class RequestExecutor:
+    """Executes Google API requests with per-API rate limiting and retries with exponential backoff and jitter."""
+
+    quotas: dict[str, float] = field(default_factory=lambda: dict(DEFAULT_QUOTAS))
+    retries: int = 5
+    backoff: float = 1.0
+    max_backoff: float = 32.0
+    stats: dict[str, Counter] = field(init=False, default_factory=lambda: defaultdict(Counter))
+    buckets: dict[str, TokenBucket] = field(init=False, default_factory=dict, repr=False)
+    lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False)
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'RequestExecutor':
+        """Build the executor from the "api" settings of the SWAT config."""
+        settings = config.get('settings', {}).get('api') or {}
+        quotas = {**DEFAULT_QUOTAS, **(settings.get('quotas') or {})}
+        return cls(quotas=quotas, **{k: v for k, v in settings.items() if k in ('retries', 'backoff', 'max_backoff')})
+
+    def bucket(self, api: str) -> Optional[TokenBucket]:
+        """Return the token bucket of an API, or None if it is not rate limited."""
+        with self.lock:
+            if api not in self.buckets and self.quotas.get(api):
+                self.buckets[api] = TokenBucket.per_minute(self.quotas[api])
+            return self.buckets.get(api)
+
+    def count(self, api: str, counter: str) -> None:
+        """Increment a request counter of an API."""
+        with self.lock:
+            self.stats[api][counter] += 1
+
+    def delay(self, attempt: int, err: Exception) -> float:
+        """Return the seconds to wait before a retry, honoring a Retry-After header."""
+        resp = getattr(err, 'resp', None)
+        retry_after = resp.get('retry-after') if isinstance(resp, dict) else None
+        if retry_after and str(retry_after).isdigit():
+            return float(retry_after)
+        # full jitter, so that concurrent callers do not retry in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def execute(self, request: Any, retries: Optional[int] = None, **kwargs) -> Any:
+        """
+        Execute a request, waiting for the rate limit of its API and retrying transient errors.
+
+        Parameters:
+            request (googleapiclient.http.HttpRequest): The request to execute.
+            retries (int): The number of retries, defaults to the executor retries.
+            kwargs (dict): Keyword arguments passed to the request execute.
+
+        Returns:
+            Any: The response of the request.
+        """
+        api = get_api(request)
+        bucket = self.bucket(api)
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            if bucket and bucket.acquire():
+                self.count(api, 'throttled')
+            self.count(api, 'requests')
+            try:
+                return request.execute(**kwargs)
+            except (HttpError, ConnectionError, TimeoutError) as err:
+                if attempt >= retries or not is_retryable(err):
+                    self.count(api, 'failures')
+                    raise
+                delay = self.delay(attempt, err)
+                attempt += 1
+                self.count(api, 'retries')
+                logging.warning(f'Retrying {getattr(request, "methodId", api)} in {delay:.1f}s '
+                                f'(attempt {attempt}/{retries}): {err}')
+                time.sleep(delay)
+
+    def execute_batch(self, service: Resource, requests: dict[str, Any],
+                      retries: Optional[int] = None) -> dict[str, tuple[Any, Optional[Exception]]]:
+        """
+        Execute requests as batch requests of up to the batch limit of their API. Items that fail with transient
+        errors are retried together in a new batch.
+
+        Parameters:
+            service (googleapiclient.discovery.Resource): The service the requests were built from.
+            requests (dict): The requests to execute, by an identifier unique within the requests.
+            retries (int): The number of retries, defaults to the executor retries.
+
+        Returns:
+            dict: The response and error of each request, by its identifier.
+        """
+        results = {}
+        pending = dict(requests)
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while pending:
+            api = get_api(next(iter(pending.values())))
+            bucket = self.bucket(api)
+            limit = BATCH_LIMITS.get(api, DEFAULT_BATCH_LIMIT)
+            keys = list(pending)
+
+            for start in range(0, len(keys), limit):
+                chunk = keys[start:start + limit]
+                # every item counts against the quota of the API
+                for _ in chunk:
+                    if bucket and bucket.acquire():
+                        self.count(api, 'throttled')
+                    self.count(api, 'requests')
+
+                def callback(request_id: str, response: Any, exception: Optional[Exception]) -> None:
+                    results[request_id] = (response, exception)
+
+                batch = service.new_batch_http_request(callback=callback)
+                for key in chunk:
+                    batch.add(pending[key], request_id=key)
+                self.count(api, 'batches')
+                try:
+                    batch.execute()
+                except (HttpError, ConnectionError, TimeoutError) as err:
+                    results.update({key: (None, err) for key in chunk})
+
+            failed = [key for key in keys if results[key][1] is not None]
+            retry = [key for key in failed if is_retryable(results[key][1])] if attempt < retries else []
+            for _ in range(len(failed) - len(retry)):
+                self.count(api, 'failures')
+            if not retry:
+                break
+
+            delay = max(self.delay(attempt, results[key][1]) for key in retry)
+            attempt += 1
+            for _ in retry:
+                self.count(api, 'retries')
+            logging.warning(f'Retrying {len(retry)} of {len(keys)} batched {api} requests in {delay:.1f}s '
+                            f'(attempt {attempt}/{retries})')
+            time.sleep(delay)
+            pending = {key: pending[key] for key in retry}
+
+        return results
+
+    def summary(self) -> str:
+        """Return the request counters of each API."""
+        with self.lock:
+            return ', '.join(f'{api}: {dict(counter)}' for api, counter in sorted(self.stats.items()))
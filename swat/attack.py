@@ -19,74 +19,265 @@
 
 """Manage ATT&CK data."""
 
+import codecs
 import gzip
 import json
 import logging
+import os
+import re
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass, field
 from functools import lru_cache
-from typing import Optional
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
 
-import requests
 from semver import Version
 
+from swat.transport import get_transport
 from swat.utils import ETC_DIR
 
 ATTACK_PATH = ETC_DIR / 'enterprise-attack.json.gz'
+ATTACK_INDEX_PATH = ETC_DIR / 'enterprise-attack-index.sqlite'
+ATTACK_VERSION_PATH = ETC_DIR / 'enterprise-attack.version.json'
+ATTACK_TAGS_URL = 'https://api.github.com/repos/mitre/cti/tags'
+ATTACK_DOWNLOAD_URL = 'https://raw.githubusercontent.com/mitre/cti/{release}/enterprise-attack/enterprise-attack.json'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# the objects array of a STIX bundle follows a few short top level fields
+BUNDLE_OBJECTS_PATTERN = re.compile(r'"objects"\s*:\s*\[')
+BUNDLE_PREFIX_LIMIT = 64 * 1024
 
 
-def download_attack_data(save: bool = True) -> (Optional[dict], Optional[bytes]):
-    """Refresh ATT&CK data from Mitre."""
+def get_version_from_tag(name: str, pattern: str = 'att&ck-v') -> str:
+    """Get the ATT&CK version from a release tag name."""
+    _, version = name.lower().split(pattern, 1)
+    return version
 
-    def get_version_from_tag(name, pattern='att&ck-v'):
-        _, version = name.lower().split(pattern, 1)
-        return version
 
-    current_version = load_attack_data()['version'] if ATTACK_PATH.exists() else None
+def load_attack_version() -> dict:
+    """Load the version, release and cache validators of the local ATT&CK data, or an empty dict if there is none."""
+    if not ATTACK_PATH.exists():
+        return {}
+    if ATTACK_VERSION_PATH.exists():
+        return json.loads(ATTACK_VERSION_PATH.read_text())
+    # data saved before the version file existed
+    return {'version': load_attack_index().version}
 
-    r = requests.get('https://api.github.com/repos/mitre/cti/tags')
+
+def save_attack_version(version_info: dict) -> None:
+    """Save the version, release and cache validators of the local ATT&CK data."""
+    ATTACK_VERSION_PATH.write_text(json.dumps(version_info, indent=2, sort_keys=True))
+
+
+def iter_bundle_objects(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Yield the objects of a STIX bundle as its bytes are streamed, holding one chunk and object at a time in memory.
+
+    Parameters:
+        chunks (Iterable[bytes]): The bundle, in chunks of any size.
+
+    Returns:
+        Iterator[dict]: The objects of the bundle, in order.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer, position, in_objects = '', 0, False
+    for chunk in chunks:
+        buffer = buffer[position:] + text.decode(chunk)
+        position = 0
+        if not in_objects:
+            match = BUNDLE_OBJECTS_PATTERN.search(buffer)
+            if not match:
+                if len(buffer) > BUNDLE_PREFIX_LIMIT:
+                    raise ValueError('ATT&CK bundle has no objects array')
+                continue
+            in_objects, position = True, match.end()
+
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # the object continues in the next chunk
+                break
+            yield item
+    raise ValueError('ATT&CK bundle ended before its objects array')
+
+
+def download_attack_data() -> Optional[str]:
+    """
+    Refresh ATT&CK data from Mitre, returning the new version or None if the local data is up to date.
+
+    The release tags are requested conditionally with the validator of the previous refresh, and the bundle of a newer
+    release is streamed through a gzip writer into a temporary file which then replaces the local data. The index is
+    built from the objects as they are streamed, so the bundle is never held in memory.
+    """
+    version_info = load_attack_version()
+    transport = get_transport()
+
+    headers = {'If-None-Match': version_info['tags_etag']} if version_info.get('tags_etag') else {}
+    r = transport.get(ATTACK_TAGS_URL, headers=headers)
+    if r.status_code == 304:
+        logging.info(f'ATT&CK version: {version_info["version"]} is up to date.')
+        return None
     r.raise_for_status()
+    tags_etag = r.headers.get('ETag')
     releases = [t for t in r.json() if t['name'].startswith('ATT&CK-v')]
     latest_release = max(releases, key=lambda release: Version.parse(get_version_from_tag(release['name']),
                          optional_minor_and_patch=True))
     release_name = latest_release['name']
     latest_version = Version.parse(get_version_from_tag(release_name), optional_minor_and_patch=True)
 
-    if current_version and current_version >= latest_version:
+    current_version = version_info.get('version')
+    if current_version and Version.parse(current_version, optional_minor_and_patch=True) >= latest_version:
+        save_attack_version({**version_info, 'tags_etag': tags_etag})
         logging.info(f'ATT&CK version: {current_version} is up to date.')
-        return None, None
+        return None
 
-    download = f'https://raw.githubusercontent.com/mitre/cti/{release_name}/enterprise-attack/enterprise-attack.json'
-    r = requests.get(download)
-    r.raise_for_status()
-    attack_data = r.json()
-    data = {'version': str(latest_version), 'data': attack_data}
-    compressed = gzip.compress(json.dumps(data, sort_keys=True).encode())
+    temp_path = ATTACK_PATH.with_suffix('.tmp')
+    try:
+        with transport.get(ATTACK_DOWNLOAD_URL.format(release=release_name), stream=True) as r:
+            r.raise_for_status()
+            # wrap the bundle as it is streamed, rather than parsing and serializing it again
+            with gzip.open(temp_path, 'wb') as file:
+                def write_chunks() -> Iterator[bytes]:
+                    for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        file.write(chunk)
+                        yield chunk
 
-    if save:
-        ATTACK_PATH.write_bytes(compressed)
-        logging.info(f'ATT&CK version: {latest_version} saved to: {ATTACK_PATH}')
+                file.write(b'{"data": ')
+                index = AttackIndex.from_objects(str(latest_version), iter_bundle_objects(write_chunks()))
+                file.write(f', "version": {json.dumps(str(latest_version))}}}'.encode())
+        os.replace(temp_path, ATTACK_PATH)
+    finally:
+        temp_path.unlink(missing_ok=True)
+    # saved after the bundle, so that the index is not older than it
+    index.save(ATTACK_INDEX_PATH)
+    save_attack_version({'version': str(latest_version), 'release': release_name, 'tags_etag': tags_etag})
 
-    return attack_data, compressed
+    load_attack_data.cache_clear()
+    load_attack_index.cache_clear()
+    logging.info(f'ATT&CK version: {latest_version} saved to: {ATTACK_PATH} and {ATTACK_INDEX_PATH}')
+    return str(latest_version)
 
 
 @lru_cache(maxsize=1)
 def load_attack_data() -> dict:
     """Load the ATT&CK data from local file."""
-    gzip_file_path = ETC_DIR / 'enterprise-attack.json.gz'
-    if not gzip_file_path.exists():
+    if not ATTACK_PATH.exists():
         download_attack_data()
-    with gzip.open(gzip_file_path, 'rb') as file:
+    with gzip.open(ATTACK_PATH, 'rb') as file:
         attack_data = json.load(file)
 
     return attack_data
 
 
-@lru_cache(maxsize=128)
+@dataclass
+class AttackIndex:
+    """Index of the techniques in an ATT&CK bundle, keeping the ID, name, first sentence of the description and tactics
+    of each technique."""
+
+    version: str
+    techniques: dict[str, dict] = field(default_factory=dict)
+    tactics: dict[str, list[str]] = field(default_factory=dict)
+    parents: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_bundle(cls, attack_data: dict) -> 'AttackIndex':
+        """Build the index from the version and STIX bundle of the ATT&CK data."""
+        return cls.from_objects(attack_data['version'], attack_data['data']['objects'])
+
+    @classmethod
+    def from_objects(cls, version: str, objects: Iterable[dict]) -> 'AttackIndex':
+        """Build the index from the objects of an ATT&CK bundle, in a single pass over the objects."""
+        index = cls(version=version)
+        for item in objects:
+            if item['type'] != 'attack-pattern':
+                continue
+            for ref in item.get('external_references', []):
+                if ref['source_name'] == 'mitre-attack':
+                    technique_id = ref['external_id']
+                    break
+            else:
+                continue
+            if technique_id in index.techniques:
+                # keep the first object with the ID, as the previous linear scan did
+                continue
+
+            tactics = [phase['phase_name'] for phase in item.get('kill_chain_phases', [])
+                       if phase['kill_chain_name'] == 'mitre-attack']
+            description = item.get('description', '').split('.')[0].strip()
+            index.add(technique_id, item.get('name'), description, tactics)
+        return index
+
+    @classmethod
+    def from_file(cls, path: Path = ATTACK_INDEX_PATH) -> 'AttackIndex':
+        """Load the index from its SQLite file."""
+        with closing(sqlite3.connect(f'file:{path}?mode=ro', uri=True)) as connection:
+            version, = connection.execute("SELECT value FROM metadata WHERE key = 'version'").fetchone()
+            index = cls(version=version)
+            for technique_id, name, description, tactics in connection.execute(
+                    'SELECT id, name, description, tactics FROM techniques ORDER BY rowid'):
+                index.add(technique_id, name, description, json.loads(tactics))
+        return index
+
+    def save(self, path: Path = ATTACK_INDEX_PATH) -> None:
+        """Save the index to a SQLite file, replacing any existing file at once."""
+        temp_path = path.with_suffix('.tmp')
+        temp_path.unlink(missing_ok=True)
+        with closing(sqlite3.connect(temp_path)) as connection:
+            connection.execute('CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)')
+            connection.execute('CREATE TABLE techniques (id TEXT PRIMARY KEY, name TEXT, description TEXT, tactics TEXT)')
+            connection.execute("INSERT INTO metadata VALUES ('version', ?)", (self.version,))
+            connection.executemany('INSERT INTO techniques VALUES (?, ?, ?, ?)', [
+                (t['id'], t['name'], t['description'], json.dumps(t['tactics'])) for t in self.techniques.values()
+            ])
+            connection.commit()
+        os.replace(temp_path, path)
+
+    def add(self, technique_id: str, name: str, description: str, tactics: list[str]) -> None:
+        """Add a technique to the index."""
+        self.techniques[technique_id] = {'id': technique_id, 'name': name, 'description': description,
+                                         'tactics': tactics}
+        for tactic in tactics:
+            self.tactics.setdefault(tactic, []).append(technique_id)
+        if '.' in technique_id:
+            self.parents[technique_id] = technique_id.split('.')[0]
+
+    def get(self, technique_id: str) -> Optional[dict]:
+        """Get a technique by ID."""
+        return self.techniques.get(technique_id)
+
+    def get_parent(self, technique_id: str) -> Optional[str]:
+        """Get the parent technique ID of a sub-technique."""
+        return self.parents.get(technique_id)
+
+    def get_tactic_techniques(self, tactic: str) -> list[str]:
+        """Get the IDs of the techniques of a tactic, by its short name such as "persistence"."""
+        return self.tactics.get(tactic, [])
+
+
+@lru_cache(maxsize=1)
+def load_attack_index() -> AttackIndex:
+    """Load the index of the local ATT&CK data, building it from the full bundle if it is missing or outdated."""
+    if not ATTACK_PATH.exists() and not ATTACK_INDEX_PATH.exists():
+        # the download saves the index built from the streamed bundle
+        download_attack_data()
+    if ATTACK_INDEX_PATH.exists() and (not ATTACK_PATH.exists() or
+                                       ATTACK_INDEX_PATH.stat().st_mtime >= ATTACK_PATH.stat().st_mtime):
+        return AttackIndex.from_file(ATTACK_INDEX_PATH)
+
+    index = AttackIndex.from_bundle(load_attack_data())
+    index.save(ATTACK_INDEX_PATH)
+    logging.info(f'ATT&CK index saved to: {ATTACK_INDEX_PATH}')
+    return index
+
+
 def lookup_technique_by_id(technique_id: str) -> Optional[dict]:
     """Look up a technique by ID in ATT&CK enterprise data."""
-    data = load_attack_data()['data']
-    for item in data['objects']:
-        if item['type'] == 'attack-pattern':
-            if 'external_references' in item:
-                for ref in item['external_references']:
-                    if ref['source_name'] == 'mitre-attack' and ref['external_id'] == technique_id:
-                        return item
+    return load_attack_index().get(technique_id)
@@ -0,0 +1,462 @@
+#
+# Licensed to Elasticsearch under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Local storage for audit log data."""
+
+import csv
+import dataclasses
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Literal, Optional
+
+from .utils import ETC_DIR
+
+AUDIT_DIR = ETC_DIR / 'audit'
+DEFAULT_AUDIT_STATE_FILE = AUDIT_DIR / 'state.json'
+CACHE_DIR = AUDIT_DIR / 'cache'
+# rows buffered before a cached range is written out as a file per day
+CACHE_BATCH_ROWS = 100_000
+TIME_COLUMN = '__time'
+
+
+@dataclass
+class HighWaterMark:
+    """Newest event seen for an application."""
+
+    time: str
+    unique_qualifiers: list[str] = field(default_factory=list)
+
+    def is_new(self, activity: dict) -> bool:
+        """Return a boolean indicating if the activity is newer than the mark."""
+        # the Reports API returns fixed width UTC RFC 3339 timestamps, so they compare correctly as strings
+        activity_time = activity['id']['time']
+        if activity_time != self.time:
+            return activity_time > self.time
+        return activity['id'].get('uniqueQualifier') not in self.unique_qualifiers
+
+    def update(self, activity: dict) -> None:
+        """Advance the mark to the activity if it is the newest seen."""
+        activity_time = activity['id']['time']
+        unique_qualifier = activity['id'].get('uniqueQualifier')
+        if activity_time > self.time:
+            self.time = activity_time
+            self.unique_qualifiers = [unique_qualifier]
+        elif activity_time == self.time and unique_qualifier not in self.unique_qualifiers:
+            self.unique_qualifiers.append(unique_qualifier)
+
+
+@dataclass
+class AuditState:
+    """
+    High-water marks of previously synced audit events, per application. The marks of several applications can be
+    updated from separate threads.
+    """
+
+    path: Path = field(default=DEFAULT_AUDIT_STATE_FILE)
+    marks: dict[str, HighWaterMark] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if not isinstance(self.path, Path):
+            self.path = Path(self.path)
+
+    @classmethod
+    def from_file(cls, file: Path = DEFAULT_AUDIT_STATE_FILE) -> 'AuditState':
+        """Load the state from file, or return an empty state if it does not exist."""
+        if not file.exists():
+            return cls(path=file)
+        marks = {k: HighWaterMark(**v) for k, v in json.loads(file.read_text()).items()}
+        logging.debug(f'Loaded audit state from: {file}')
+        return cls(path=file, marks=marks)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            marks = {k: dataclasses.asdict(v) for k, v in self.marks.items()}
+        self.path.write_text(json.dumps(marks, indent=2, sort_keys=True))
+        logging.debug(f'Saved audit state to {self.path}')
+
+    def get(self, application: str) -> Optional[HighWaterMark]:
+        """Get the high-water mark for an application."""
+        with self.lock:
+            return self.marks.get(application)
+
+    def update(self, application: str, activities: list[dict]) -> None:
+        """Advance the high-water mark for an application with newly fetched activities."""
+        with self.lock:
+            for activity in activities:
+                mark = self.marks.get(application)
+                if mark is None:
+                    self.marks[application] = HighWaterMark(activity['id']['time'],
+                                                            [activity['id'].get('uniqueQualifier')])
+                else:
+                    mark.update(activity)
+
+
+def get_event_store_path(application: str) -> Path:
+    """Return the path of the local event store for an application."""
+    return AUDIT_DIR / f'{application}.ndjson'
+
+
+def get_pending_events_path(application: str) -> Path:
+    """Return the path of the events staged for the local event store until their sync commits."""
+    return AUDIT_DIR / f'{application}.ndjson.pending'
+
+
+def stage_events(application: str, df) -> Path:
+    """Stage flattened events for the local event store of an application."""
+    path = get_pending_events_path(application)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_json(path, orient='records', lines=True, mode='a')
+    return path
+
+
+def discard_events(application: str) -> None:
+    """Discard the staged events of an application, left behind by a sync that did not commit."""
+    get_pending_events_path(application).unlink(missing_ok=True)
+
+
+def commit_events(application: str) -> Path:
+    """Append the staged events of an application to its local event store."""
+    pending, path = get_pending_events_path(application), get_event_store_path(application)
+    if pending.exists():
+        with pending.open('rb') as source, path.open('ab') as target:
+            shutil.copyfileobj(source, target)
+        pending.unlink()
+    return path
+
+
+def to_rfc3339(timestamp) -> str:
+    """Format a timestamp the way the Reports API does, in UTC with millisecond precision."""
+    return timestamp.tz_convert('UTC').strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+@dataclass
+class EventCache:
+    """Columnar cache of flattened audit events, partitioned by application and day in Parquet files."""
+
+    path: Path = field(default=CACHE_DIR)
+
+    def __post_init__(self):
+        if not isinstance(self.path, Path):
+            self.path = Path(self.path)
+
+    def _metadata_path(self, application: str) -> Path:
+        return self.path / application / 'metadata.json'
+
+    def load_metadata(self, application: str) -> dict:
+        """Load the covered time ranges and JSON encoded columns of an application."""
+        path = self._metadata_path(application)
+        if path.exists():
+            return json.loads(path.read_text())
+        return {'ranges': [], 'json_columns': []}
+
+    def save_metadata(self, application: str, metadata: dict) -> None:
+        path = self._metadata_path(application)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(metadata, indent=2, sort_keys=True))
+
+    def add_range(self, application: str, start, end) -> None:
+        """Record that every event between start and end has been cached, merging overlapping ranges."""
+        metadata = self.load_metadata(application)
+        ranges = sorted(metadata['ranges'] + [[to_rfc3339(start), to_rfc3339(end)]])
+        merged = [ranges[0]]
+        for range_start, range_end in ranges[1:]:
+            # ranges that touch within a millisecond are contiguous
+            if range_start <= self._next_millisecond(merged[-1][1]):
+                merged[-1][1] = max(merged[-1][1], range_end)
+            else:
+                merged.append([range_start, range_end])
+        metadata['ranges'] = merged
+        self.save_metadata(application, metadata)
+
+    @staticmethod
+    def _next_millisecond(value: str) -> str:
+        import pandas as pd
+        return to_rfc3339(pd.Timestamp(value) + pd.Timedelta(milliseconds=1))
+
+    def missing_ranges(self, application: str, start, end) -> list[tuple]:
+        """Return the (start, end) ranges between start and end that are not cached, oldest first."""
+        import pandas as pd
+
+        missing = []
+        cursor = start
+        for range_start, range_end in self.load_metadata(application)['ranges']:
+            range_start, range_end = pd.Timestamp(range_start), pd.Timestamp(range_end)
+            if range_end < cursor:
+                continue
+            if range_start > end:
+                break
+            if range_start > cursor:
+                missing.append((cursor, range_start - pd.Timedelta(milliseconds=1)))
+            cursor = max(cursor, range_end + pd.Timedelta(milliseconds=1))
+        if cursor <= end:
+            missing.append((cursor, end))
+        return missing
+
+    def write_range(self, application: str, frames: Iterable, start, end, batch_rows: int = CACHE_BATCH_ROWS) -> None:
+        """
+        Cache the events of a time range. The frames are buffered into files of up to batch_rows rows, staged outside
+        of the partitions and only moved into place, with the range recorded as cached, once every frame is written.
+        A range that fails leaves nothing behind, so that retrying it does not cache its events twice.
+
+        Parameters:
+            application (str): The application of the events.
+            frames (Iterable[pandas.DataFrame]): The flattened events of the range.
+            start (pandas.Timestamp): The start of the range.
+            end (pandas.Timestamp): The end of the range.
+            batch_rows (int): The number of rows buffered before they are written out.
+        """
+        import pandas as pd
+
+        staging_dir = self.path / '.staging' / f'{application}-{uuid.uuid4().hex}'
+        try:
+            buffered, rows = [], 0
+            for df in frames:
+                if df.empty:
+                    continue
+                buffered.append(df)
+                rows += len(df)
+                if rows >= batch_rows:
+                    self.write(application, pd.concat(buffered, ignore_index=True), staging_dir)
+                    buffered, rows = [], 0
+            if buffered:
+                self.write(application, pd.concat(buffered, ignore_index=True), staging_dir)
+
+            for file in staging_dir.rglob('*.parquet'):
+                partition_dir = self.path / application / file.parent.name
+                partition_dir.mkdir(parents=True, exist_ok=True)
+                os.replace(file, partition_dir / file.name)
+            self.add_range(application, start, end)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def write(self, application: str, df, directory: Optional[Path] = None) -> None:
+        """Write flattened events to the day partitions of an application, or of a staging directory."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if df.empty:
+            return
+
+        metadata = self.load_metadata(application)
+        json_columns = set(metadata['json_columns'])
+        df = df.copy()
+        for column in df.columns:
+            values = df[column]
+            if column in json_columns or values.map(lambda v: isinstance(v, (dict, list))).any():
+                json_columns.add(column)
+                # merged pages fill the columns missing from some of them with NaN
+                df[column] = values.map(lambda v: None if v is None or v != v else json.dumps(v, sort_keys=True))
+            else:
+                df[column] = values.map(lambda v: None if v is None or v != v else str(v))
+
+        times = df['id'].map(lambda v: json.loads(v)['time'])
+        df[TIME_COLUMN] = times
+        for day, partition in df.groupby(times.str[:10], sort=False):
+            partition_dir = (directory or self.path / application) / f'day={day}'
+            partition_dir.mkdir(parents=True, exist_ok=True)
+            table = pa.Table.from_pandas(partition, preserve_index=False)
+            # name files by their newest event so that they can be read back newest first
+            newest = partition[TIME_COLUMN].max().replace(':', '').replace('.', '')
+            pq.write_table(table, partition_dir / f'part-{newest}-{uuid.uuid4().hex}.parquet')
+
+        if json_columns != set(metadata['json_columns']):
+            metadata['json_columns'] = sorted(json_columns)
+            self.save_metadata(application, metadata)
+
+    def iter_frames(self, application: str, start, end, filters: Optional[dict] = None,
+                    column_selector: Optional[Callable[[list[str]], list[str]]] = None) -> Iterator:
+        """
+        Yield cached events between start and end as DataFrames, one record batch at a time.
+
+        Day partitions outside of the range are pruned, equality filters are pushed down to the Parquet scan and only
+        the columns returned by the column selector are read.
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        app_dir = self.path / application
+        if not app_dir.exists():
+            return
+
+        files = sorted((str(f) for f in app_dir.rglob('*.parquet')), key=lambda f: Path(f).name, reverse=True)
+        if not files:
+            return
+        partitioning = ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+        dataset = ds.dataset(files, format='parquet', partitioning=partitioning, partition_base_dir=str(app_dir))
+        schema = pa.unify_schemas([f.physical_schema for f in dataset.get_fragments()])
+        dataset = ds.dataset(files, schema=schema.append(pa.field('day', pa.string())), format='parquet',
+                             partitioning=partitioning, partition_base_dir=str(app_dir))
+
+        start, end = to_rfc3339(start), to_rfc3339(end)
+        expression = ((ds.field('day') >= start[:10]) & (ds.field('day') <= end[:10]) &
+                      (ds.field(TIME_COLUMN) >= start) & (ds.field(TIME_COLUMN) <= end))
+        for column, value in (filters or {}).items():
+            if column not in schema.names:
+                return
+            expression &= ds.field(column) == value
+
+        names = [n for n in schema.names if n != TIME_COLUMN]
+        columns = column_selector(names) if column_selector else names
+        json_columns = set(self.load_metadata(application)['json_columns'])
+
+        for batch in dataset.to_batches(columns=columns, filter=expression):
+            if not batch.num_rows:
+                continue
+            df = batch.to_pandas()
+            for column in json_columns.intersection(df.columns):
+                df[column] = df[column].map(lambda v: None if v is None or v != v else json.loads(v))
+            yield df
+
+
+@dataclass
+class ExportWriter:
+    """
+    Incremental CSV or NDJSON export of flattened events, with optional compression and size based rotation.
+
+    Rows are serialized and written a chunk at a time, so an export only holds one chunk in memory. CSV exports keep
+    the columns of the first chunk and add columns first seen in later chunks at the end, so that each row lines up
+    with its header. When max_bytes is set, a new numbered file is started once the uncompressed size of the current
+    file, in bytes, would exceed it, or when new columns are seen. Otherwise the file is rewritten with the new header
+    when it is closed.
+    """
+
+    path: Path
+    export_format: Literal['csv', 'ndjson'] = 'csv'
+    compression: Optional[Literal['gzip', 'zstd']] = None
+    max_bytes: Optional[int] = None
+    chunk_size: int = 10000
+    encoding: str = 'utf-8'
+    paths: list[Path] = field(default_factory=list, init=False)
+    rows: int = field(default=0, init=False)
+
+    def __post_init__(self):
+        if not isinstance(self.path, Path):
+            self.path = Path(self.path)
+        if self.export_format not in ('csv', 'ndjson'):
+            raise ValueError(f'Unsupported export format: {self.export_format}')
+        if self.compression not in (None, 'gzip', 'zstd'):
+            raise ValueError(f'Unsupported export compression: {self.compression}')
+        self._file = None
+        self._written = 0
+        self._columns = None
+        # files with rows written after new columns were seen, which need their header rewritten
+        self._stale: set[Path] = set()
+
+    def __enter__(self) -> 'ExportWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _next_path(self) -> Path:
+        suffix = {'gzip': '.gz', 'zstd': '.zst', None: ''}[self.compression]
+        if self.max_bytes:
+            name = f'{self.path.stem}-{len(self.paths) + 1:04d}{self.path.suffix}{suffix}'
+        else:
+            name = f'{self.path.name}{suffix}'
+        return self.path.with_name(name)
+
+    def _open_text(self, path: Path, mode: Literal['r', 'w']):
+        if self.compression == 'gzip':
+            return gzip.open(path, f'{mode}t', encoding=self.encoding, newline='')
+        elif self.compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError('zstandard is not installed. Please install it with "poetry install -E audit_support".')
+            return zstandard.open(path, f'{mode}t', encoding=self.encoding, newline='')
+        return path.open(mode, encoding=self.encoding, newline='')
+
+    def _open(self) -> None:
+        path = self._next_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self._open_text(path, 'w')
+        self._written = 0
+        self.paths.append(path)
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rewrite_header(self, path: Path) -> None:
+        """Rewrite a CSV file with the header of every column, padding the rows written before new columns."""
+        tmp_path = path.with_name(f'{path.name}.tmp')
+        try:
+            with self._open_text(path, 'r') as source, self._open_text(tmp_path, 'w') as target:
+                reader, writer = csv.reader(source), csv.writer(target, lineterminator='\n')
+                next(reader, None)
+                writer.writerow(self._columns)
+                for row in reader:
+                    writer.writerow(row + [''] * (len(self._columns) - len(row)))
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def _serialize(self, df, header: bool) -> str:
+        if self.export_format == 'csv':
+            return df.to_csv(index=False, header=header)
+        data = df.to_json(orient='records', lines=True)
+        return data if data.endswith('\n') else data + '\n'
+
+    def write(self, df) -> None:
+        """Write the rows of a DataFrame, a chunk at a time."""
+        if self.export_format == 'csv':
+            if self._columns is None:
+                self._columns = list(df.columns)
+            added = [column for column in df.columns if column not in self._columns]
+            if added:
+                self._columns += added
+                if self.max_bytes:
+                    # the next file starts with a header of every column
+                    self._close_file()
+                elif self._file is not None:
+                    self._stale.add(self.paths[-1])
+            df = df.reindex(columns=self._columns)
+
+        for start in range(0, len(df), self.chunk_size):
+            chunk = df.iloc[start:start + self.chunk_size]
+            data = self._serialize(chunk, header=False)
+            # the size limit is in bytes, which differs from the length of the text once it has non-ASCII characters
+            size = len(data.encode(self.encoding))
+            if self._file is None or (self.max_bytes and self._written and self._written + size > self.max_bytes):
+                self._close_file()
+                self._open()
+                if self.export_format == 'csv':
+                    header = self._serialize(chunk.iloc[0:0], header=True)
+                    self._file.write(header)
+                    self._written += len(header.encode(self.encoding))
+            self._file.write(data)
+            self._written += size
+            self.rows += len(chunk)
+
+    def close(self) -> None:
+        self._close_file()
+        for path in sorted(self._stale):
+            self._rewrite_header(path)
+        self._stale.clear()
@@ -20,22 +20,38 @@
 """Base classes for SWAT object."""
 
 import dataclasses
+import datetime
 import logging
 import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import closing
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Literal, Union
+from typing import Iterator, Optional, Literal, Sequence, Union
 
 import json
+from google.auth.exceptions import GoogleAuthError
 from google.auth.transport.requests import Request
+from google.oauth2 import service_account
 from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import Resource, build_from_document
 
+from .api import RequestExecutor, load_discovery_document
+from .transport import Transport, get_transport, set_transport
 from .utils import ROOT_DIR, PathlibEncoder
 
 
-DEFAULT_CRED_STORE_FILE = ROOT_DIR / 'swat' / 'etc' / '.cred_store.pkl'
+DEFAULT_CRED_STORE_FILE = ROOT_DIR / 'swat' / 'etc' / '.cred_store.sqlite'
+LEGACY_CRED_STORE_FILE = ROOT_DIR / 'swat' / 'etc' / '.cred_store.pkl'
 DEFAULT_EMULATION_ARTIFACTS_DIR = ROOT_DIR / 'swat' / 'etc' / 'artifacts'
 
+# serializes token refreshes, so the refresher and a consumer never refresh the same session twice
+REFRESH_LOCK = threading.Lock()
+
 
 @dataclass
 class BaseCreds:
@@ -100,43 +116,176 @@ class Cred:
         if self.creds and hasattr(self.creds, 'client_id'):
             return self.creds.client_id
 
-    def refreshed_session(self) -> Optional[Credentials]:
-        if self.session and self.session.expired and self.session.refresh_token:
-            self.session.refresh(Request())
+    def needs_refresh(self, margin: float = 0) -> bool:
+        """Return a boolean indicating if the session has no valid token or it expires within margin seconds."""
+        session = self.session
+        # service account sessions can always be refreshed, OAuth sessions only with a refresh token
+        if not session or not getattr(session, 'refresh_token', True):
+            return False
+        if not session.valid:
+            return True
+        # google-auth expiries are naive UTC datetimes
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return session.expiry is not None and session.expiry - datetime.timedelta(seconds=margin) <= now
+
+    def refreshed_session(self, request: Optional[Request] = None, margin: float = 0) -> Optional[Credentials]:
+        """Return the session, refreshing its token if it has none or it expires within margin seconds."""
+        if self.needs_refresh(margin):
+            with REFRESH_LOCK:
+                if self.needs_refresh(margin):
+                    self.session.refresh(request or Request(get_transport().session))
         return self.session
 
     def to_dict(self):
         return {k: v for k, v in dataclasses.asdict(self).items() if not k.startswith('_')}
 
 
+class CredRecords(MutableMapping):
+    """
+    Creds of a store by key, backed by a SQLite file with a record per key.
+
+    Only the keys, client IDs and whether each cred has a session are read when the store is opened. A cred is
+    unpickled the first time its key is used, and saving writes the creds used since the store was opened in a single
+    transaction.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.loaded: dict[str, Cred] = {}
+        self.deleted: set[str] = set()
+        # key: (client_id, has_session)
+        self.index: dict[str, tuple[Optional[str], bool]] = {}
+        self.client_ids: dict[str, str] = {}
+        self.lock = threading.RLock()
+
+        if path.exists():
+            with closing(sqlite3.connect(path)) as connection:
+                rows = connection.execute('SELECT key, client_id, has_session FROM creds').fetchall()
+            for key, client_id, has_session in rows:
+                self.index[key] = (client_id, bool(has_session))
+                if client_id:
+                    self.client_ids.setdefault(client_id, key)
+
+    def __getitem__(self, key: str) -> Cred:
+        with self.lock:
+            if key in self.loaded:
+                return self.loaded[key]
+            if key not in self.index:
+                raise KeyError(key)
+            with closing(sqlite3.connect(self.path)) as connection:
+                record, = connection.execute('SELECT record FROM creds WHERE key = ?', (key,)).fetchone()
+            cred = self.loaded[key] = pickle.loads(record)
+            return cred
+
+    def __setitem__(self, key: str, cred: Cred) -> None:
+        with self.lock:
+            if key in self.index:
+                self._unindex(key)
+            self.loaded[key] = cred
+            self.deleted.discard(key)
+            self.index[key] = (cred.client_id, cred.session is not None)
+            if cred.client_id:
+                self.client_ids.setdefault(cred.client_id, key)
+
+    def __delitem__(self, key: str) -> None:
+        with self.lock:
+            if key not in self.index:
+                raise KeyError(key)
+            self._unindex(key)
+            self.loaded.pop(key, None)
+            self.deleted.add(key)
+
+    def _unindex(self, key: str) -> None:
+        client_id, _ = self.index.pop(key)
+        if self.client_ids.get(client_id) == key:
+            del self.client_ids[client_id]
+            # another key may share the client ID, e.g. a session stored under a second key
+            other = next((k for k, (c, _) in self.index.items() if c == client_id), None)
+            if other:
+                self.client_ids[client_id] = other
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.index))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _has_session(self, key: str) -> bool:
+        # a loaded cred may have been given a session in place since it was indexed
+        cred = self.loaded.get(key)
+        return cred.session is not None if cred else self.index[key][1]
+
+    @property
+    def has_sessions(self) -> bool:
+        """Return a boolean indicating if any cred has a session, without loading the creds."""
+        with self.lock:
+            return any(self._has_session(key) for key in self.index)
+
+    def session_keys(self) -> list[str]:
+        """Return the keys of the creds with a session."""
+        with self.lock:
+            return [key for key in self.index if self._has_session(key)]
+
+    def save(self) -> None:
+        """Write the creds used since the store was opened and remove the deleted ones, in one transaction."""
+        with self.lock:
+            if not self.path.exists():
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self.path.touch(mode=0o600)
+            with closing(sqlite3.connect(self.path)) as connection, connection:
+                connection.execute('CREATE TABLE IF NOT EXISTS creds '
+                                   '(key TEXT PRIMARY KEY, client_id TEXT, has_session INTEGER, record BLOB)')
+                connection.executemany('DELETE FROM creds WHERE key = ?', [(key,) for key in self.deleted])
+                connection.executemany('INSERT OR REPLACE INTO creds VALUES (?, ?, ?, ?)', [
+                    (key, cred.client_id, cred.session is not None, pickle.dumps(cred))
+                    for key, cred in self.loaded.items()
+                ])
+            self.deleted.clear()
+            for key, cred in self.loaded.items():
+                self.index[key] = (self.index[key][0], cred.session is not None)
+
+
 @dataclass
 class CredStore:
     """Credentials store object."""
 
     path: Path = field(default=DEFAULT_CRED_STORE_FILE)
-    store: dict[str, Cred] = field(default_factory=dict)
+    store: CredRecords = field(default=None)
 
     def __post_init__(self):
         if not isinstance(self.path, Path):
             self.path = Path(self.path)
+        if not isinstance(self.store, CredRecords):
+            records = self.store or {}
+            self.store = CredRecords(self.path)
+            self.store.update(records)
 
     @property
     def has_sessions(self) -> bool:
         """Return a boolean indicating if the creds have sessions."""
-        for key, cred in self.store.items():
-            if cred.session:
-                return True
-        return False
+        return self.store.has_sessions
 
     @classmethod
-    def from_file(cls, file: Path = DEFAULT_CRED_STORE_FILE) -> Optional['CredStore']:
+    def from_file(cls, file: Path = DEFAULT_CRED_STORE_FILE,
+                  legacy_file: Path = LEGACY_CRED_STORE_FILE) -> Optional['CredStore']:
+        """Open the store at a path, migrating a pickled store from older versions if there is none."""
+        if not file.exists() and legacy_file.exists():
+            legacy = pickle.loads(legacy_file.read_bytes())
+            cred_store = cls(path=file, store=dict(legacy.store))
+            cred_store.save()
+            legacy_file.rename(legacy_file.with_suffix('.pkl.migrated'))
+            logging.info(f'Migrated cred store dump {legacy_file} to: {file}')
+            return cred_store
         if file.exists():
-            logging.info(f'Loaded cred store dump from: {file}')
-            return pickle.loads(file.read_bytes())
+            logging.info(f'Loaded cred store index from: {file}')
+            return cls(path=file)
 
     def save(self):
         logging.info(f'Saved cred store to {self.path}')
-        self.path.write_bytes(pickle.dumps(self))
+        self.store.save()
 
     def add(self, key: str, creds: Optional[CRED_TYPES] = None, session: Optional[Credentials] = None,
             override: bool = False, type: Optional[Literal['oauth', 'service']] = None):
@@ -150,7 +299,10 @@ class CredStore:
 
     def remove(self, key: str) -> bool:
         """Remove cred by key and type."""
-        return self.store.pop(key, None) is not None
+        if key not in self.store:
+            return False
+        del self.store[key]
+        return True
 
     def get(self, key: str, validate_type: Optional[Literal['oauth', 'service']] = None,
             missing_error: bool = True) -> Optional[Cred]:
@@ -169,12 +321,19 @@ class CredStore:
             raise ValueError(f'Value not found for: {key} in the cred store')
         return value
 
+    def session(self, key: str = 'default') -> Optional[Credentials]:
+        """
+        Return the session of a key. Every command and emulation gets sessions through here, so that tokens the
+        refresher has not renewed yet are refreshed before use.
+        """
+        return self.get(key, missing_error=False).refreshed_session()
+
     def get_by_client_id(self, client_id: str, validate_type: Optional[Literal['oauth', 'service']] = None,
             missing_error: bool = True) -> Optional[CRED_TYPES]:
         """Get cred by client_id."""
-        for key, value in self.store.items():
-            if value.client_id == client_id:
-                return self.get(key, validate_type, missing_error)
+        key = self.store.client_ids.get(client_id)
+        if key is not None:
+            return self.get(key, validate_type, missing_error)
 
     def list_credentials(self) -> list[str]:
         """Get the list of creds from the store."""
@@ -192,9 +351,208 @@ class CredStore:
         return sessions
 
 
+@dataclass
+class TokenRefresher:
+    """Renews the tokens of the sessions in a cred store shortly before they expire, in a background thread."""
+
+    cred_store: CredStore
+    request: Request
+    margin: float = 300
+    interval: float = 60
+    wakeup: threading.Event = field(init=False, default_factory=threading.Event, repr=False)
+    stopped: threading.Event = field(init=False, default_factory=threading.Event, repr=False)
+    thread: Optional[threading.Thread] = field(init=False, default=None, repr=False)
+
+    @classmethod
+    def from_config(cls, cred_store: CredStore, transport: Transport, config: dict) -> Optional['TokenRefresher']:
+        """Build the refresher from the "token_refresh" settings of the SWAT config, or None if it is disabled."""
+        settings = config.get('settings', {}).get('token_refresh') or {}
+        if not settings.get('enabled'):
+            return None
+        return cls(cred_store, Request(transport.session),
+                   **{k: v for k, v in settings.items() if k in ('margin', 'interval')})
+
+    def refresh(self) -> int:
+        """
+        Refresh the sessions without a valid token or expiring within the margin, returning the number refreshed.
+        Every stored session is checked, loading those not used yet in this thread rather than on their first use.
+        """
+        refreshed = 0
+        for key in self.cred_store.store.session_keys():
+            cred = self.cred_store.store.get(key)
+            if not cred or not cred.needs_refresh(self.margin):
+                continue
+            try:
+                cred.refreshed_session(self.request, self.margin)
+                refreshed += 1
+            except GoogleAuthError as e:
+                logging.warning(f'Unable to refresh session {key}: {e}')
+        if refreshed:
+            logging.debug(f'Refreshed {refreshed} sessions')
+        return refreshed
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                # keep the thread alive, the next pass may succeed
+                logging.error(f'Error refreshing sessions: {e}')
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, name='token-refresher', daemon=True)
+        self.thread.start()
+
+    def wake(self) -> None:
+        """Check the sessions now, e.g. after one was added."""
+        self.wakeup.set()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join()
+
+
+@dataclass
+class DelegatedSession:
+    """A domain-wide delegated session of a pool, with the time it was created."""
+
+    session: service_account.Credentials
+    created: float
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+@dataclass
+class DelegatedCredentialPool:
+    """
+    Domain-wide delegated sessions of the service accounts in a cred store, acting as other users of the domain.
+
+    Sessions are cached per service account key, subject and scopes, and evicted once they are older than the TTL or
+    the pool is full, oldest first. The token of each session is fetched once and shared by every worker using it.
+    """
+
+    cred_store: CredStore
+    request: Request
+    ttl: float = 3000
+    max_size: int = 1000
+    sessions: OrderedDict[tuple, DelegatedSession] = field(init=False, default_factory=OrderedDict, repr=False)
+    lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False)
+
+    @classmethod
+    def from_config(cls, cred_store: CredStore, transport: Transport, config: dict) -> 'DelegatedCredentialPool':
+        """Build the pool from the "delegation" settings of the SWAT config."""
+        settings = config.get('settings', {}).get('delegation') or {}
+        return cls(cred_store, Request(transport.session),
+                   **{k: v for k, v in settings.items() if k in ('ttl', 'max_size')})
+
+    def delegate(self, key: str, subject: str, scopes: Optional[tuple[str, ...]]) -> service_account.Credentials:
+        """Return a new session of the service account stored under a key, acting as the subject."""
+        cred = self.cred_store.get(key, missing_error=False)
+        if isinstance(cred.session, service_account.Credentials):
+            session = cred.session
+        elif isinstance(cred.creds, ServiceAccountCreds):
+            session = service_account.Credentials.from_service_account_info(cred.creds.to_dict())
+        else:
+            raise ValueError(f'Value for {key} is not a service account, required for domain-wide delegation')
+
+        session = session.with_subject(subject)
+        if scopes:
+            session = session.with_scopes(list(scopes))
+        elif not session.scopes:
+            raise ValueError(f'No scopes for delegated session of {key} as {subject}')
+        return session
+
+    def evict(self, now: float) -> None:
+        """Remove the sessions older than the TTL and, if the pool is full, the oldest ones."""
+        while self.sessions:
+            entry = next(iter(self.sessions.values()))
+            if now - entry.created < self.ttl and len(self.sessions) < self.max_size:
+                break
+            self.sessions.popitem(last=False)
+
+    def get(self, subject: str, scopes: Optional[Sequence[str]] = None,
+            key: str = 'default') -> service_account.Credentials:
+        """
+        Return a session acting as a user of the domain, with a valid token.
+
+        Parameters:
+            subject (str): The email of the user to act as.
+            scopes (Sequence[str]): The scopes of the session, defaults to the scopes of the service account session.
+            key (str): The key of the service account in the cred store.
+
+        Returns:
+            google.oauth2.service_account.Credentials: The delegated session.
+        """
+        scopes = tuple(sorted(set(scopes))) if scopes else None
+        pool_key = (key, subject, scopes)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.sessions.get(pool_key)
+            if entry is None or now - entry.created >= self.ttl:
+                self.sessions.pop(pool_key, None)
+                self.evict(now)
+                entry = self.sessions[pool_key] = DelegatedSession(self.delegate(key, subject, scopes), now)
+
+        # tokens are fetched outside of the pool lock, so workers acting as other users are not blocked
+        with entry.lock:
+            if not entry.session.valid:
+                entry.session.refresh(self.request)
+        return entry.session
+
+
 @dataclass
 class SWAT:
     """Base object for SWAT."""
 
     config: dict
     cred_store: CredStore = field(default_factory=lambda: CredStore.from_file() or CredStore())
+    executor: RequestExecutor = field(init=False)
+    transport: Transport = field(init=False)
+    services: dict[tuple, tuple] = field(init=False, default_factory=dict, repr=False)
+    services_lock: threading.Lock = field(init=False, default_factory=threading.Lock, repr=False)
+    refresher: Optional[TokenRefresher] = field(init=False, default=None, repr=False)
+    delegated: DelegatedCredentialPool = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.executor = RequestExecutor.from_config(self.config)
+        self.transport = Transport.from_config(self.config)
+        set_transport(self.transport)
+        self.delegated = DelegatedCredentialPool.from_config(self.cred_store, self.transport, self.config)
+        # started by the long-lived shell, one-off runs refresh tokens inline when they expire
+        self.refresher = TokenRefresher.from_config(self.cred_store, self.transport, self.config)
+
+    def build_service(self, api: str, version: str, session_key: str = 'default', memoize: bool = True,
+                      subject: Optional[str] = None, scopes: Optional[Sequence[str]] = None) -> Resource:
+        """
+        Build a Google API service for a session from a cached discovery document.
+
+        Services are memoized per API, version and session key for the lifetime of the object, and rebuilt if the
+        session changes. Every service sends its requests through the shared connection pool. With a subject, the
+        service acts as that user with a domain-wide delegated session of the service account stored under the key.
+        Delegated services are not memoized, so that the delegated pool alone bounds the sessions kept.
+        """
+        if subject:
+            return self._build_service(api, version, self.delegated.get(subject, scopes, session_key))
+
+        session = self.cred_store.session(session_key)
+        if not memoize:
+            return self._build_service(api, version, session)
+        key = (api, version, session_key)
+
+        # steps run concurrently by a campaign share the services rather than building their own
+        with self.services_lock:
+            cached = self.services.get(key)
+            if cached and cached[0] is session:
+                return cached[1]
+            service = self._build_service(api, version, session)
+            self.services[key] = (session, service)
+        return service
+
+    def _build_service(self, api: str, version: str, session: Optional[Credentials]) -> Resource:
+        document = load_discovery_document(api, version)
+        if session is None:
+            return build_from_document(document)
+        return build_from_document(document, http=self.transport.authorized_http(session))
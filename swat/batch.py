@@ -0,0 +1,185 @@
+#
+# Licensed to Elasticsearch under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Run commands from a script without the interactive shell."""
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional, Type
+
+from .base import SWAT
+from .commands.base_command import BaseCommand
+
+# commands changing the credentials, sessions or scopes used by the commands after them
+STATEFUL_COMMANDS = ('auth', 'creds', 'scopes')
+
+
+@dataclass
+class BatchCommand:
+    """A command line of a batch."""
+
+    line: int
+    name: str
+    args: list[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        """Return the command line."""
+        return ' '.join([self.name, *self.args])
+
+
+@dataclass
+class BatchResult:
+    """Outcome of a command line of a batch."""
+
+    line: int
+    command: str
+    status: str
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def parse_batch(text: str) -> list[BatchCommand]:
+    """
+    Parse a batch of commands, either a JSON list of command lines or a script with a command per line.
+
+    Parameters:
+        text (str): The batch. JSON entries are command line strings or lists of arguments. Script lines are split as
+            the shell splits them, skipping empty lines and comments starting with "#".
+
+    Returns:
+        list[BatchCommand]: The commands.
+    """
+    if text.lstrip().startswith('['):
+        entries = [(n, e if isinstance(e, list) else e.split()) for n, e in enumerate(json.loads(text), 1)]
+    else:
+        entries = [(n, line.split()) for n, line in enumerate(text.splitlines(), 1)
+                   if line.strip() and not line.lstrip().startswith('#')]
+    return [BatchCommand(line=n, name=str(tokens[0]), args=[str(t) for t in tokens[1:]]) for n, tokens in entries
+            if tokens]
+
+
+class ErrorRecorder(logging.Handler):
+    """Records the errors logged by each thread, so that commands that log an error and return are reported."""
+
+    def __init__(self) -> None:
+        super().__init__(logging.ERROR)
+        self.errors: defaultdict[int, list[str]] = defaultdict(list)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.errors[record.thread].append(record.getMessage())
+
+    def pop(self) -> list[str]:
+        """Return and clear the errors logged by the current thread."""
+        return self.errors.pop(threading.get_ident(), [])
+
+
+@dataclass
+class BatchRunner:
+    """Runs batches of commands against a SWAT object, resolving each command class once."""
+
+    obj: SWAT
+    load_command: Callable[[str], Optional[Type[BaseCommand]]]
+    workers: int = 1
+    classes: dict[str, Optional[Type[BaseCommand]]] = field(init=False, default_factory=dict)
+    recorder: ErrorRecorder = field(init=False, default_factory=ErrorRecorder, repr=False)
+
+    def resolve(self, name: str) -> Optional[Type[BaseCommand]]:
+        """Return the class of a command, importing its module only the first time."""
+        if name not in self.classes:
+            self.classes[name] = self.load_command(name)
+        return self.classes[name]
+
+    def run_command(self, command: BatchCommand) -> BatchResult:
+        """
+        Run a command, returning its status and duration. A command fails if it raises, returns False or logs an
+        error from the thread it runs in.
+        """
+        command_class = self.resolve(command.name)
+        if not command_class or not issubclass(command_class, BaseCommand):
+            return BatchResult(command.line, command.text, 'unknown', error=f'Unknown command: {command.name}')
+
+        self.recorder.pop()
+        start = time.perf_counter()
+        try:
+            result = command_class(command=command.name, args=command.args, obj=self.obj).execute()
+        except Exception as e:
+            logging.error(f'Error: {e}')
+            self.recorder.pop()
+            return BatchResult(command.line, command.text, 'failed', time.perf_counter() - start, str(e))
+
+        seconds = time.perf_counter() - start
+        errors = self.recorder.pop()
+        if errors:
+            return BatchResult(command.line, command.text, 'failed', seconds, '; '.join(errors))
+        if result is False:
+            return BatchResult(command.line, command.text, 'failed', seconds, 'Command did not succeed')
+        return BatchResult(command.line, command.text, 'succeeded', seconds)
+
+    def stages(self, commands: list[BatchCommand]) -> list[list[BatchCommand]]:
+        """Group the commands into stages that can run concurrently, with stateful commands run on their own."""
+        stages = [[]]
+        for command in commands:
+            if command.name in STATEFUL_COMMANDS:
+                stages.extend([[command], []])
+            else:
+                stages[-1].append(command)
+        return [stage for stage in stages if stage]
+
+    def run(self, commands: list[BatchCommand]) -> list[BatchResult]:
+        """
+        Run the commands in order, or with workers, run the commands between stateful commands concurrently.
+
+        Parameters:
+            commands (list[BatchCommand]): The commands to run.
+
+        Returns:
+            list[BatchResult]: The result of each command, in the order of the commands.
+        """
+        # resolve every command up front, so that imports are not raced by the workers
+        for command in commands:
+            self.resolve(command.name)
+
+        root = logging.getLogger()
+        root.addHandler(self.recorder)
+        try:
+            if self.workers <= 1:
+                return [self.run_command(command) for command in commands]
+
+            results = []
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for stage in self.stages(commands):
+                    results.extend(pool.map(self.run_command, stage))
+            return results
+        finally:
+            root.removeHandler(self.recorder)
+
+    def report(self, results: list[BatchResult], seconds: float) -> dict:
+        """Return the machine readable report of a batch."""
+        return {
+            'status': 'succeeded' if all(r.status == 'succeeded' for r in results) else 'failed',
+            'seconds': seconds,
+            'commands': [asdict(result) for result in results],
+            'api_requests': {api: dict(counter) for api, counter in self.obj.executor.stats.items()},
+        }
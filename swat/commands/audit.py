@@ -19,21 +19,65 @@
 
 """Manage remote audit logs."""
 
+from __future__ import annotations
+
 import argparse
+import copy
+import heapq
+import queue
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, Optional, Sequence, Union
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter, methodcaller
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Sequence, Union
 
-import pandas as pd
 from colorama import Fore
 import googleapiclient
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from ..audit_store import AuditState, EventCache, ExportWriter, commit_events, discard_events, stage_events
 from ..commands.base_command import BaseCommand
 from ..misc import get_custom_argparse_formatter, validate_args
 from ..utils import ROOT_DIR
 
+if TYPE_CHECKING:
+    # pandas is an optional dependency, imported when the command runs
+    import pandas as pd
+
+# Reports API applications fetched when the application is "all"
+APPLICATIONS = (
+    'access_transparency', 'admin', 'calendar', 'chat', 'chrome', 'context_aware_access', 'data_studio', 'drive',
+    'gcp', 'groups', 'groups_enterprise', 'jamboard', 'keep', 'login', 'meet', 'mobile', 'rules', 'saml', 'token',
+    'user_accounts', 'vault',
+)
+# filter keys that map onto Reports API activities.list query parameters
+QUERY_FILTERS = {
+    'actorIpAddress': 'actorIpAddress',
+    'ipAddress': 'actorIpAddress',
+    'eventName': 'eventName',
+    'name': 'eventName',
+    'userKey': 'userKey',
+    'email': 'userKey',
+    'orgUnitID': 'orgUnitID',
+}
+# columns that query parameter filters match when they are applied locally, nested fields are dotted
+LOCAL_FILTERS = {
+    'actorIpAddress': 'ipAddress',
+    'eventName': 'name',
+    'userKey': 'actor.email',
+    'email': 'actor.email',
+}
+# the Reports API publishes most late events within this lag, newer events are not cached
+DEFAULT_SETTLE_LAG = '1h'
+# flattened activity and event fields, any other filter key is an event parameter
+ACTIVITY_FIELDS = ('kind', 'id', 'etag', 'actor', 'ipAddress', 'ownerDomain', 'type', 'name')
+SCALAR_TYPES = frozenset((str, int, float, bool, type(None)))
+GET_TIME = methodcaller('get', 'time')
+
 
 class KeyValueAction(argparse.Action):
     def __call__(self,
@@ -56,11 +100,175 @@ class KeyValueAction(argparse.Action):
         Returns:
         None
         """
+        filters = dict(getattr(namespace, self.dest, None) or {})
         for value in values:
             key, sep, val = value.partition('=')
             if sep != '=':
                 raise argparse.ArgumentError(self, f'invalid filter argument "{value}", expected "key=value"')
-            setattr(namespace, self.dest, {key: val})
+            filters[key] = val.strip('\'"')
+        setattr(namespace, self.dest, filters)
+
+
+def split_time_range(start: pd.Timestamp, end: pd.Timestamp, slices: int) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Splits a time range into contiguous, non-overlapping slices ordered newest first, matching the order in which
+    the Reports API returns activities.
+
+    Parameters:
+        start (pandas.Timestamp): The start of the range.
+        end (pandas.Timestamp): The end of the range.
+        slices (int): The number of slices to split the range into.
+
+    Returns:
+        list: The (start, end) bounds of each slice. Each end stops one millisecond short of the next slice's start so
+        that events on a boundary are only fetched once.
+    """
+    import pandas as pd
+    boundaries = pd.date_range(start, end, periods=max(slices, 1) + 1)
+    bounds = []
+    for index in range(len(boundaries) - 1):
+        slice_end = boundaries[index + 1]
+        if index < len(boundaries) - 2:
+            slice_end -= pd.Timedelta(milliseconds=1)
+        bounds.append((boundaries[index], slice_end))
+    return bounds[::-1]
+
+
+@lru_cache(maxsize=32)
+def compile_column_selector(selected: tuple[str, ...]) -> re.Pattern:
+    """
+    Compiles the selected columns into a single case-insensitive alternation, matching any column that contains one
+    of them.
+
+    Parameters:
+        selected (tuple): The column patterns to select.
+
+    Returns:
+        re.Pattern: The compiled selector.
+    """
+    return re.compile('|'.join(f'(?:{column})' for column in selected), re.IGNORECASE)
+
+
+@lru_cache(maxsize=128)
+def match_columns(columns: tuple[str, ...], selected: tuple[str, ...]) -> tuple[str, ...]:
+    """
+    Returns the columns matching any of the selected column patterns, once each and in their original order.
+
+    Parameters:
+        columns (tuple): The columns to select from.
+        selected (tuple): The column patterns to select.
+
+    Returns:
+        tuple: The matching columns.
+    """
+    if not selected:
+        return ()
+    selector = compile_column_selector(selected)
+    return tuple(column for column in columns if selector.search(column))
+
+
+def get_filter_column(df: pd.DataFrame, column: str) -> Optional[pd.Series]:
+    """Return the values a local filter matches, where a dotted column is a field of a nested column."""
+    if column in df.columns:
+        return df[column]
+    parent, _, name = column.partition('.')
+    if name and parent in df.columns:
+        return df[parent].map(lambda v: v.get(name) if isinstance(v, dict) else None)
+
+
+def prefetch(items: Iterator, executor: ThreadPoolExecutor, size: int = 4) -> Iterator:
+    """
+    Consumes an iterator in the executor, buffering up to size items ahead of the consumer. The iterator is submitted
+    to the executor right away, and closing the returned iterator stops it, even if nothing was read from it.
+
+    Parameters:
+        items (Iterator): The iterator to consume.
+        executor (concurrent.futures.ThreadPoolExecutor): The executor to consume the iterator in.
+        size (int): The number of items buffered ahead.
+
+    Returns:
+        Iterator: The items of the iterator. An error raised while consuming it is raised to the consumer.
+    """
+    buffer = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        # give up once the consumer has stopped, rather than blocking on a full buffer forever
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        if stop.is_set():
+            return
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as err:
+            put((done, err))
+
+    def consume() -> Iterator:
+        try:
+            # primed below, so that closing the stream before reading from it still stops the producer
+            yield
+            while True:
+                item, err = buffer.get()
+                if err is not None:
+                    raise err
+                if item is done:
+                    return
+                yield item
+        finally:
+            stop.set()
+
+    stream = consume()
+    next(stream)
+    executor.submit(produce)
+    return stream
+
+
+def merge_frames(streams: Sequence[Iterator[pd.DataFrame]], batch_size: int = 1000) -> Iterator[pd.DataFrame]:
+    """
+    Merges streams of activity frames, each ordered newest first, into a single stream ordered newest first.
+
+    Parameters:
+        streams (Sequence[Iterator[pandas.DataFrame]]): The streams to merge, each frame with an "id" column.
+        batch_size (int): The number of rows in each merged frame.
+
+    Returns:
+        Iterator[pandas.DataFrame]: The merged frames, with the columns of every stream.
+    """
+    import pandas as pd
+    def rows(stream: Iterator[pd.DataFrame]) -> Iterator[tuple]:
+        for df in stream:
+            for position, event_time in enumerate(df['id'].map(GET_TIME)):
+                yield event_time, df, position
+
+    def take(batch: list) -> pd.DataFrame:
+        # take runs of consecutive rows from the same frame at once
+        runs = groupby(batch, key=lambda row: id(row[0]))
+        parts = []
+        for _, run in runs:
+            run = list(run)
+            parts.append(run[0][0].take([position for _, position in run]))
+        return pd.concat(parts, ignore_index=True)
+
+    batch = []
+    for _, df, position in heapq.merge(*map(rows, streams), key=itemgetter(0), reverse=True):
+        batch.append((df, position))
+        if len(batch) >= batch_size:
+            yield take(batch)
+            batch = []
+    if batch:
+        yield take(batch)
+
 
 @dataclass
 class Filters:
@@ -68,6 +276,41 @@ class Filters:
 
     filters: Optional[Dict[str, Any]] = None
 
+    def split(self, pushdown: bool = True) -> tuple[Dict[str, str], Dict[str, Any]]:
+        """
+        Splits the filters into Reports API query parameters and filters that are applied locally.
+
+        Filters on the actor IP address, event name, user and org unit are sent as their query parameters. Filters on
+        event parameters are sent as the "filters" query parameter, which is only done along with an event name.
+        Wildcard filters are always applied locally, with query parameter names mapped to the columns they match.
+
+        Parameters:
+            pushdown (bool): Send the filters to the API, otherwise all filters are applied locally.
+
+        Returns:
+            tuple: The query parameters and the local filters.
+        """
+        query, local, parameters = {}, {}, []
+        for key, value in (self.filters or {}).items():
+            if pushdown and '*' not in value and key in QUERY_FILTERS and QUERY_FILTERS[key] not in query:
+                query[QUERY_FILTERS[key]] = value
+            elif pushdown and '*' not in value and key not in ACTIVITY_FIELDS and key not in QUERY_FILTERS:
+                parameters.append((key, value))
+            elif key in QUERY_FILTERS:
+                column = LOCAL_FILTERS.get(QUERY_FILTERS[key])
+                if column is None:
+                    raise ValueError(f'Filter {key} is only supported by the Reports API, without wildcards, '
+                                     f'--incremental or --cache')
+                local[column] = value
+            else:
+                local[key] = value
+
+        if parameters and 'eventName' in query:
+            query['filters'] = ','.join(f'{key}=={value}' for key, value in parameters)
+        else:
+            local.update(parameters)
+        return query, local
+
 
 class Command(BaseCommand):
     """
@@ -84,16 +327,37 @@ class Command(BaseCommand):
     service: googleapiclient.discovery.Resource
     duration: str
     application: str
+    applications: list[str]
     filters: Filters
+    # per application commands of a merged fetch leave saving the state to the merged fetch
+    persist_state: bool = True
 
     parser = get_custom_argparse_formatter(prog='audit', description='Google Workspace Audit')
-    parser.add_argument('application', help='Application name')
+    parser.add_argument('application', nargs='+',
+                        help='Application names, or "all". Several applications are fetched in parallel and merged.')
     parser.add_argument('duration', help='Duration in format Xs, Xm, Xh or Xd.')
     parser.add_argument('--columns', nargs='+', help='Columns to keep in the output. If not set, will take columns from config.')
     parser.add_argument('--export', action='store_true', default=False, help='Path to export the data')
     parser.add_argument('--export-format', choices=['csv', 'ndjson'], default='csv', help='Export format. Default is csv.')
-    parser.add_argument('--filters', nargs='*', action=KeyValueAction, dest='filters', default={}, help='Filters to apply on the data')
+    parser.add_argument('--export-path', type=Path, help='File or directory to export to. Default is the project root.')
+    parser.add_argument('--export-compression', choices=['gzip', 'zstd'], help='Compress the export.')
+    parser.add_argument('--export-max-size', type=int,
+                        help='Start a new numbered export file after this many megabytes (uncompressed).')
+    parser.add_argument('--filters', nargs='*', action=KeyValueAction, dest='filters', default={}, help='Filters to apply on the data, as key=value. Filters supported by the Reports API are applied by the API.')
     parser.add_argument('--interactive', action='store_true', help='Interactive mode')
+    parser.add_argument('--stream', action='store_true', default=False,
+                        help='Process results page by page, writing each page to the export or console as it arrives.')
+    parser.add_argument('--slices', type=int, default=1,
+                        help='Split the duration into this many time slices fetched concurrently. Default is 1.')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Maximum number of time slices fetched at once. Default is 4.')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='Number of times a failed page request is retried. Default is 3.')
+    sync_group = parser.add_mutually_exclusive_group()
+    sync_group.add_argument('--incremental', action='store_true', default=False,
+                            help='Only fetch events newer than the last incremental run and append them to the local store.')
+    sync_group.add_argument('--cache', action='store_true', default=False,
+                            help='Answer from the local columnar cache, only fetching time ranges that are not cached.')
 
     def __init__(self, **kwargs) -> None:
         """
@@ -120,7 +384,7 @@ class Command(BaseCommand):
             return
 
         try:
-            self.service = build('admin', 'reports_v1', credentials=self.obj.cred_store.store['default'].session)
+            self.service = self.obj.build_service('admin', 'reports_v1')
         except HttpError as err:
             self.logger.error(f'An error occurred: {err}')
             return
@@ -128,34 +392,72 @@ class Command(BaseCommand):
         # Validate and setup arguments
         self.args = validate_args(self.parser, self.args)
         self.duration = self.args.duration
-        self.application = self.args.application
-
-        # Setup filters
-        if self.args.filters:
-            self.args.filters = [f.strip('\'"') for f in self.args.filters]
-            self.filters = Filters(self.args.filters)
-
+        self.setup_applications()
+        self.state = AuditState.from_file() if self.args.incremental else None
+        self.cache = None
+        if self.args.cache:
+            try:
+                import pyarrow
+            except ImportError:
+                self.logger.error(f'PyArrow is not installed. Please install it with "poetry install -E audit_support".')
+                return
+            self.cache = EventCache()
+
+        # Setup filters, sending those the Reports API supports with the query unless syncing the full window
+        self.setup_filters()
+
+    def setup_applications(self) -> None:
+        """Expand the requested applications, with "all" standing for every application in the Reports API."""
+        requested = self.args.application
+        if isinstance(requested, str):
+            requested = [requested]
+        self.applications = list(dict.fromkeys(APPLICATIONS if 'all' in requested else requested))
+        if len(self.applications) == 1:
+            self.application = self.applications[0]
+        else:
+            self.application = 'all' if 'all' in requested else '_'.join(self.applications)
+        # merged events are tagged with their application
+        self.tag_application = len(self.applications) > 1
+
+    def setup_filters(self) -> None:
+        """Split the filters into query parameters and local filters."""
+        self.filters = Filters(self.args.filters)
+        pushdown = not (self.args.incremental or self.args.cache)
+        self.query_filters, self.local_filters = self.filters.split(pushdown=pushdown)
+        if self.query_filters:
+            self.logger.info(f'Filtering with Reports API parameters: {self.query_filters}')
+
+    @property
+    def export_path(self) -> Path:
+        """Return the path the data is exported to."""
+        name = f'{self.application}_{self.duration}.{self.args.export_format}'
+        path = self.args.export_path
+        if path is None:
+            return ROOT_DIR / name
+        return path / name if path.is_dir() else path
+
+    def export_writer(self) -> ExportWriter:
+        """Return a writer for the export settings in the arguments."""
+        max_size = self.args.export_max_size
+        return ExportWriter(self.export_path, export_format=self.args.export_format,
+                            compression=self.args.export_compression,
+                            max_bytes=max_size * 1024 * 1024 if max_size else None)
+
+    def log_export(self, writer: ExportWriter) -> None:
+        """Log where the data was exported to."""
+        paths = ', '.join(str(p) for p in writer.paths)
+        self.logger.info(f'Data exported to {paths} in {self.args.export_format.upper()} format.')
 
     def export_data(self, df: pd.DataFrame) -> None:
         """
-        Exports the dataframe to a specified format.
+        Exports the dataframe to a specified format, a chunk of rows at a time.
 
         Parameters:
             df (pandas.DataFrame): The DataFrame to export.
-
-        Raises:
-            Warning: If the specified export format is not supported.
-        """
-        export_path = ROOT_DIR / f'{self.application}_{self.duration}.{self.args.export_format}'
-        if self.args.export_format == 'csv':
-            df.to_csv(export_path, index=False)
-            self.logger.info(f'Data exported to {export_path} in CSV format.')
-        elif self.args.export_format == 'ndjson':
-            df.to_json(export_path, orient='records', lines=True)
-            self.logger.info(f'Data exported to {export_path} in NDJSON format.')
-        else:
-            self.logger.warning(f'Unsupported export format: {self.args.export_format}. No data was exported.')
-
+        """
+        with self.export_writer() as writer:
+            writer.write(df)
+        self.log_export(writer)
 
     def flatten_json(self, y: dict) -> dict:
         """
@@ -187,7 +489,10 @@ class Command(BaseCommand):
 
     def flatten_activities(self, activities: list) -> pd.DataFrame:
         """
-        Flattens the activities data and converts it into a DataFrame.
+        Flattens a page of activities data and converts it into a DataFrame with one row per event.
+
+        The parameters of each event are merged into the event, and the event into its activity. The recursive
+        flattening is only used for events with nested values, the others are already flat.
 
         Parameters:
             activities (list): The list of activities data to flatten.
@@ -195,48 +500,303 @@ class Command(BaseCommand):
         Returns:
             pandas.DataFrame: The DataFrame containing the flattened activities data.
         """
-        flattened_data = []
+        import pandas as pd
+        rows = []
         for activity in activities:
-            events = activity.pop('events')
-            for event in events:
-                # Convert parameters to a dictionary
-                if 'parameters' in event:
-                    parameters_dict = {item.get('name'): item.get('value') for item in event.pop('parameters')}
-                    event = {**event, **parameters_dict}
-                flattened_event = self.flatten_json(event)
-                merged_data = {**activity, **flattened_event}
-                flattened_data.append(merged_data)
-        return pd.DataFrame(flattened_data)
+            activity_row = {k: v for k, v in activity.items() if k != 'events'}
+            for event in activity.get('events', ()):
+                event_row = {k: v for k, v in event.items() if k != 'parameters'}
+                for parameter in event.get('parameters', ()):
+                    event_row[parameter.get('name')] = parameter.get('value')
+                if not SCALAR_TYPES.issuperset(map(type, event_row.values())):
+                    event_row = self.flatten_json(event_row)
+                rows.append({**activity_row, **event_row})
+        return pd.DataFrame(rows)
+
+    def build_service(self) -> googleapiclient.discovery.Resource:
+        """Build a Reports API service from the default session for a worker thread."""
+        return self.obj.build_service('admin', 'reports_v1', memoize=False)
+
+    def time_window(self) -> tuple[pd.Timestamp, pd.Timestamp]:
+        """Return the start and end of the requested duration, or from the high-water mark when incremental."""
+        import pandas as pd
+        now = pd.Timestamp.now(tz='UTC')
+        mark = self.state.get(self.application) if self.state else None
+        if mark:
+            return pd.Timestamp(mark.time), now
+        return now - pd.to_timedelta(self.duration), now
+
+    def list_activities(self, service: googleapiclient.discovery.Resource, start_time: pd.Timestamp,
+                        end_time: Optional[pd.Timestamp] = None) -> Iterator[list]:
+        """
+        Yields the activities between the start and end time one page at a time.
+
+        Parameters:
+            service (googleapiclient.discovery.Resource): The Reports API service to use.
+            start_time (pandas.Timestamp): The start of the window.
+            end_time (pandas.Timestamp): The end of the window, open ended if not set.
+
+        Returns:
+            Iterator[list]: The raw activities of each page returned by the API.
+        """
+        params = dict(userKey='all', applicationName=self.application, startTime=start_time.isoformat())
+        params.update(self.query_filters)
+        if end_time is not None:
+            params['endTime'] = end_time.isoformat()
+        request = service.activities().list(**params)
+
+        while request is not None:
+            activities_result = self.obj.executor.execute(request, retries=self.args.retries)
+            yield activities_result.get('items', [])
+            request = service.activities().list_next(request, activities_result)
+
+    def fetch_slice(self, bounds: tuple[pd.Timestamp, pd.Timestamp]) -> Iterator[list]:
+        """
+        Yields every page of a single time slice with its own Reports API service. Each page is retried on rate
+        limiting and server errors by the request executor.
+
+        Parameters:
+            bounds (tuple): The start and end of the slice.
+
+        Returns:
+            Iterator[list]: The pages of activities within the slice.
+        """
+        start_time, end_time = bounds
+        service = self.build_service()
+        yield from self.list_activities(service, start_time, end_time)
+
+    def iter_activity_pages(self, start_time: Optional[pd.Timestamp] = None,
+                            end_time: Optional[pd.Timestamp] = None) -> Iterator[list]:
+        """
+        Yields the activities from the Google Workspace Audit service one page at a time. When more than one slice is
+        requested, the slices are fetched concurrently and their pages yielded newest slice first.
+
+        Parameters:
+            start_time (pandas.Timestamp): The start of the window, defaults to the requested duration.
+            end_time (pandas.Timestamp): The end of the window, defaults to now.
+
+        Returns:
+            Iterator[list]: The raw activities of each page returned by the API.
+        """
+        if start_time is None:
+            start_time, end_time = self.time_window()
+        if self.args.slices <= 1:
+            yield from self.list_activities(self.service, start_time, end_time)
+            return
+
+        slices = split_time_range(start_time, end_time, self.args.slices)
+        self.logger.info(f'Fetching {len(slices)} time slices with up to {self.args.workers} workers.')
+        with ThreadPoolExecutor(max_workers=max(self.args.workers, 1)) as executor:
+            # each running slice buffers a few pages ahead, the slices beyond the workers wait for one to finish
+            streams = [prefetch(self.fetch_slice(bounds), executor) for bounds in slices]
+            try:
+                for stream in streams:
+                    yield from stream
+            finally:
+                for stream in streams:
+                    stream.close()
+
+    def filter_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Filters the rows of the dataframe based on the filters that were not sent to the Reports API.
+
+        Args:
+            df (pd.DataFrame): The dataframe to be filtered.
 
+        Returns:
+            pd.DataFrame: The filtered dataframe.
+        """
+        if self.local_filters:
+            for column, value in self.local_filters.items():
+                values = get_filter_column(df, column)
+                if values is None:
+                    # a page without the column cannot match the filter
+                    return df.iloc[0:0]
+                if '*' in value:
+                    df = df[values.str.contains(value.strip('*'), case=False, na=False)]
+                else:
+                    df = df[values == value]
+        return df
+
+    @property
+    def settle_lag(self) -> pd.Timedelta:
+        """Return how long after the fact the Reports API may still publish events, which are not cached until then."""
+        import pandas as pd
+        return pd.to_timedelta(self.obj.config['google']['audit'].get('cache_settle_lag', DEFAULT_SETTLE_LAG))
+
+    def iter_cached_frames(self) -> Iterator[pd.DataFrame]:
+        """
+        Fetches the time ranges missing from the local cache into it, then yields the requested window from the cache.
 
-    def fetch_data(self) -> pd.DataFrame:
+        The Reports API publishes some events late, so only the part of the window older than the settle lag is cached.
+        The newer part is fetched again on every query and yielded first. Equality filters and, outside of interactive
+        mode, the selected columns are pushed down to the cache scan.
+
+        Returns:
+            Iterator[pandas.DataFrame]: The DataFrame for each cached record batch with at least one matching row.
+        """
+        import pandas as pd
+
+        start_time, end_time = self.time_window()
+        settled_time = min(end_time, pd.Timestamp.now(tz='UTC') - self.settle_lag)
+        if settled_time < end_time:
+            unsettled_start = max(start_time, settled_time + pd.Timedelta(milliseconds=1))
+            self.logger.info(f'Fetching unsettled {self.application} events from {unsettled_start} to {end_time}.')
+            for activities in self.iter_activity_pages(unsettled_start, end_time):
+                if activities:
+                    df = self.filter_rows(self.flatten_activities(activities))
+                    if not df.empty:
+                        yield df
+            end_time = settled_time
+        if end_time < start_time:
+            return
+
+        for range_start, range_end in self.cache.missing_ranges(self.application, start_time, end_time):
+            self.logger.info(f'Fetching uncached {self.application} events from {range_start} to {range_end}.')
+            frames = (self.flatten_activities(activities)
+                      for activities in self.iter_activity_pages(range_start, range_end) if activities)
+            self.cache.write_range(self.application, frames, range_start, range_end)
+
+        filters = self.local_filters
+        # nested fields are stored as JSON, so they are filtered once read
+        pushdown = {k: v for k, v in filters.items() if '*' not in v and '.' not in k}
+        filter_columns = [c.split('.')[0] for c in filters]
+
+        def column_selector(columns: list[str]) -> list[str]:
+            selected = self.select_columns(columns)
+            # merging applications orders the events by their id
+            required = ['id'] if self.tag_application and 'id' in columns else []
+            return list(dict.fromkeys(selected + required + [c for c in filter_columns if c in columns]))
+
+        selector = None if self.args.interactive else column_selector
+        for df in self.cache.iter_frames(self.application, start_time, end_time, pushdown, selector):
+            df = self.filter_rows(df)
+            if not df.empty:
+                yield df
+
+    def iter_frames(self) -> Iterator[pd.DataFrame]:
+        """
+        Yields a flattened and filtered DataFrame for each page of activities as it is fetched, so that memory is
+        bounded by the page size rather than the size of the requested window.
+
+        Returns:
+            Iterator[pandas.DataFrame]: The DataFrame for each page with at least one matching row.
+        """
+        if len(self.applications) > 1:
+            yield from self.iter_merged_frames()
+            return
+        if self.cache:
+            yield from self.iter_cached_frames()
+            return
+
+        # snapshot the mark, the state advances as pages are synced
+        mark = copy.deepcopy(self.state.get(self.application)) if self.state else None
+        if self.state:
+            discard_events(self.application)
+        for activities in self.iter_activity_pages():
+            if mark:
+                # startTime is inclusive, so drop the events already synced at the boundary
+                activities = [a for a in activities if mark.is_new(a)]
+            if not activities:
+                continue
+            if self.state:
+                self.state.update(self.application, activities)
+            df = self.flatten_activities(activities)
+            if self.state:
+                # staged until the window commits, so that a failed sync does not store events twice
+                stage_events(self.application, df)
+            df = self.filter_rows(df)
+            if not df.empty:
+                yield df
+
+        if self.state and self.persist_state:
+            self.commit_state()
+
+    def commit_state(self) -> None:
+        """Store the staged events of every application and advance their marks, once the whole window is synced."""
+        for application in self.applications:
+            commit_events(application)
+        self.state.save()
+
+    def for_application(self, application: str) -> 'Command':
+        """Return a copy of the command for a single application, with its own Reports API service."""
+        command = copy.copy(self)
+        command.application = application
+        command.applications = [application]
+        command.service = self.build_service()
+        command.persist_state = False
+        return command
+
+    def iter_tagged_frames(self) -> Iterator[pd.DataFrame]:
+        """Yields the frames of the command with an application column."""
+        for df in self.iter_frames():
+            df.insert(0, 'application', self.application)
+            yield df
+
+    def iter_merged_frames(self) -> Iterator[pd.DataFrame]:
+        """
+        Fetches every requested application in parallel, each with its own service, and yields their events as a
+        single stream ordered newest first and tagged with the application.
+
+        Returns:
+            Iterator[pandas.DataFrame]: The merged frames.
+        """
+        commands = [self.for_application(application) for application in self.applications]
+        self.logger.info(f'Fetching {len(commands)} applications in parallel: {", ".join(self.applications)}')
+        # every application needs a worker, the merge waits on the first page of each
+        with ThreadPoolExecutor(max_workers=len(commands)) as executor:
+            streams = [prefetch(command.iter_tagged_frames(), executor) for command in commands]
+            try:
+                yield from merge_frames(streams)
+            finally:
+                for stream in streams:
+                    stream.close()
+
+        if self.state and self.persist_state:
+            self.commit_state()
+
+    def fetch_data(self) -> Optional[pd.DataFrame]:
         """
         Fetches the activity data from the Google Workspace Audit service, using the provided start time,
         application name, and user key. The data is returned as a pandas DataFrame.
 
         Returns:
-            pandas.DataFrame: The DataFrame containing the fetched activity data.
+            pandas.DataFrame: The DataFrame containing the fetched activity data, or None if nothing was found.
         """
-        now = pd.Timestamp.now(tz='UTC')
-        start_time = (now - pd.to_timedelta(self.duration)).isoformat()
-        request = self.service.activities().list(userKey='all', applicationName=self.application, startTime=start_time)
-        activities = []
+        import pandas as pd
+        frames = list(self.iter_frames())
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
 
-        while request is not None:
-            activities_result = request.execute()
-            activities.extend(activities_result.get('items', []))
-            request = self.service.activities().list_next(request, activities_result)
-
-        df = pd.DataFrame(activities)
-        df = self.flatten_activities(activities)
-        if self.args.filters:
-            for column, value in self.args.filters.items():
-                if '*' in value:
-                    df = df[df[column].str.contains(value.strip('*'), case=False)]
+    def stream_results(self) -> None:
+        """
+        Processes the activity data page by page, exporting or showing each page as soon as it is flattened.
+
+        Returns:
+            None
+        """
+        total = 0
+        writer = self.export_writer() if self.args.export else None
+        try:
+            for df in self.iter_frames():
+                df = self.filter_columns(df)
+                if writer:
+                    writer.write(df)
                 else:
-                    df = df[df[column] == value]
+                    self.show_results(df)
+                total += len(df)
+        finally:
+            if writer:
+                writer.close()
 
-        return df
+        if not total:
+            self.logger.info(f'No results found for {self.application} in the last {self.duration}.')
+            return
+
+        self.logger.info(f'Found {total} results.')
+        if writer:
+            self.log_export(writer)
 
     def filter_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -248,10 +808,24 @@ class Command(BaseCommand):
         Returns:
             pd.DataFrame: The filtered dataframe.
         """
-        columns = self.args.columns or self.obj.config['google']['audit']['columns']
-        modified_columns = ['.*' + column + '.*' for column in columns]
-        df = df[[column for column in df.columns for pattern in modified_columns if re.search(pattern, column, re.IGNORECASE)]]
-        return df
+        return df[self.select_columns(list(df.columns))]
+
+    def select_columns(self, columns: list[str]) -> list[str]:
+        """
+        Selects the columns matching the columns specified in the arguments or in the config file. Each column is
+        returned once, in its original order.
+
+        Args:
+            columns (list[str]): The columns to select from.
+
+        Returns:
+            list[str]: The selected columns.
+        """
+        selected = self.args.columns or self.obj.config['google']['audit']['columns']
+        matched = list(match_columns(tuple(columns), tuple(selected)))
+        if self.tag_application and 'application' in columns and 'application' not in matched:
+            matched.insert(0, 'application')
+        return matched
 
     def interactive_session(self, df: pd.DataFrame, df_unfiltered: pd.DataFrame) -> None:
         """
@@ -306,16 +880,23 @@ class Command(BaseCommand):
         Main execution method of the Command class.
 
         Fetches the data, logs the results, and based on the provided arguments either exports the data,
-        starts an interactive session, or simply shows the results with all columns.
+        starts an interactive session, or simply shows the results with all columns. When streaming, each page is
+        exported or shown as it is fetched instead.
 
         Returns:
             None
         """
+        if self.args.stream:
+            if self.args.interactive:
+                self.logger.warning('Interactive mode is not supported when streaming, ignoring --interactive.')
+            self.stream_results()
+            return
+
         df = self.fetch_data()
-        df_unfiltered = df.copy()
         if df is None:
             self.logger.info(f'No results found for {self.application} in the last {self.duration}.')
             return
+        df_unfiltered = df.copy()
 
         df = self.filter_columns(df)
 
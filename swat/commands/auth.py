@@ -70,6 +70,7 @@ class Command(BaseCommand):
                     flow = InstalledAppFlow.from_client_config(cred.creds.to_dict(), self.obj.config['google']['scopes'])
                     session = flow.run_local_server(port=0)
                     cred.session = session
+                    self.obj.cred_store.store[self.args.key] = cred
         elif self.args.creds:
             if self.args.service_account:
                 check_file_exists(self.args.creds, f'Missing service account credentials file')
@@ -90,6 +91,8 @@ class Command(BaseCommand):
         self.logger.info(f'Authenticated successfully.' if session else f'Failed to authenticate.')
         if self.args.store_key:
             self.obj.cred_store.add(self.args.store_key, creds=cred, session=session, type=cred_type, override=True)
+            if self.obj.refresher:
+                self.obj.refresher.wake()
         return session
 
     def list_sessions(self):
@@ -0,0 +1,235 @@
+#
+# Licensed to Elasticsearch under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Run playbooks of emulations."""
+
+import graphlib
+import shlex
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+import yaml
+
+from ..commands.base_command import BaseCommand
+from ..commands.emulate import Command as EmulateCommand
+from ..misc import validate_args
+from ..registry import get_registry
+
+DEFAULT_WORKERS = 4
+DEFAULT_SERVICE_LIMIT = 2
+
+
+@dataclass
+class Step:
+    """An emulation of a playbook and the steps it depends on."""
+
+    id: str
+    emulation: str
+    args: list[str] = field(default_factory=list)
+    needs: list[str] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Step':
+        """Build a step from its playbook entry, where the args may be a list or a command line string."""
+        args = data.get('args') or []
+        needs = data.get('needs') or []
+        return cls(id=data.get('id', data['emulation']), emulation=data['emulation'],
+                   args=shlex.split(args) if isinstance(args, str) else [str(a) for a in args],
+                   needs=[needs] if isinstance(needs, str) else list(needs))
+
+
+@dataclass
+class StepResult:
+    """Outcome of a playbook step."""
+
+    id: str
+    emulation: str
+    status: str
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class Playbook:
+    """Emulations to run as a dependency graph."""
+
+    name: str
+    steps: dict[str, Step]
+    workers: int = DEFAULT_WORKERS
+    service_limits: dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Playbook':
+        """Build a playbook, validating its emulations and dependencies."""
+        steps = {}
+        for entry in data.get('steps') or []:
+            step = Step.from_dict(entry)
+            if step.id in steps:
+                raise ValueError(f'Duplicate step id: {step.id}')
+            steps[step.id] = step
+        if not steps:
+            raise ValueError('Playbook has no steps')
+
+        emulations = get_registry().emulations
+        for step in steps.values():
+            if step.emulation not in emulations:
+                raise ValueError(f'Step {step.id}: unknown emulation {step.emulation}')
+            unknown = [n for n in step.needs if n not in steps]
+            if unknown:
+                raise ValueError(f'Step {step.id}: unknown dependencies {unknown}')
+
+        playbook = cls(name=data.get('name', 'campaign'), steps=steps,
+                       workers=data.get('workers', DEFAULT_WORKERS), service_limits=data.get('service_limits') or {})
+        try:
+            playbook.sorter().prepare()
+        except graphlib.CycleError as e:
+            raise ValueError(f'Playbook dependencies contain a cycle: {e.args[1]}')
+        return playbook
+
+    @classmethod
+    def from_file(cls, path: Path) -> 'Playbook':
+        """Load a YAML playbook."""
+        return cls.from_dict(yaml.safe_load(Path(path).read_text()))
+
+    def sorter(self) -> graphlib.TopologicalSorter:
+        """Return a sorter of the steps by their dependencies."""
+        return graphlib.TopologicalSorter({step.id: step.needs for step in self.steps.values()})
+
+    def stages(self) -> list[list[str]]:
+        """Return the steps grouped by the earliest stage they can run in."""
+        sorter = self.sorter()
+        sorter.prepare()
+        stages = []
+        while sorter.is_active():
+            ready = sorted(sorter.get_ready())
+            stages.append(ready)
+            sorter.done(*ready)
+        return stages
+
+
+class Command(BaseCommand):
+
+    parser = BaseCommand.load_parser(description='Run a YAML playbook of emulations as a dependency graph.')
+    parser.add_argument('playbook', type=Path, help='Path to the playbook')
+    parser.add_argument('--workers', type=int, help='Number of steps run concurrently, overrides the playbook')
+    parser.add_argument('--service-limit', type=int, default=DEFAULT_SERVICE_LIMIT,
+                        help='Number of steps using a service run concurrently, unless set in the playbook')
+    parser.add_argument('--dry-run', action='store_true', help='Validate the playbook and show its stages')
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.args = validate_args(self.parser, self.args)
+        self.playbook = Playbook.from_file(self.args.playbook)
+        self.workers = self.args.workers or self.playbook.workers
+        self.semaphores: dict[str, threading.BoundedSemaphore] = {}
+
+    def load_emulations(self) -> dict[str, Any]:
+        """Instantiate the emulation of each step, so that invalid arguments fail before anything runs."""
+        emulations = {}
+        for step in self.playbook.steps.values():
+            emulation_class = EmulateCommand.load_emulation_class(step.emulation)
+            if emulation_class is None:
+                raise ValueError(f'Step {step.id}: unable to load emulation {step.emulation}')
+            emulations[step.id] = emulation_class(args=step.args, obj=self.obj)
+        return emulations
+
+    def run_step(self, step: Step, emulation: Any) -> StepResult:
+        """Run the emulation of a step once the services it uses are below their limits."""
+        with ExitStack() as stack:
+            # acquired in a fixed order so steps sharing several services cannot deadlock
+            for service in sorted(set(getattr(emulation, 'services', []))):
+                stack.enter_context(self.semaphores[service])
+
+            self.logger.info(f'Running step {step.id}: {step.emulation}')
+            start = time.perf_counter()
+            try:
+                emulation.execute()
+            except Exception as e:
+                self.logger.error(f'Step {step.id} failed: {e}')
+                return StepResult(step.id, step.emulation, 'failed', time.perf_counter() - start, str(e))
+            return StepResult(step.id, step.emulation, 'succeeded', time.perf_counter() - start)
+
+    def run(self, emulations: dict[str, Any]) -> dict[str, StepResult]:
+        """
+        Run the steps on a worker pool, each as soon as the steps it depends on succeed. Steps depending on a step
+        that failed are skipped.
+
+        Parameters:
+            emulations (dict): The emulation of each step, by step id.
+
+        Returns:
+            dict: The result of each step, by step id.
+        """
+        services = {s for emulation in emulations.values() for s in getattr(emulation, 'services', [])}
+        self.semaphores = {
+            s: threading.BoundedSemaphore(self.playbook.service_limits.get(s, self.args.service_limit))
+            for s in services
+        }
+
+        results = {}
+        running = {}
+        sorter = self.playbook.sorter()
+        sorter.prepare()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while sorter.is_active():
+                while ready := sorter.get_ready():
+                    for step_id in ready:
+                        step = self.playbook.steps[step_id]
+                        blocked = [n for n in step.needs if results[n].status != 'succeeded']
+                        if blocked:
+                            results[step_id] = StepResult(step_id, step.emulation, 'skipped',
+                                                          error=f'Dependencies did not succeed: {blocked}')
+                            sorter.done(step_id)
+                        else:
+                            running[pool.submit(self.run_step, step, emulations[step_id])] = step_id
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step_id = running.pop(future)
+                    results[step_id] = future.result()
+                    sorter.done(step_id)
+        return results
+
+    def show_results(self, results: dict[str, StepResult], seconds: float) -> None:
+        """Log the result of each step and the campaign duration."""
+        for result in results.values():
+            error = f': {result.error}' if result.error else ''
+            self.logger.info(f'{result.id} ({result.emulation}) {result.status} in {result.seconds:.1f}s{error}')
+        succeeded = sum(result.status == 'succeeded' for result in results.values())
+        self.logger.info(f'Campaign {self.playbook.name}: {succeeded}/{len(results)} steps succeeded in '
+                         f'{seconds:.1f}s')
+
+    def execute(self) -> None:
+        """Main execution method."""
+        if self.args.dry_run:
+            for number, stage in enumerate(self.playbook.stages(), 1):
+                self.logger.info(f'Stage {number}: {", ".join(stage)}')
+            return
+
+        emulations = self.load_emulations()
+        start = time.perf_counter()
+        results = self.run(emulations)
+        self.show_results(results, time.perf_counter() - start)
@@ -22,9 +22,10 @@
 from tabulate import tabulate
 
 from ..commands.base_command import BaseCommand
-from ..commands.emulate import Command as EmulateCommand
-from ..attack import download_attack_data, load_attack_data
+from ..attack import download_attack_data, load_attack_index
+from ..emulations.base_emulation import AttackData
 from ..misc import validate_args
+from ..registry import get_registry
 from ..utils import ROOT_DIR
 
 
@@ -43,7 +44,8 @@ class Command(BaseCommand):
     parser_view = subparsers.add_parser('view', description='Show ATT&CK coverage for existing emulations',
                                         help='Show coverage details')
     parser_view.add_argument('--tactic', nargs='*', help='Filter coverage to the specified tactics.')
-    parser_view.add_argument('--technique-id', nargs='*', help='Filter coverage to the specified technique IDs.')
+    parser_view.add_argument('--technique-id', nargs='*',
+                             help='Filter coverage to the specified technique IDs, including their sub-techniques.')
 
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
@@ -52,17 +54,24 @@ class Command(BaseCommand):
         self.parser_view.set_defaults(func=self.view)
 
         self.args = validate_args(self.parser, self.args)
-        self.emulate_commands = EmulateCommand.load_all_emulation_classes()
+        # static metadata, so the emulation modules are not imported
+        self.emulations = list(get_registry().emulations.values())
 
     def build_table_entries(self) -> list[dict]:
         """Build dict format for table."""
         details = []
-        for command in self.emulate_commands:
-            details.extend([v for k, v in command.get_attack().technique_details().items()])
+        for emulation in self.emulations:
+            attack = AttackData(tactic=emulation.tactic, technique=[t.upper() for t in emulation.techniques],
+                                _emulation_name=emulation.command,
+                                _emulation_description=emulation.parser_description)
+            details.extend(attack.technique_details().values())
         if self.args.tactic:
             details = [d for d in details if d['tactic'] in self.args.tactic]
         if self.args.technique_id:
-            details = [d for d in details if d['id'] in self.args.technique_id]
+            # a technique ID also matches its sub-techniques
+            index = load_attack_index()
+            technique_ids = set(self.args.technique_id)
+            details = [d for d in details if d['id'] in technique_ids or index.get_parent(d['id']) in technique_ids]
         return details
 
     @staticmethod
@@ -72,7 +81,7 @@ class Command(BaseCommand):
 
     def version(self) -> None:
         """Show the ATT&CK version."""
-        self.logger.info(f'ATT&CK version: {load_attack_data()["version"]}')
+        self.logger.info(f'ATT&CK version: {load_attack_index().version}')
 
     def view(self) -> None:
         """View coverage details."""
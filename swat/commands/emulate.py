@@ -20,16 +20,13 @@
 """Handle emulation commands."""
 
 import importlib
-import os
-from pathlib import Path
 from typing import Optional
 
 from swat.commands.base_command import BaseCommand
 from swat.emulations.base_emulation import BaseEmulation
+from swat.registry import get_registry
 from swat.utils import render_table
 
-EMULATIONS_DIR = Path(__file__).parent.parent.absolute() / 'emulations'
-
 
 class Command(BaseCommand):
     """Execute attack emulations."""
@@ -50,12 +47,11 @@ class Command(BaseCommand):
     @classmethod
     def custom_help(cls) -> str:
         """Return the help message for the command."""
-        emulations = cls.load_all_emulation_classes()
         emulation_details = [
-            f'{emulation.name}:{emulation.__module__.split(".")[-1]}:'
-            f'{emulation.parser.description}:{emulation.services}:'
+            f'{emulation.name}:{emulation.command}:'
+            f'{emulation.parser_description}:{emulation.services}:'
             f'{emulation.scopes}:{emulation.techniques}'
-            for emulation in emulations
+            for emulation in get_registry().emulations.values()
         ]
         headers = ['name', 'emulation command', 'description', 'services', 'scopes', 'techniques']
         print(f'Available Emulations: \n{render_table(emulation_details, headers=headers)}')
@@ -63,17 +59,12 @@ class Command(BaseCommand):
     @staticmethod
     def get_dotted_command_path(command_name: str) -> str:
         """Return the path to the command module."""
-        path = list(EMULATIONS_DIR.rglob(f'{command_name}.py'))
-        assert len(path) == 1, f'Error: Ambiguous command "{command_name}" more than one found with that name'
-        dotted = str(path[0].relative_to(EMULATIONS_DIR)).replace(os.sep, '.')[:-3]
-        return dotted
+        return get_registry().get_dotted_emulation_path(command_name)
 
     @staticmethod
     def get_emulate_commands() -> list[str]:
         """Return a list of possible emulation commands."""
-        commands = [c.stem for c in EMULATIONS_DIR.rglob('*.py') if not c.name.startswith('_') and
-                    not c.parent.name == 'emulations']
-        return commands
+        return list(get_registry().emulations)
 
     @classmethod
     def load_emulation_class(cls, name: str) -> Optional[type[BaseEmulation]]:
@@ -82,7 +73,7 @@ class Command(BaseCommand):
             dotted_command = cls.get_dotted_command_path(name)
             command_module = importlib.import_module(f'swat.emulations.{dotted_command}')
             command_class = getattr(command_module, 'Emulation')
-        except (ImportError, AttributeError) as e:
+        except (ImportError, AttributeError, KeyError) as e:
             # TODO: fix
             self.logger.info(f'Error: Command "{name}" not found.')
             return
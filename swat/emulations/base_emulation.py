@@ -20,13 +20,19 @@
 """Base class for attack Emulations."""
 
 import argparse
+import io
 import logging
+import mmap
+import os
+from contextlib import contextmanager
 from dataclasses import dataclass
 from functools import cache
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional, Union
 
 import yaml
+from googleapiclient.discovery import Resource
+from googleapiclient.http import MediaIoBaseUpload
 
 from ..attack import lookup_technique_by_id
 from ..base import SWAT, DEFAULT_EMULATION_ARTIFACTS_DIR
@@ -34,6 +40,36 @@ from ..logger import configure_emulation_logger
 from ..misc import get_custom_argparse_formatter, validate_args
 
 
+# payloads over this size are sent in resumable sessions, as recommended for Drive uploads
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+# resumable chunk size, a multiple of 256 KB
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+UploadData = Union[bytes, bytearray, memoryview, io.IOBase, mmap.mmap]
+
+
+def media_upload(data: UploadData, mimetype: str = 'application/octet-stream') -> MediaIoBaseUpload:
+    """Return a media upload streaming from memory, resumable only for payloads over the resumable threshold."""
+    fd = io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+    fd.seek(0, os.SEEK_END)
+    size = fd.tell()
+    fd.seek(0)
+    return MediaIoBaseUpload(fd, mimetype=mimetype, chunksize=UPLOAD_CHUNK_SIZE,
+                             resumable=size > RESUMABLE_UPLOAD_THRESHOLD)
+
+
+@contextmanager
+def map_file(path: Path) -> Iterator[Union[mmap.mmap, io.BytesIO]]:
+    """Memory map a file for upload without reading it into memory."""
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # empty files cannot be mapped
+            yield io.BytesIO()
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
 @dataclass
 class AttackData:
     """Dataclass for ATT&CK Emulation"""
@@ -131,6 +167,17 @@ class BaseEmulation:
         if config_file_path.exists():
             return yaml.safe_load(config_file_path.read_text())
 
+    def upload_to_drive(self, service: Resource, data: UploadData, metadata: Optional[dict] = None,
+                        mimetype: str = 'application/octet-stream', **kwargs) -> dict:
+        """
+        Create a Drive file from in-memory data, a buffer or a memory mapped file.
+
+        Content without metadata is sent in a simple upload and content with metadata in a multipart upload, each in a
+        single request. Payloads over the resumable threshold are sent in chunks in a resumable session.
+        """
+        media = media_upload(data, mimetype)
+        return self.obj.executor.execute(service.files().create(media_body=media, body=metadata, **kwargs))
+
     def setup_artifacts_folder(self) -> Path:
         """Create the artifacts folder if it doesn't exist."""
         DEFAULT_EMULATION_ARTIFACTS_DIR.mkdir(parents=True, exist_ok=True)
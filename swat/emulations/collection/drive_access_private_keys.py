@@ -17,14 +17,12 @@
 # under the License.
 #
 
-import os
 import shutil
-import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 import requests
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
 
 from swat.emulations.base_emulation import BaseEmulation
 
@@ -37,6 +35,9 @@ class Emulation(BaseEmulation):
     parser.add_argument('session_key', default='default', help='Session to use for service building API service')
     parser.add_argument('folder_id', help='Google Drive Folder ID')
     parser.add_argument('--cleanup', action='store_true', default=False, help='Clean up staged files after execution')
+    parser.add_argument('--workers', type=int, default=8, help='Number of files staged concurrently')
+    parser.add_argument('--access-delay', type=float, default=1.0,
+                        help='Seconds to wait between accessing each shared link')
 
     techniques = ['T1552.004']
     name = 'Access Stored Keys and Tokens in Drive'
@@ -48,7 +49,7 @@ class Emulation(BaseEmulation):
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
         self.folder_id = self.args.folder_id
-        self.service = build('drive', 'v3', credentials=self.obj.cred_store.store[self.args.session_key].session)
+        self.service = self.obj.build_service('drive', 'v3', self.args.session_key)
         # file extensions filtered to 5 for testing purposes
         self.file_extensions = [
             "token","assig", "pssc", "keystore", "pub", "pgp.asc", "ps1xml", "pem", "gpg.sig", "der", "key","p7r",
@@ -56,35 +57,35 @@ class Emulation(BaseEmulation):
             "pkcs7", "jceks", "pkcs8", "psc1", "p7c", "csr", "cer", "spc", "ps2xml"
         ]
 
+    def upload_file(self, ext: str) -> Optional[tuple[str, str]]:
+        """Upload a fake file with the extension from memory and return its name and ID."""
+        file_name = f"fake_file.{ext}"
+        file_content = f"This is a fake {file_name}"
+        try:
+            file_metadata = self.upload_to_drive(self.service, file_content.encode('utf-8'),
+                                                 {'name': file_name, 'parents': [self.folder_id]}, 'text/plain',
+                                                 fields='id')
+            return file_name, file_metadata['id']
+        except Exception as e:
+            self.elogger.error(f"Error while staging file with extension {ext}. Error: {str(e)}")
+
     def stage_files(self) -> list[str]:
-        """Stage files in Google Drive and return a list of shareable links."""
+        """Stage files in Google Drive concurrently, share them in batch requests and return the shareable links."""
+        with ThreadPoolExecutor(max_workers=max(self.args.workers, 1)) as executor:
+            uploaded = dict(filter(None, executor.map(self.upload_file, self.file_extensions)))
+
+        permission_requests = {
+            file_name: self.service.permissions().create(fileId=file_id, body={'role': 'reader', 'type': 'anyone'})
+            for file_name, file_id in uploaded.items()
+        }
         shareable_links = []
-
-        for ext in self.file_extensions:
-            try:
-                file_name = f"fake_file.{ext}"
-                file_content = f"This is a fake {file_name}"
-
-                with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                    temp_file.write(file_content.encode('utf-8'))
-                    temp_path = temp_file.name
-
-                media = MediaFileUpload(temp_path, mimetype='text/plain', resumable=True)
-                file_metadata = self.service.files().create(media_body=media,
-                                                            body={'name': file_name, 'parents': [self.folder_id]}).execute()
-
-                os.unlink(temp_path)
-
-                self.service.permissions().create(fileId=file_metadata['id'],
-                                                body={'role': 'reader', 'type': 'anyone'}).execute()
-
-                shareable_link = f"https://drive.google.com/file/d/{file_metadata['id']}/view"
-                shareable_links.append(shareable_link)
-
-                self.elogger.info(f"Staged {file_name} with shareable link: {shareable_link}")
-
-            except Exception as e:
-                self.elogger.error(f"Error while staging file with extension {ext}. Error: {str(e)}")
+        for file_name, (_, error) in self.obj.executor.execute_batch(self.service, permission_requests).items():
+            if error:
+                self.elogger.error(f"Error while sharing {file_name}. Error: {str(error)}")
+                continue
+            shareable_link = f"https://drive.google.com/file/d/{uploaded[file_name]}/view"
+            shareable_links.append(shareable_link)
+            self.elogger.info(f"Staged {file_name} with shareable link: {shareable_link}")
 
         return shareable_links
 
@@ -93,7 +94,8 @@ class Emulation(BaseEmulation):
 
         try:
             self.elogger.info(f'Accessing staged files via shared links')
-            s = requests.Session()
+            # a session of its own for the cookies of the shared links, on the shared connection pool
+            s = self.obj.transport.mount(requests.Session())
             s.headers.update({'User-Agent': 'Simple Workspace ATT&CK Tool (SWAT)'})
             s.headers.update({'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'})
             s.headers.update({'Accept-Encoding': 'gzip, deflate, br'})
@@ -109,9 +111,7 @@ class Emulation(BaseEmulation):
                 with open(f"{self.artifacts_path}/file_{file_id}", 'wb') as f:
                     f.write(retrieved_file.content)
                 self.elogger.info(f"Downloaded file from {download_link}")
-                time.sleep(1)
-
-            s.close()
+                time.sleep(self.args.access_delay)
 
         except Exception as e:
             self.elogger.error(f"Error accessing or downloading files. Error: {str(e)}")
@@ -119,12 +119,15 @@ class Emulation(BaseEmulation):
     def cleanup(self) -> None:
         """Clean up staged files from Google Drive."""
         try:
-            results = self.service.files().list(q=f"'{self.folder_id}' in parents").execute()
-            files = results.get('files', [])
-
-            for file in files:
-                self.service.files().delete(fileId=file['id']).execute()
-                self.elogger.info(f"Deleted {file['name']} from Google Drive")
+            results = self.obj.executor.execute(self.service.files().list(q=f"'{self.folder_id}' in parents"))
+            files = {file['id']: file['name'] for file in results.get('files', [])}
+
+            delete_requests = {file_id: self.service.files().delete(fileId=file_id) for file_id in files}
+            for file_id, (_, error) in self.obj.executor.execute_batch(self.service, delete_requests).items():
+                if error:
+                    self.elogger.error(f"Error deleting {files[file_id]} from Google Drive. Error: {str(error)}")
+                else:
+                    self.elogger.info(f"Deleted {files[file_id]} from Google Drive")
 
             shutil.rmtree(self.artifacts_path)
             self.logger.info(f"Deleted local artifacts directory: {self.artifacts_path}")
@@ -19,12 +19,15 @@
 
 import base64
 import io
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from typing import Optional
 
-from googleapiclient.discovery import build
+from googleapiclient.discovery import Resource
 
 from swat.emulations.base_emulation import BaseEmulation
+from swat.utils import format_scopes
 
 
 class Emulation(BaseEmulation):
@@ -36,10 +39,13 @@ class Emulation(BaseEmulation):
     parser = BaseEmulation.load_parser(description='Sends a phishing email to a user with a HTML attachment.')
     parser.add_argument('session_key', default='default', help='Session to use for service building API service')
     parser.add_argument('--recipient', required=True, help='Recipient email address')
-    parser.add_argument('--sender', required=True, help='Sender email address')
+    parser.add_argument('--sender', help='Sender email address, required unless --senders is given')
     parser.add_argument('--subject', default='Phishing Test Email', help='Email subject')
     parser.add_argument('--attachment', default='swat_malicious', help='Attachment name')
     parser.add_argument('--js-file', help='Path to a file containing JS code. If not provided, default JS will be used.')
+    parser.add_argument('--senders', nargs='+',
+                        help='Users to send the email as, with domain-wide delegation of the service account session')
+    parser.add_argument('--workers', type=int, default=4, help='Number of senders sending concurrently')
 
     techniques = ['T1566.001', 'T1204.002']
     name = 'Send HTML with Embedded Javascript with Gmail'
@@ -50,7 +56,10 @@ class Emulation(BaseEmulation):
 
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
-        self.service = build('gmail', 'v1', credentials=self.obj.cred_store.store[self.args.session_key].session)
+        if not self.args.sender and not self.args.senders:
+            raise ValueError(f'--sender or --senders is required\n{self.parser.format_help()}')
+        # with --senders, each sender gets its own delegated service
+        self.service = None if self.args.senders else self.obj.build_service('gmail', 'v1', self.args.session_key)
 
     def create_html(self) -> io.BytesIO:
         """Create an HTML file with embedded javascript."""
@@ -80,8 +89,8 @@ class Emulation(BaseEmulation):
         self.elogger.info(f'Created HTML with embedded JS')
         return io.BytesIO(bytes(html_content, 'utf-8'))
 
-    def create_email(self, attachment: io.BytesIO) -> dict:
-        """Create the email."""
+    def create_email(self, attachment: io.BytesIO, sender: Optional[str] = None) -> dict:
+        """Create the email, from the sender argument unless another sender is given."""
 
         greeting = "Greetings,\n\n"
         content = "We're excited to share exclusive materials with you. \nPlease open the attached file for details.\n\n"
@@ -91,7 +100,7 @@ class Emulation(BaseEmulation):
         body = greeting + content + farewell + ps
         message = MIMEMultipart()
         message['to'] = self.args.recipient
-        message['from'] = self.args.sender
+        message['from'] = sender or self.args.sender
         message['subject'] = self.args.subject
         message.attach(MIMEText(body, 'plain'))
 
@@ -103,22 +112,37 @@ class Emulation(BaseEmulation):
         self.elogger.info(f'Created email and attached HTML')
         return {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode()}
 
-    def send_email(self, email: dict) -> None:
-        """Send the email."""
+    def send_email(self, email: dict, service: Optional[Resource] = None, sender: Optional[str] = None) -> None:
+        """Send the email, with the session service unless the service of another sender is given."""
 
         try:
-            self.service.users().messages().send(userId='me', body=email).execute()
-            self.elogger.info(f'Sent email to {self.args.recipient} from {self.args.sender}')
+            self.obj.executor.execute((service or self.service).users().messages().send(userId='me', body=email))
+            self.elogger.info(f'Sent email to {self.args.recipient} from {sender or self.args.sender}')
             self.elogger.info(f'Email subject: {self.args.subject}')
         except Exception as e:
             self.elogger.error(f"Failed to send the email due to: {e}")
 
+    def send_as(self, sender: str, attachment: io.BytesIO) -> None:
+        """Send the email as a user of the domain, with a delegated session of the service account."""
+
+        # errors are logged per sender, so a failed delegation does not hide the result of the other senders
+        try:
+            service = self.obj.build_service('gmail', 'v1', self.args.session_key, subject=sender,
+                                             scopes=format_scopes(['gmail.send']))
+            self.send_email(self.create_email(attachment, sender), service, sender)
+        except Exception as e:
+            self.elogger.error(f"Failed to send the email from {sender} due to: {e}")
+
     def execute(self) -> None:
         """Execute the emulation."""
 
         self.elogger.info(self.exec_str(self.parser.description))
         try:
             html_attachment = self.create_html()
+            if self.args.senders:
+                with ThreadPoolExecutor(max_workers=self.args.workers) as executor:
+                    list(executor.map(lambda sender: self.send_as(sender, html_attachment), self.args.senders))
+                return
             email = self.create_email(html_attachment)
             self.send_email(email)
         except Exception as e:
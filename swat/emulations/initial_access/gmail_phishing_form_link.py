@@ -4,7 +4,6 @@ import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
-from googleapiclient.discovery import build
 
 from swat.emulations.base_emulation import BaseEmulation
 
@@ -22,17 +21,17 @@ class Emulation(BaseEmulation):
 
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
-        self.forms_service = build('forms', 'v1', credentials=self.obj.cred_store.store[self.args.session_key].session)
-        self.gmail_service = build('gmail', 'v1', credentials=self.obj.cred_store.store[self.args.session_key].session)
+        self.forms_service = self.obj.build_service('forms', 'v1', self.args.session_key)
+        self.gmail_service = self.obj.build_service('gmail', 'v1', self.args.session_key)
 
     def create_google_form(self) -> str:
         """Create a Google Form with the given title, description, and questions."""
         form_info = {"info": {"title": self.econfig['form']['title']}}
-        form = self.forms_service.forms().create(body=form_info).execute()
-        self.forms_service.forms().batchUpdate(formId=form["formId"],
-                                               body=self.econfig['form']['make_quiz']).execute()
-        self.forms_service.forms().batchUpdate(formId=form["formId"],
-                                               body=self.econfig['form']['add_description']).execute()
+        form = self.obj.executor.execute(self.forms_service.forms().create(body=form_info))
+        self.obj.executor.execute(self.forms_service.forms().batchUpdate(
+            formId=form["formId"], body=self.econfig['form']['make_quiz']))
+        self.obj.executor.execute(self.forms_service.forms().batchUpdate(
+            formId=form["formId"], body=self.econfig['form']['add_description']))
         #self.forms_service.forms().batchUpdate(formId=form["formId"],
                                                #body=self.econfig['form']['questions']['first_name']).execute()
         #self.forms_service.forms().batchUpdate(formId=form["formId"],
@@ -61,7 +60,7 @@ class Emulation(BaseEmulation):
 
     def send_email(self, email: dict) -> None:
         """Send the email."""
-        self.gmail_service.users().messages().send(userId='me', body=email).execute()
+        self.obj.executor.execute(self.gmail_service.users().messages().send(userId='me', body=email))
         self.elogger.info(f'Sent email to {self.args.recipient} from {self.args.sender}')
 
     def execute(self) -> None:
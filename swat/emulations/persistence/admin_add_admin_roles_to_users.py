@@ -19,7 +19,6 @@
 
 from typing import Dict, List, Optional
 
-from googleapiclient.discovery import build
 
 from swat.emulations.base_emulation import BaseEmulation
 from swat.utils import generate_password
@@ -50,7 +49,7 @@ class Emulation(BaseEmulation):
 
         # session_key is the key used to store the credentials and session in the cred store
         # creds and session should be for the admin user
-        self.service = build('admin', 'directory_v1', credentials=self.obj.cred_store.store[self.args.session_key].session)
+        self.service = self.obj.build_service('admin', 'directory_v1', self.args.session_key)
 
         # override configuration settings if provided
         if self.args.username:
@@ -69,7 +68,7 @@ class Emulation(BaseEmulation):
         self.elogger.info(f"User password: {user_info['password']}")
 
         try:
-            user = self.service.users().insert(body=user_info).execute()
+            user = self.obj.executor.execute(self.service.users().insert(body=user_info))
             self.elogger.info(f"User created: {user['primaryEmail']}")
             return user
 
@@ -78,7 +77,7 @@ class Emulation(BaseEmulation):
                 self.elogger.info(f"already exists: {user_info['primaryEmail']}")
 
                 # Fetch the existing user's details
-                user = self.service.users().get(userKey=user_info['primaryEmail']).execute()
+                user = self.obj.executor.execute(self.service.users().get(userKey=user_info['primaryEmail']))
                 return user
 
             else:
@@ -92,29 +91,38 @@ class Emulation(BaseEmulation):
         if self.args.roles:
             # override configuration settings if provided via command line
             return self.econfig['roles']
-        results = self.service.roles().list(customer='my_customer').execute()
+        results = self.obj.executor.execute(self.service.roles().list(customer='my_customer'))
         admin_roles = [role['roleId'] for role in results.get('items', []) if 'admin' in role['roleName'].lower()]
         return admin_roles
 
     def assign_roles_to_user(self, user: Dict[str, str], roles: List[str]) -> None:
-        """Assign roles to the given user using configuration settings."""
+        """Assign roles to the given user using configuration settings, in batch requests."""
 
+        requests = {}
         for role in roles:
-            try:
-                body = {
-                    'assignedTo': user['id'],
-                    'roleId': role,
-                    'scopeType': 'CUSTOMER'
-                }
-                self.service.roleAssignments().insert(customer='my_customer', body=body).execute()
+            body = {
+                'assignedTo': user['id'],
+                'roleId': role,
+                'scopeType': 'CUSTOMER'
+            }
+            requests[role] = self.service.roleAssignments().insert(customer='my_customer', body=body)
+
+        try:
+            results = self.obj.executor.execute_batch(self.service, requests)
+        except Exception as e:
+            self.elogger.error(f"Error assigning roles to user {user['primaryEmail']}: {str(e)}")
+            return
+
+        for role, (_, error) in results.items():
+            if error:
+                self.elogger.error(f"Error assigning role {role} to user {user['primaryEmail']}: {str(error)}")
+            else:
                 self.elogger.info(f"Role {role} added to user {user['primaryEmail']}")
-            except Exception as e:
-                self.elogger.error(f"Error assigning role {role} to user {user['primaryEmail']}: {str(e)}")
 
     def cleanup(self, user: Dict[str, str]) -> None:
         """Cleanup function to delete the created user after the emulation."""
         try:
-            self.service.users().delete(userKey=user['primaryEmail']).execute()
+            self.obj.executor.execute(self.service.users().delete(userKey=user['primaryEmail']))
             self.elogger.info(f"User {user['primaryEmail']} deleted successfully!")
         except Exception as e:
             self.elogger.error(f"Error deleting user: {e}")
@@ -1,6 +1,5 @@
 from typing import Dict, List, Optional
 from swat.utils import generate_password
-from googleapiclient.discovery import build
 
 from swat.emulations.base_emulation import BaseEmulation
 
@@ -29,7 +28,7 @@ class Emulation(BaseEmulation):
 
     def __init__(self, **kwargs) -> None:
         super().__init__(**kwargs)
-        self.service = build('admin', 'directory_v1', credentials=self.obj.cred_store.store[self.args.session_key].session)
+        self.service = self.obj.build_service('admin', 'directory_v1', self.args.session_key)
 
         if self.args.username:
             self.econfig['user']['primaryEmail'] = kwargs['username']
@@ -41,16 +40,23 @@ class Emulation(BaseEmulation):
             self.econfig['role'] = kwargs['role']
 
     def add_user_to_groups(self, user: Dict[str, str], group_ids: List[str]) -> None:
-        """Add the specified user to the specified groups."""
-        for group_id in group_ids:
-            try:
-                body = {
-                    'email': user['primaryEmail']
-                }
-                self.service.members().insert(groupKey=group_id, body=body).execute()
+        """Add the specified user to the specified groups, in batch requests."""
+        body = {
+            'email': user['primaryEmail']
+        }
+        requests = {group_id: self.service.members().insert(groupKey=group_id, body=body) for group_id in group_ids}
+
+        try:
+            results = self.obj.executor.execute_batch(self.service, requests)
+        except Exception as e:
+            self.elogger.error(f"Error adding user {user['primaryEmail']} to groups: {str(e)}")
+            return
+
+        for group_id, (_, error) in results.items():
+            if error:
+                self.elogger.error(f"Error adding user {user['primaryEmail']} to group {group_id}: {str(error)}")
+            else:
                 self.elogger.info(f"User {user['primaryEmail']} added to group {group_id}")
-            except Exception as e:
-                self.elogger.error(f"Error adding user {user['primaryEmail']} to group {group_id}: {str(e)}")
 
     def assign_role_to_user(self, user: Dict[str, str], role_id: str) -> None:
         """Assign the specified role to the user."""
@@ -60,7 +66,7 @@ class Emulation(BaseEmulation):
                 'roleId': role_id,
                 'scopeType': 'CUSTOMER'
             }
-            self.service.roleAssignments().insert(customer='my_customer', body=body).execute()
+            self.obj.executor.execute(self.service.roleAssignments().insert(customer='my_customer', body=body))
             self.elogger.info(f"Role {role_id} assigned to user {user['primaryEmail']}")
         except Exception as e:
             self.elogger.error(f"Error assigning role {role_id} to user {user['primaryEmail']}: {str(e)}")
@@ -76,7 +82,7 @@ class Emulation(BaseEmulation):
             self.remove_role_from_user(user, self.args.role)
         # Delete user (optional, based on your needs)
         try:
-            self.service.users().delete(userKey=user['primaryEmail']).execute()
+            self.obj.executor.execute(self.service.users().delete(userKey=user['primaryEmail']))
             self.elogger.info(f"User {user['primaryEmail']} deleted successfully!")
         except Exception as e:
             self.elogger.error(f"Error deleting user: {e}")
@@ -90,7 +96,7 @@ class Emulation(BaseEmulation):
         self.elogger.info(f"User password: {user_info['password']}")
 
         try:
-            user = self.service.users().insert(body=user_info).execute()
+            user = self.obj.executor.execute(self.service.users().insert(body=user_info))
             self.elogger.info(f"User created: {user['primaryEmail']}")
             return user
 
@@ -99,7 +105,7 @@ class Emulation(BaseEmulation):
                 self.elogger.info(f"already exists: {user_info['primaryEmail']}")
 
                 # Fetch the existing user's details
-                user = self.service.users().get(userKey=user_info['primaryEmail']).execute()
+                user = self.obj.executor.execute(self.service.users().get(userKey=user_info['primaryEmail']))
                 return user
 
             else:
@@ -109,7 +115,7 @@ class Emulation(BaseEmulation):
     def remove_user_from_group(self, user: Dict[str, str], group_id: str) -> None:
         """Remove the specified user from the specified group."""
         try:
-            self.service.members().delete(groupKey=group_id, memberKey=user['primaryEmail']).execute()
+            self.obj.executor.execute(self.service.members().delete(groupKey=group_id, memberKey=user['primaryEmail']))
             self.elogger.info(f"User {user['primaryEmail']} removed from group {group_id}")
         except Exception as e:
             self.elogger.error(f"Error removing user {user['primaryEmail']} from group {group_id}: {str(e)}")
@@ -118,7 +124,7 @@ class Emulation(BaseEmulation):
         """Remove the specified role from the user."""
         try:
             # Fetch role assignment ID
-            assignments = self.service.roleAssignments().list(customer='my_customer', userKey=user['primaryEmail']).execute()
+            assignments = self.obj.executor.execute(self.service.roleAssignments().list(customer='my_customer', userKey=user['primaryEmail']))
             assignment_id = None
             for assignment in assignments.get('items', []):
                 if assignment['roleId'] == role_id:
@@ -129,7 +135,7 @@ class Emulation(BaseEmulation):
                 raise ValueError(f"No assignment found for role {role_id} for user {user['primaryEmail']}")
 
             # Remove the role
-            self.service.roleAssignments().delete(customer='my_customer', assignmentId=assignment_id).execute()
+            self.obj.executor.execute(self.service.roleAssignments().delete(customer='my_customer', assignmentId=assignment_id))
             self.elogger.info(f"Role {role_id} removed from user {user['primaryEmail']}")
         except Exception as e:
             self.elogger.error(f"Error removing role {role_id} from user {user['primaryEmail']}: {str(e)}")
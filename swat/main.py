@@ -18,10 +18,16 @@
 #
 
 import argparse
+import contextlib
+import json
 import logging
+import sys
+import time
 from pathlib import Path
 
 from . import utils
+from .base import SWAT
+from .batch import BatchRunner, parse_batch
 from .logger import configure_logging
 from .misc import colorful_exit_message
 from .shell import SWATShell
@@ -29,20 +35,54 @@ from .shell import SWATShell
 ROOT_DIR = Path(__file__).parent.parent.absolute()
 CONFIG: dict = utils.load_etc_file('config.yaml')
 
+
+def run_batch(args: argparse.Namespace) -> int:
+    """Run a batch of commands without the shell, printing or writing a JSON report, and return the exit code."""
+    text = sys.stdin.read() if args.batch == '-' else Path(args.batch).read_text()
+    commands = parse_batch(text)
+
+    obj = SWAT(CONFIG)
+    obj.config['google']['scopes'] = utils.format_scopes(obj.config['google']['scopes'])
+    runner = BatchRunner(obj, SWATShell.load_command, workers=args.workers)
+    start = time.perf_counter()
+    # without an output file, the report is the only thing printed to stdout and command output goes to stderr
+    with contextlib.redirect_stdout(sys.stdout if args.output else sys.stderr):
+        results = runner.run(commands)
+    report = runner.report(results, time.perf_counter() - start)
+
+    if obj.config['settings'].get('save_on_exit', False):
+        obj.cred_store.save()
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+    return 0 if report['status'] == 'succeeded' else 1
+
+
 def main():
     parser = argparse.ArgumentParser(description='SWAT CLI')
     parser.add_argument('--debug', action='store_true', help='Debug mode')
+    parser.add_argument('--batch', help='Run the commands of a script or JSON list ("-" for stdin) without the shell')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of batch commands run concurrently between auth, creds and scopes commands')
+    parser.add_argument('--output', help='Path to write the JSON batch report to, instead of stdout')
     args = parser.parse_args()
 
     level = logging.DEBUG if args.debug else logging.INFO
     configure_logging(CONFIG, level)
 
+    if args.batch:
+        sys.exit(run_batch(args))
+
     # Start the interactive shell
     shell = SWATShell(args)
 
     try:
         shell.cmdloop()
     finally:
+        if shell.obj.refresher:
+            shell.obj.refresher.stop()
         if shell.save_on_exit:
             shell.obj.cred_store.save()
         print(colorful_exit_message())
@@ -0,0 +1,172 @@
+#
+# Licensed to Elasticsearch under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Registry of commands and emulations, read from their source without importing them."""
+
+import ast
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+SWAT_DIR = Path(__file__).parent.absolute()
+COMMANDS_DIR = SWAT_DIR / 'commands'
+EMULATIONS_DIR = SWAT_DIR / 'emulations'
+MANIFEST_PATH = SWAT_DIR / 'etc' / 'registry.json'
+MANIFEST_VERSION = 1
+
+# class attributes of an emulation that are read statically
+EMULATION_ATTRIBUTES = ('name', 'techniques', 'scopes', 'services', 'description')
+
+
+@dataclass
+class EmulationInfo:
+    """Static metadata of an emulation."""
+
+    command: str
+    dotted_path: str
+    tactic: str
+    name: Optional[str] = None
+    techniques: list[str] = field(default_factory=list)
+    scopes: list[str] = field(default_factory=list)
+    services: list[str] = field(default_factory=list)
+    description: Optional[str] = None
+    parser_description: Optional[str] = None
+
+
+def get_parser_description(node: ast.AST) -> Optional[str]:
+    """Return the literal description passed to a load_parser call."""
+    if isinstance(node, ast.Call) and getattr(node.func, 'attr', None) == 'load_parser':
+        for keyword in node.keywords:
+            if keyword.arg == 'description' and isinstance(keyword.value, ast.Constant):
+                return keyword.value.value
+
+
+def parse_emulation(path: Path) -> Optional[dict]:
+    """Return the literal class attributes of the Emulation class of a module, or None if it has none."""
+    tree = ast.parse(path.read_text(), filename=str(path))
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name == 'Emulation':
+            break
+    else:
+        return
+
+    attributes = {}
+    for statement in node.body:
+        if not isinstance(statement, ast.Assign) or len(statement.targets) != 1:
+            continue
+        target = getattr(statement.targets[0], 'id', None)
+        if target == 'parser':
+            attributes['parser_description'] = get_parser_description(statement.value)
+        elif target in EMULATION_ATTRIBUTES:
+            try:
+                attributes[target] = ast.literal_eval(statement.value)
+            except ValueError:
+                logging.debug(f'Skipping non-literal attribute {target} of {path}')
+    return attributes
+
+
+def get_command_files() -> list[Path]:
+    """Return the command modules."""
+    return [p for p in COMMANDS_DIR.rglob('*.py') if not p.name.startswith('_') and p.name != 'base_command.py']
+
+
+def get_emulation_files() -> list[Path]:
+    """Return the emulation modules, which live in a tactic directory."""
+    return [p for p in EMULATIONS_DIR.rglob('*.py') if not p.name.startswith('_') and p.parent != EMULATIONS_DIR]
+
+
+@dataclass
+class Registry:
+    """Commands and emulations by name, built without importing their modules."""
+
+    commands: dict[str, str] = field(default_factory=dict)
+    emulations: dict[str, EmulationInfo] = field(default_factory=dict)
+    ambiguous: set[str] = field(default_factory=set)
+
+    @classmethod
+    def build(cls, manifest_path: Optional[Path] = None) -> 'Registry':
+        """
+        Build the registry, only parsing the emulations changed since the manifest was saved.
+
+        Parameters:
+            manifest_path (Path): The manifest of parsed emulations, keyed by file mtime. None disables it.
+
+        Returns:
+            Registry: The registry.
+        """
+        registry = cls()
+        for path in get_command_files():
+            registry.commands[path.stem] = str(path.relative_to(COMMANDS_DIR).with_suffix('')).replace(os.sep, '.')
+
+        manifest = load_manifest(manifest_path) if manifest_path else {}
+        entries = {}
+        for path in get_emulation_files():
+            key = str(path.relative_to(EMULATIONS_DIR))
+            mtime = path.stat().st_mtime
+            entry = manifest.get(key)
+            if not entry or entry['mtime'] != mtime:
+                attributes = parse_emulation(path)
+                entry = {'mtime': mtime, 'attributes': attributes}
+            entries[key] = entry
+            if entry['attributes'] is None:
+                continue
+
+            dotted_path = key[:-3].replace(os.sep, '.')
+            if path.stem in registry.emulations:
+                registry.ambiguous.add(path.stem)
+            registry.emulations[path.stem] = EmulationInfo(command=path.stem, dotted_path=dotted_path,
+                                                           tactic=path.parent.name, **entry['attributes'])
+
+        if manifest_path and entries != manifest:
+            save_manifest(manifest_path, entries)
+        return registry
+
+    def get_dotted_emulation_path(self, name: str) -> str:
+        """Return the dotted path of an emulation module, relative to the emulations package."""
+        assert name not in self.ambiguous, f'Error: Ambiguous command "{name}" more than one found with that name'
+        return self.emulations[name].dotted_path
+
+
+def load_manifest(path: Path) -> dict:
+    """Load the saved manifest, returning an empty one if it is missing, stale or unreadable."""
+    try:
+        manifest = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return manifest.get('files', {}) if manifest.get('version') == MANIFEST_VERSION else {}
+
+
+def save_manifest(path: Path, entries: dict) -> None:
+    """Save the manifest atomically, ignoring read only installs."""
+    tmp_path = path.with_suffix('.tmp')
+    try:
+        tmp_path.write_text(json.dumps({'version': MANIFEST_VERSION, 'files': entries}))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.debug(f'Unable to save registry manifest {path}: {e}')
+
+
+@lru_cache(maxsize=None)
+def get_registry() -> Registry:
+    """Return the registry, built once per process."""
+    return Registry.build(MANIFEST_PATH)
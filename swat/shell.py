@@ -30,6 +30,7 @@ from .base import SWAT
 from .commands.base_command import BaseCommand
 from .commands.emulate import Command as EmulateCommand
 from .misc import CustomHelpFormatter, colorful_swat
+from .registry import get_registry
 from .utils import clear_terminal, format_scopes
 
 ROOT_DIR = Path(__file__).parent.parent.absolute()
@@ -68,6 +69,8 @@ class SWATShell(cmd.Cmd):
         self._new_args = None
 
         self.save_on_exit = self.obj.config['settings'].get('save_on_exit', False)
+        if self.obj.refresher:
+            self.obj.refresher.start()
 
         self._registered_commands = self._register_commands()
 
@@ -82,15 +85,13 @@ class SWATShell(cmd.Cmd):
     @staticmethod
     def get_commands() -> list[str]:
         """Return a list of possible commands."""
-        commands = [c.stem for c in COMMANDS_DIR.rglob('*.py') if not c.name.startswith('_') and
-                    not c.name in ('base_command.py',)]
-        return commands
+        return list(get_registry().commands)
 
     @staticmethod
     def load_command(name: str) -> Optional[Type[T]]:
         """Dynamically import a command module."""
         try:
-            command_module = importlib.import_module(f'swat.commands.{name}')
+            command_module = importlib.import_module(f'swat.commands.{get_registry().commands.get(name, name)}')
             command_class = getattr(command_module, 'Command')
         except (ImportError, AttributeError, ValueError, AssertionError) as e:
             logging.error(f'{e}')
@@ -212,6 +213,9 @@ class SWATShell(cmd.Cmd):
             command.execute()
         except Exception as e:
             logging.error(f'Error: {e}')
+        finally:
+            if self.obj.executor.stats:
+                logging.debug(f'API requests: {self.obj.executor.summary()}')
 
     @staticmethod
     def do_clear(arg: str) -> None:
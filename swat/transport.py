@@ -0,0 +1,141 @@
+#
+# Licensed to Elasticsearch under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+"""Shared, connection pooled HTTP transport."""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Optional
+
+import httplib2
+import requests
+from google.auth.credentials import Credentials
+from google.auth.exceptions import TransportError
+from google.auth.transport.requests import AuthorizedSession, Request
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = 'Simple Workspace ATT&CK Tool (SWAT)'
+
+
+def enable_http2() -> bool:
+    """Enable HTTP/2 for every urllib3 connection in the process, returning a boolean indicating if it is available."""
+    try:
+        import h2  # noqa: F401
+        from urllib3 import http2
+    except ImportError:
+        return False
+    http2.inject_into_urllib3()
+    return True
+
+
+class AuthorizedHttp:
+    """httplib2 compatible wrapper of an authorized requests session, used as the http of googleapiclient services."""
+
+    def __init__(self, session: AuthorizedSession, timeout: Optional[float] = None) -> None:
+        self.session = session
+        self.timeout = timeout
+
+    @property
+    def credentials(self) -> Credentials:
+        """Return the credentials of the session, used by googleapiclient to authorize batch requests."""
+        return self.session.credentials
+
+    def request(self, uri: str, method: str = 'GET', body=None, headers: Optional[dict] = None,
+                redirections: int = 5, connection_type=None) -> tuple[httplib2.Response, bytes]:
+        """
+        Send a request, returning the response and content as httplib2 does. Connection errors and timeouts are raised
+        as the builtin ConnectionError and TimeoutError, which the request executor retries.
+        """
+        try:
+            response = self.session.request(method, uri, data=body, headers=headers, timeout=self.timeout)
+        except requests.exceptions.Timeout as e:
+            raise TimeoutError(str(e)) from e
+        except (requests.exceptions.ConnectionError, TransportError) as e:
+            raise ConnectionError(str(e)) from e
+        info = {k.lower(): v for k, v in response.headers.items()}
+        info['status'] = str(response.status_code)
+        # requests already decoded the content
+        info.pop('content-encoding', None)
+        return httplib2.Response(info), response.content
+
+
+@dataclass
+class Transport:
+    """
+    Connection pool shared by the Google API clients and raw HTTP requests. With ``pool_block``, requests beyond
+    ``pool_size`` concurrent connections to a host wait for one to be returned, rather than opening connections that
+    are discarded afterwards, as workers of commands, campaigns and batches share the pool.
+    """
+
+    pool_size: int = 10
+    timeout: Optional[float] = 60
+    http2: bool = False
+    pool_block: bool = True
+    adapter: HTTPAdapter = field(init=False, repr=False)
+    session: requests.Session = field(init=False, repr=False)
+
+    def __post_init__(self):
+        if self.http2 and not enable_http2():
+            logging.warning('HTTP/2 requires urllib3 2.3 or later and the h2 package, using HTTP/1.1.')
+        self.adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                                   pool_block=self.pool_block)
+        self.session = self.mount(requests.Session())
+        self.session.headers['User-Agent'] = USER_AGENT
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'Transport':
+        """Build the transport from the "http" settings of the SWAT config."""
+        settings = config.get('settings', {}).get('http') or {}
+        return cls(**{k: v for k, v in settings.items() if k in ('pool_size', 'timeout', 'http2', 'pool_block')})
+
+    def mount(self, session: requests.Session) -> requests.Session:
+        """Mount the shared connection pool on a session."""
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        return session
+
+    def authorized_http(self, credentials: Credentials) -> AuthorizedHttp:
+        """Return an http for googleapiclient, authorized with the credentials and using the shared pool."""
+        auth_request = Request(self.session)
+        return AuthorizedHttp(self.mount(AuthorizedSession(credentials, auth_request=auth_request)), self.timeout)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Send a GET request through the shared pool."""
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_default_transport: Optional[Transport] = None
+
+
+def get_transport() -> Transport:
+    """Return the transport of the process, for code without access to the SWAT object."""
+    global _default_transport
+    if _default_transport is None:
+        _default_transport = Transport()
+    return _default_transport
+
+
+def set_transport(transport: Transport) -> None:
+    """Set the transport of the process."""
+    global _default_transport
+    _default_transport = transport
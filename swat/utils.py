@@ -27,13 +27,13 @@ import sys
 import zipfile
 from pathlib import Path
 from textwrap import wrap
-from typing import List, Optional, Union
+from typing import TYPE_CHECKING, List, Optional, Union
 
-import requests
 import yaml
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from tabulate import tabulate
+
+if TYPE_CHECKING:
+    # selenium is slow to import and only needed by emulations driving a browser
+    from selenium import webdriver
 
 ROOT_DIR = Path(__file__).parent.parent.absolute()
 ETC_DIR = ROOT_DIR / 'swat' / 'etc'
@@ -78,6 +78,7 @@ def load_subparsers(parser: argparse.ArgumentParser, dest: str = 'subcommand') -
 
 def render_table(data: List[str], headers: List[str], table_format="fancy_grid", max_width=30):
     """Renders a table from the provided data and headers, wrapping text if it exceeds max_width."""
+    from tabulate import tabulate
 
     def wrap_text(text):
         '''Wrap text if it exceeds max_width.'''
@@ -90,11 +91,13 @@ def render_table(data: List[str], headers: List[str], table_format="fancy_grid",
 
 def download_chromedriver(destination_path: Path) -> Path:
     """Download the appropriate ChromeDriver for the system and return its path."""
+    from .transport import get_transport
+
     base_url = "https://chromedriver.storage.googleapis.com/"
     latest_version_url = f"{base_url}LATEST_RELEASE"
 
     # Get the latest ChromeDriver version
-    response = requests.get(latest_version_url)
+    response = get_transport().get(latest_version_url)
     version = response.text
 
     # Determine OS
@@ -110,7 +113,7 @@ def download_chromedriver(destination_path: Path) -> Path:
 
     # Download ChromeDriver
     url = f"{base_url}{version}/chromedriver_{suffix}"
-    response = requests.get(url)
+    response = get_transport().get(url)
 
     # Write the downloaded content as a zip file
     zip_path = ETC_DIR / f"chromedriver_{suffix}"
@@ -131,8 +134,11 @@ def download_chromedriver(destination_path: Path) -> Path:
 
     return destination_path / 'chromedriver'
 
-def get_chromedriver(chromedriver_path: Optional[Path] = None) -> webdriver.Chrome:
+def get_chromedriver(chromedriver_path: Optional[Path] = None) -> 'webdriver.Chrome':
     """Return a Chrome WebDriver instance, downloading ChromeDriver if necessary."""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
     chromedriver_path = chromedriver_path or ETC_DIR / 'chromedriver'
 
     if not chromedriver_path.exists():
@@ -0,0 +1,52 @@
+"""
+Benchmark flattening of audit activities, in events per second.
+
+Usage: poetry run python tests/bench_audit_flatten.py [--events N] [--parameters N] [--repeat N]
+"""
+
+import argparse
+import copy
+import time
+
+from test_audit import legacy_flatten_activities, make_activity, make_command
+
+
+def build_page(events: int, parameters: int) -> list:
+    """Build a page of login activities with the given number of parameters per event."""
+    activities = [make_activity(i % 60) for i in range(events)]
+    for activity in activities:
+        activity['events'][0]['parameters'].extend(
+            {'name': f'parameter_{n}', 'value': f'value_{n}'} for n in range(parameters)
+        )
+    return activities
+
+
+def events_per_second(flatten, activities: list, repeat: int) -> float:
+    """Return the best events per second of the flatten function over the repeats."""
+    best = float('inf')
+    for _ in range(repeat):
+        # the legacy flattener consumes its input, so copy it outside of the timed section
+        page = copy.deepcopy(activities)
+        start = time.perf_counter()
+        flatten(page)
+        best = min(best, time.perf_counter() - start)
+    return len(activities) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark audit activity flattening.')
+    parser.add_argument('--events', type=int, default=50000, help='Number of events to flatten')
+    parser.add_argument('--parameters', type=int, default=10, help='Number of extra parameters per event')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs, the best is reported')
+    args = parser.parse_args()
+
+    activities = build_page(args.events, args.parameters)
+    legacy = events_per_second(legacy_flatten_activities, activities, args.repeat)
+    current = events_per_second(make_command([]).flatten_activities, activities, args.repeat)
+
+    print(f'legacy:  {legacy:,.0f} events/sec')
+    print(f'current: {current:,.0f} events/sec ({current / legacy:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import httplib2
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.errors import HttpError
+
+from swat.api import BATCH_LIMITS, RequestExecutor, TokenBucket, get_api, is_retryable, load_discovery_document
+from swat.base import SWAT, CredStore
+
+
+def make_error(status: int, content: bytes = b'{}', **headers) -> HttpError:
+    return HttpError(httplib2.Response({'status': status, **headers}), content)
+
+
+class FlakyRequest:
+
+    methodId = 'directory.users.insert'
+
+    def __init__(self, errors: list) -> None:
+        self.errors = errors
+        self.calls = 0
+
+    def execute(self) -> dict:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'id': 'user'}
+
+
+class TestRequestExecutor:
+    """Test retries and rate limiting of API requests."""
+
+    @pytest.fixture(autouse=True)
+    def no_sleep(self, monkeypatch):
+        self.sleeps = []
+        monkeypatch.setattr('swat.api.time.sleep', self.sleeps.append)
+
+    def test_retries_transient_errors(self):
+        executor = RequestExecutor(quotas={})
+        request = FlakyRequest([make_error(503), make_error(429, **{'retry-after': '7'})])
+        assert executor.execute(request) == {'id': 'user'}
+        assert request.calls == 3
+        assert self.sleeps[1] == 7
+        assert executor.stats['directory'] == {'requests': 3, 'retries': 2}
+
+    def test_gives_up(self):
+        executor = RequestExecutor(quotas={}, retries=1)
+        request = FlakyRequest([make_error(500), make_error(500)])
+        with pytest.raises(HttpError):
+            executor.execute(request)
+        assert executor.stats['directory']['failures'] == 1
+
+    def test_permission_error_not_retried(self):
+        executor = RequestExecutor(quotas={})
+        request = FlakyRequest([make_error(403, b'{"error": {"message": "Forbidden", "errors": []}}')])
+        with pytest.raises(HttpError):
+            executor.execute(request)
+        assert request.calls == 1
+
+    def test_quota_error_retried(self):
+        content = b'{"error": {"message": "Quota", "errors": [{"reason": "userRateLimitExceeded"}]}}'
+        assert is_retryable(make_error(403, content))
+
+    def test_rate_limited(self):
+        executor = RequestExecutor(quotas={'directory': 60})
+        for _ in range(3):
+            executor.execute(FlakyRequest([]))
+        # one request per second with a burst of one, sleeping is mocked so the second wait queues behind the first
+        assert self.sleeps == pytest.approx([1, 2], abs=0.05)
+        assert executor.stats['directory']['throttled'] == 2
+
+    def test_token_bucket_reserves(self):
+        bucket = TokenBucket.per_minute(120)
+        assert bucket.acquire() == 0 and bucket.acquire() == 0
+        assert bucket.acquire() == pytest.approx(0.5, abs=0.05)
+
+    def test_from_config(self):
+        executor = RequestExecutor.from_config({'settings': {'api': {'retries': 2, 'quotas': {'drive': 60}}}})
+        assert executor.retries == 2 and executor.quotas['drive'] == 60 and executor.quotas['reports'] == 2400
+        assert get_api(FlakyRequest([])) == 'directory' and get_api(object()) == 'default'
+
+
+class TestServices:
+    """Test building Google API services from cached discovery documents."""
+
+    def test_discovery_cache(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('swat.api.DISCOVERY_DIR', tmp_path)
+        monkeypatch.setattr('swat.api.get_static_doc', lambda api, version: None)
+        (tmp_path / 'example.v1.json').write_text('{"name": "example"}')
+        load_discovery_document.cache_clear()
+        try:
+            assert load_discovery_document('example', 'v1') == '{"name": "example"}'
+        finally:
+            load_discovery_document.cache_clear()
+
+    def test_build_service_memoized(self, tmp_path):
+        obj = SWAT({}, cred_store=CredStore(path=tmp_path / 'store.pkl'))
+        obj.cred_store.add('default', session=AnonymousCredentials())
+        service = obj.build_service('admin', 'directory_v1')
+        assert obj.build_service('admin', 'directory_v1') is service
+        assert obj.build_service('admin', 'directory_v1', memoize=False) is not service
+
+        # a new session for the key rebuilds the service
+        obj.cred_store.add('default', session=AnonymousCredentials(), override=True)
+        assert obj.build_service('admin', 'directory_v1') is not service
+
+
+class FakeBatch:
+
+    def __init__(self, service, callback) -> None:
+        self.service = service
+        self.callback = callback
+        self.requests = {}
+
+    def add(self, request, request_id: str) -> None:
+        self.requests[request_id] = request
+
+    def execute(self) -> None:
+        self.service.batches.append(list(self.requests))
+        for request_id, request in self.requests.items():
+            try:
+                self.callback(request_id, request.execute(), None)
+            except HttpError as err:
+                self.callback(request_id, None, err)
+
+
+class FakeBatchService:
+
+    def __init__(self) -> None:
+        self.batches = []
+
+    def new_batch_http_request(self, callback) -> FakeBatch:
+        return FakeBatch(self, callback)
+
+
+class TestBatchRequests:
+    """Test batched execution of API requests."""
+
+    @pytest.fixture(autouse=True)
+    def no_sleep(self, monkeypatch):
+        monkeypatch.setattr('swat.api.time.sleep', lambda _: None)
+
+    def test_chunked_to_limit(self, monkeypatch):
+        monkeypatch.setitem(BATCH_LIMITS, 'directory', 2)
+        service = FakeBatchService()
+        results = RequestExecutor(quotas={}).execute_batch(service, {str(i): FlakyRequest([]) for i in range(5)})
+        assert [len(batch) for batch in service.batches] == [2, 2, 1]
+        assert all(response == {'id': 'user'} and error is None for response, error in results.values())
+
+    def test_retries_failed_items(self):
+        service = FakeBatchService()
+        requests = {'ok': FlakyRequest([]), 'flaky': FlakyRequest([make_error(503)]), 'denied': FlakyRequest(
+            [make_error(404)])}
+        executor = RequestExecutor(quotas={})
+        results = executor.execute_batch(service, requests)
+        assert service.batches == [['ok', 'flaky', 'denied'], ['flaky']]
+        assert results['flaky'] == ({'id': 'user'}, None)
+        assert results['denied'][1].status_code == 404
+        assert executor.stats['directory']['retries'] == 1 and executor.stats['directory']['failures'] == 1
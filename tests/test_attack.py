@@ -0,0 +1,170 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from swat.attack import (AttackIndex, download_attack_data, iter_bundle_objects, load_attack_data,
+                         load_attack_index, load_attack_version)
+
+
+def make_technique(technique_id: str, name: str, tactics: list[str]) -> dict:
+    return {
+        'type': 'attack-pattern',
+        'name': name,
+        'description': f'{name} description. More details.',
+        'external_references': [
+            {'source_name': 'capec', 'external_id': 'CAPEC-1'},
+            {'source_name': 'mitre-attack', 'external_id': technique_id},
+        ],
+        'kill_chain_phases': [{'kill_chain_name': 'mitre-attack', 'phase_name': tactic} for tactic in tactics],
+    }
+
+
+@pytest.fixture
+def bundle() -> dict:
+    objects = [
+        {'type': 'x-mitre-tactic', 'name': 'Persistence'},
+        make_technique('T1098', 'Account Manipulation', ['persistence', 'privilege-escalation']),
+        make_technique('T1098.003', 'Additional Cloud Roles', ['persistence']),
+        make_technique('T1098', 'Duplicate', ['persistence']),
+        {'type': 'attack-pattern', 'name': 'No ID'},
+    ]
+    return {'version': '14.1.0', 'data': {'objects': objects}}
+
+
+class TestAttackIndex:
+    """Test the ATT&CK technique index."""
+
+    def test_techniques(self, bundle):
+        index = AttackIndex.from_bundle(bundle)
+        assert index.version == '14.1.0'
+        assert set(index.techniques) == {'T1098', 'T1098.003'}
+        assert index.get('T1098') == {'id': 'T1098', 'name': 'Account Manipulation',
+                                      'description': 'Account Manipulation description',
+                                      'tactics': ['persistence', 'privilege-escalation']}
+        assert index.get('T9999') is None
+
+    def test_tactics_and_parents(self, bundle):
+        index = AttackIndex.from_bundle(bundle)
+        assert index.get_tactic_techniques('persistence') == ['T1098', 'T1098.003']
+        assert index.get_tactic_techniques('privilege-escalation') == ['T1098']
+        assert index.get_parent('T1098.003') == 'T1098' and index.get_parent('T1098') is None
+
+    def test_save_and_load(self, bundle, tmp_path):
+        index = AttackIndex.from_bundle(bundle)
+        index.save(tmp_path / 'index.sqlite')
+        assert AttackIndex.from_file(tmp_path / 'index.sqlite') == index
+
+    def test_streamed_objects(self, bundle):
+        data = json.dumps({'type': 'bundle', 'id': 'bundle--1', **bundle['data']}, indent=1).encode()
+        for size in (1, 7, len(data)):
+            chunks = (data[i:i + size] for i in range(0, len(data), size))
+            assert list(iter_bundle_objects(chunks)) == bundle['data']['objects']
+
+    def test_truncated_stream(self, bundle):
+        data = json.dumps(bundle['data']).encode()
+        with pytest.raises(ValueError):
+            list(iter_bundle_objects([data[:-10]]))
+
+    def test_index_rebuilt_when_outdated(self, bundle, tmp_path, monkeypatch):
+        bundle_path, index_path = tmp_path / 'attack.json.gz', tmp_path / 'index.sqlite'
+        monkeypatch.setattr('swat.attack.ATTACK_PATH', bundle_path)
+        monkeypatch.setattr('swat.attack.ATTACK_INDEX_PATH', index_path)
+        monkeypatch.setattr('swat.attack.load_attack_data', lambda: bundle)
+        bundle_path.write_bytes(gzip.compress(json.dumps(bundle).encode()))
+
+        load_attack_index.cache_clear()
+        try:
+            assert load_attack_index().version == '14.1.0' and index_path.exists()
+            load_attack_index.cache_clear()
+            # the full bundle is not loaded once the index is up to date
+            monkeypatch.setattr('swat.attack.load_attack_data', lambda: pytest.fail('bundle loaded'))
+            assert load_attack_index().get('T1098.003')['name'] == 'Additional Cloud Roles'
+        finally:
+            load_attack_index.cache_clear()
+
+
+class AttackHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    bundle = b''
+    requests = []
+    # bytes of the bundle promised but never sent, breaking the download midway
+    missing = 0
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/tags':
+            etag, body = '"tags-1"', json.dumps([{'name': 'ATT&CK-v14.1'}, {'name': 'ATT&CK-v9.0'}]).encode()
+        else:
+            etag, body = '"bundle-1"', self.bundle
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        missing = self.missing if self.path != '/tags' else 0
+        self.send_header('Content-Length', str(len(body) + missing))
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = bool(missing)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAttackRefresh:
+    """Test refreshing the ATT&CK data against a local stand-in for GitHub."""
+
+    @pytest.fixture
+    def server(self, bundle, tmp_path, monkeypatch):
+        AttackHandler.bundle = json.dumps(bundle['data']).encode()
+        AttackHandler.requests = []
+        AttackHandler.missing = 0
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), AttackHandler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{httpd.server_address[1]}'
+        monkeypatch.setattr('swat.attack.ATTACK_TAGS_URL', f'{url}/tags')
+        monkeypatch.setattr('swat.attack.ATTACK_DOWNLOAD_URL', url + '/{release}/enterprise-attack.json')
+        for name, file in [('ATTACK_PATH', 'attack.json.gz'), ('ATTACK_INDEX_PATH', 'index.sqlite'),
+                           ('ATTACK_VERSION_PATH', 'version.json')]:
+            monkeypatch.setattr(f'swat.attack.{name}', tmp_path / file)
+        load_attack_data.cache_clear()
+        load_attack_index.cache_clear()
+        yield url
+        httpd.shutdown()
+        httpd.server_close()
+        load_attack_data.cache_clear()
+        load_attack_index.cache_clear()
+
+    def test_refresh(self, server, bundle):
+        assert download_attack_data() == '14.1.0'
+        assert load_attack_data() == {'version': '14.1.0', 'data': bundle['data']}
+        assert load_attack_index().get('T1098')['name'] == 'Account Manipulation'
+        assert load_attack_version()['release'] == 'ATT&CK-v14.1'
+        assert [path for path, _ in AttackHandler.requests] == ['/tags', '/ATT&CK-v14.1/enterprise-attack.json']
+
+    def test_refresh_builds_index_once(self, server, monkeypatch):
+        def fail():
+            raise AssertionError('bundle parsed again')
+
+        fail.cache_clear = lambda: None
+        monkeypatch.setattr('swat.attack.load_attack_data', fail)
+        assert load_attack_index().get('T1098')['name'] == 'Account Manipulation'
+        assert load_attack_version()['version'] == '14.1.0'
+
+    def test_refresh_not_modified(self, server):
+        download_attack_data()
+        AttackHandler.requests = []
+        assert download_attack_data() is None
+        assert AttackHandler.requests == [('/tags', '"tags-1"')]
+
+    def test_failed_download_cleaned_up(self, server, tmp_path):
+        AttackHandler.missing = 100
+        with pytest.raises(requests.exceptions.RequestException):
+            download_attack_data()
+        assert not (tmp_path / 'attack.json.tmp').exists() and not (tmp_path / 'attack.json.gz').exists()
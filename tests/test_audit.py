@@ -0,0 +1,638 @@
+import argparse
+import copy
+import gzip
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httplib2
+import pandas as pd
+import pytest
+from googleapiclient.errors import HttpError
+
+from swat.api import RequestExecutor
+from swat.audit_store import AuditState, EventCache, ExportWriter, get_event_store_path, to_rfc3339
+from swat.commands.audit import (APPLICATIONS, Command as audit_command, Filters, match_columns, merge_frames,
+                                 prefetch, split_time_range)
+
+
+def make_activity(index: int, application: str = 'login', time: str = None) -> dict:
+    """Build a raw Reports API activity."""
+    return {
+        'kind': 'admin#reports#activity',
+        'id': {
+            'time': time or f'2023-10-01T00:00:{index:02d}.000Z',
+            'uniqueQualifier': str(index),
+            'applicationName': application,
+            'customerId': 'C0',
+        },
+        'etag': f'etag-{index}',
+        'actor': {'email': f'user{index % 2}@example.com', 'profileId': str(index)},
+        'ipAddress': '10.0.0.1',
+        'events': [
+            {
+                'type': 'login',
+                'name': 'login_success' if index % 2 else 'login_failure',
+                'parameters': [
+                    {'name': 'login_type', 'value': 'google_password'},
+                    {'name': 'is_suspicious', 'boolValue': False},
+                ],
+            },
+        ],
+    }
+
+
+def legacy_flatten_activities(activities: list) -> pd.DataFrame:
+    """Reference per-event flattening the batched flattener must match, consumes the activities."""
+    flatten_json = make_command([]).flatten_json
+    flattened_data = []
+    for activity in activities:
+        events = activity.pop('events')
+        for event in events:
+            if 'parameters' in event:
+                parameters_dict = {item.get('name'): item.get('value') for item in event.pop('parameters')}
+                event = {**event, **parameters_dict}
+            flattened_data.append({**activity, **flatten_json(event)})
+    return pd.DataFrame(flattened_data)
+
+
+class FakeRequest:
+
+    def __init__(self, pages: list, index: int = 0, **params) -> None:
+        self.pages = pages
+        self.index = index
+        self.params = params
+
+    def execute(self) -> dict:
+        return {'items': self.pages[self.index]}
+
+
+class FakeActivities:
+
+    def __init__(self, pages: list) -> None:
+        self.pages = pages
+        self.requests = []
+
+    def list(self, **params) -> FakeRequest:
+        request = FakeRequest(self.pages, **params)
+        self.requests.append(request)
+        return request
+
+    def list_next(self, request: FakeRequest, result: dict):
+        if request.index + 1 >= len(request.pages):
+            return None
+        return FakeRequest(request.pages, request.index + 1, **request.params)
+
+
+class FakeService:
+
+    def __init__(self, pages: list) -> None:
+        self._activities = FakeActivities(pages)
+
+    def activities(self) -> FakeActivities:
+        return self._activities
+
+
+def make_command(pages: list, **args) -> audit_command:
+    """Build an audit command without authenticating."""
+    command = audit_command.__new__(audit_command)
+    command.logger = logging.getLogger(__name__)
+    command.obj = argparse.Namespace(config={'google': {'audit': {'columns': ['name', 'actor', 'login']}}},
+                                     executor=RequestExecutor(quotas={}))
+    command.service = FakeService(pages)
+    defaults = dict(application='login', duration='1h', columns=None, export=False, export_format='csv',
+                    filters={}, interactive=False, stream=False, slices=1, workers=4, retries=3,
+                    incremental=False, cache=False, export_path=None, export_compression=None,
+                    export_max_size=None)
+    command.args = argparse.Namespace(**{**defaults, **args})
+    command.setup_applications()
+    command.duration = command.args.duration
+    command.state = None
+    command.cache = None
+    command.setup_filters()
+    return command
+
+
+class TestAuditStreaming:
+    """Test page by page processing of audit data."""
+
+    @property
+    def pages(self) -> list:
+        return [[make_activity(i) for i in range(3)], [], [make_activity(i) for i in range(3, 5)]]
+
+    def test_iter_frames_per_page(self):
+        frames = list(make_command(self.pages).iter_frames())
+        assert [len(f) for f in frames] == [3, 2]
+
+    def test_fetch_data_matches_pages(self):
+        df = make_command(self.pages).fetch_data()
+        assert len(df) == 5
+        assert list(df['etag']) == [f'etag-{i}' for i in range(5)]
+
+    def test_filters_applied_per_page(self):
+        df = make_command(self.pages, filters={'type': 'login', 'etag': 'etag-3'}).fetch_data()
+        assert list(df['etag']) == ['etag-3']
+
+    def test_missing_filter_column(self):
+        assert make_command(self.pages, filters={'missing': 'value'}).fetch_data() is None
+
+    @pytest.mark.parametrize('export_format', ['csv', 'ndjson'])
+    def test_stream_export(self, tmp_path, monkeypatch, export_format):
+        monkeypatch.setattr('swat.commands.audit.ROOT_DIR', tmp_path)
+        command = make_command(self.pages, export=True, export_format=export_format, stream=True)
+        command.stream_results()
+
+        if export_format == 'csv':
+            exported = pd.read_csv(command.export_path)
+        else:
+            exported = pd.read_json(command.export_path, lines=True)
+        assert len(exported) == 5
+
+
+class TestAuditTimeSlices:
+    """Test concurrent time sliced fetching of audit data."""
+
+    def test_split_time_range(self):
+        start, end = pd.Timestamp('2023-10-01', tz='UTC'), pd.Timestamp('2023-10-05', tz='UTC')
+        slices = split_time_range(start, end, 4)
+        assert len(slices) == 4
+        assert slices[0][1] == end and slices[-1][0] == start
+        for newer, older in zip(slices, slices[1:]):
+            assert older[1] < newer[0]
+            assert newer[0] - older[1] == pd.Timedelta(milliseconds=1)
+
+    def test_sliced_fetch_ordered(self, monkeypatch):
+        command = make_command([], slices=3, workers=3)
+        start, end = command.time_window()
+        slices = split_time_range(start, end, 3)
+
+        def build_service():
+            # each slice returns a single activity tagged with the index of its slice
+            pages_by_start = {s.isoformat(): [[make_activity(i)]] for i, (s, _) in enumerate(slices)}
+
+            class SliceActivities(FakeActivities):
+                def list(self, **params):
+                    return FakeRequest(pages_by_start[params['startTime']], **params)
+
+            service = FakeService([])
+            service._activities = SliceActivities([])
+            return service
+
+        monkeypatch.setattr(command, 'build_service', build_service)
+        monkeypatch.setattr(command, 'time_window', lambda: (start, end))
+        df = command.fetch_data()
+        assert list(df['etag']) == ['etag-0', 'etag-1', 'etag-2']
+
+    def test_sliced_fetch_bounded(self, monkeypatch):
+        command = make_command([], slices=3, workers=2)
+        start, end = command.time_window()
+        fetched = []
+
+        def build_service():
+            class CountingRequest(FakeRequest):
+                def execute(self):
+                    fetched.append(self.index)
+                    return super().execute()
+
+            class CountingActivities(FakeActivities):
+                def list(self, **params):
+                    return CountingRequest(self.pages, **params)
+
+                def list_next(self, request, result):
+                    return CountingRequest(request.pages, request.index + 1) if request.index + 1 < 50 else None
+
+            service = FakeService([])
+            service._activities = CountingActivities([[make_activity(0)]] * 50)
+            return service
+
+        monkeypatch.setattr(command, 'build_service', build_service)
+        pages = command.iter_activity_pages(start, end)
+        next(pages)
+        time.sleep(0.5)
+        # the two running slices only fetch a few pages ahead of the consumer, the third waits for a worker
+        assert len(fetched) <= 2 * 6
+        pages.close()
+
+    def test_page_retry(self, monkeypatch):
+        command = make_command([[make_activity(0)], [make_activity(1)]], retries=2)
+        failures = [HttpError(httplib2.Response({'status': 503}), b'{}')]
+
+        class FlakyRequest(FakeRequest):
+            def execute(self):
+                if self.index == 1 and failures:
+                    raise failures.pop()
+                return super().execute()
+
+        class FlakyActivities(FakeActivities):
+            def list_next(self, request, result):
+                return FlakyRequest(request.pages, request.index + 1) if request.index + 1 < len(request.pages) else None
+
+        command.service._activities = FlakyActivities(command.service._activities.pages)
+        monkeypatch.setattr('swat.api.time.sleep', lambda _: None)
+        df = command.fetch_data()
+        assert list(df['etag']) == ['etag-0', 'etag-1']
+        assert command.obj.executor.stats['default']['retries'] == 1
+
+
+class TestAuditIncremental:
+    """Test incremental syncing of audit data."""
+
+    def test_incremental_sync(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('swat.audit_store.AUDIT_DIR', tmp_path)
+        state_path = tmp_path / 'state.json'
+
+        # newest first, the two newest events share a timestamp
+        first = [[make_activity(2, time='2023-10-01T00:00:02.000Z'), make_activity(1, time='2023-10-01T00:00:02.000Z')],
+                 [make_activity(0)]]
+        command = make_command(first, incremental=True)
+        command.state = AuditState.from_file(state_path)
+        assert len(command.fetch_data()) == 3
+
+        state = AuditState.from_file(state_path)
+        mark = state.get('login')
+        assert mark.time == '2023-10-01T00:00:02.000Z'
+        assert sorted(mark.unique_qualifiers) == ['1', '2']
+
+        # the boundary events are returned again by the inclusive startTime and must be dropped
+        second = [[make_activity(3, time='2023-10-01T00:00:03.000Z'), make_activity(2, time='2023-10-01T00:00:02.000Z'),
+                   make_activity(1, time='2023-10-01T00:00:02.000Z')]]
+        command = make_command(second, incremental=True)
+        command.state = state
+        assert command.time_window()[0] == pd.Timestamp('2023-10-01T00:00:02.000Z')
+        df = command.fetch_data()
+        assert list(df['etag']) == ['etag-3']
+
+        stored = pd.read_json(get_event_store_path('login'), lines=True)
+        assert sorted(stored['etag']) == ['etag-0', 'etag-1', 'etag-2', 'etag-3']
+        assert AuditState.from_file(state_path).get('login').unique_qualifiers == ['3']
+
+    def test_failed_sync_not_stored(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('swat.audit_store.AUDIT_DIR', tmp_path)
+        state_path = tmp_path / 'state.json'
+        pages = [[make_activity(2)], [make_activity(1)], [make_activity(0)]]
+
+        class FailingRequest(FakeRequest):
+            def execute(self):
+                if self.index == 2:
+                    raise RuntimeError('sync failed')
+                return super().execute()
+
+        class FailingActivities(FakeActivities):
+            def list(self, **params):
+                return FailingRequest(self.pages, **params)
+
+            def list_next(self, request, result):
+                return FailingRequest(request.pages, request.index + 1, **request.params)
+
+        command = make_command(pages, incremental=True)
+        command.state = AuditState.from_file(state_path)
+        command.service._activities = FailingActivities(pages)
+        with pytest.raises(RuntimeError):
+            command.fetch_data()
+        assert not get_event_store_path('login').exists()
+        assert not state_path.exists()
+
+        # the retried window stores each event once
+        command = make_command(pages, incremental=True)
+        command.state = AuditState.from_file(state_path)
+        assert len(command.fetch_data()) == 3
+        stored = pd.read_json(get_event_store_path('login'), lines=True)
+        assert sorted(stored['etag']) == ['etag-0', 'etag-1', 'etag-2']
+
+
+class TestAuditCache:
+    """Test the local columnar cache of audit data."""
+
+    def test_missing_ranges(self, tmp_path):
+        cache = EventCache(tmp_path)
+        start, end = pd.Timestamp('2023-10-01', tz='UTC'), pd.Timestamp('2023-10-10', tz='UTC')
+        assert cache.missing_ranges('login', start, end) == [(start, end)]
+
+        cache.add_range('login', pd.Timestamp('2023-10-03', tz='UTC'), pd.Timestamp('2023-10-05', tz='UTC'))
+        cache.add_range('login', pd.Timestamp('2023-10-05 00:00:00.001', tz='UTC'),
+                        pd.Timestamp('2023-10-06', tz='UTC'))
+        assert len(cache.load_metadata('login')['ranges']) == 1
+
+        one_ms = pd.Timedelta(milliseconds=1)
+        assert cache.missing_ranges('login', start, end) == [
+            (start, pd.Timestamp('2023-10-03', tz='UTC') - one_ms),
+            (pd.Timestamp('2023-10-06', tz='UTC') + one_ms, end),
+        ]
+
+    def test_cached_query(self, tmp_path):
+        times = ['2023-10-02T00:00:03.000Z', '2023-10-02T00:00:02.000Z', '2023-10-01T00:00:01.000Z']
+        pages = [[make_activity(i, time=t) for i, t in enumerate(times[:2])], [make_activity(2, time=times[2])]]
+        window = (pd.Timestamp('2023-10-01', tz='UTC'), pd.Timestamp('2023-10-03', tz='UTC'))
+
+        command = make_command(pages, cache=True, columns=['etag', 'id'])
+        command.cache = EventCache(tmp_path)
+        command.time_window = lambda: window
+        df = command.fetch_data()
+        assert list(df['etag']) == ['etag-0', 'etag-1', 'etag-2']
+        assert df['id'][0]['uniqueQualifier'] == '0'
+        assert len(command.service.activities().requests) == 1
+
+        # the window is fully cached, so the API is not called again and filters are answered from the cache
+        command = make_command([], cache=True, columns=['etag'], filters={'name': 'login_success'})
+        command.cache = EventCache(tmp_path)
+        command.time_window = lambda: window
+        df = command.fetch_data()
+        assert list(df['etag']) == ['etag-1']
+
+        command = make_command([], cache=True, columns=['etag'], filters={'email': 'user0@example.com'})
+        command.cache = EventCache(tmp_path)
+        command.time_window = lambda: window
+        assert list(command.fetch_data()['etag']) == ['etag-0', 'etag-2']
+        assert 'ownerDomain' not in df.columns and 'kind' not in df.columns
+        assert not command.service.activities().requests
+
+
+    def test_unsettled_events_refetched(self, tmp_path):
+        now = pd.Timestamp.now(tz='UTC')
+        published = [make_activity(0, time=to_rfc3339(now - pd.Timedelta(minutes=10))),
+                     make_activity(1, time=to_rfc3339(now - pd.Timedelta(hours=2)))]
+
+        class WindowActivities(FakeActivities):
+            def list(self, **params):
+                request = FakeRequest([[a for a in published if params['startTime'] <= a['id']['time'] and
+                                        a['id']['time'] <= params['endTime']]], **params)
+                self.requests.append(request)
+                return request
+
+        def query() -> tuple[pd.DataFrame, list]:
+            command = make_command([], cache=True, columns=['etag', 'id'])
+            command.cache = EventCache(tmp_path)
+            command.service._activities = WindowActivities([])
+            window = (now - pd.Timedelta(hours=3), now)
+            command.time_window = lambda: window
+            return command.fetch_data(), command.service.activities().requests
+
+        df, requests = query()
+        assert list(df['etag']) == ['etag-0', 'etag-1'] and len(requests) == 2
+        assert pd.Timestamp(EventCache(tmp_path).load_metadata('login')['ranges'][0][1]) < now - pd.Timedelta(minutes=59)
+
+        # an event published late within the settle lag is picked up, only the unsettled part is fetched again
+        published.append(make_activity(2, time=to_rfc3339(now - pd.Timedelta(minutes=30))))
+        df, requests = query()
+        assert sorted(df['etag']) == ['etag-0', 'etag-1', 'etag-2']
+        assert all(pd.Timestamp(r.params['startTime']) > now - pd.Timedelta(minutes=61) for r in requests)
+
+    def test_range_written_together(self, tmp_path):
+        cache = EventCache(tmp_path)
+        flatten = make_command([]).flatten_activities
+        start, end = pd.Timestamp('2023-10-01', tz='UTC'), pd.Timestamp('2023-10-02', tz='UTC')
+
+        def failing_frames():
+            yield flatten([make_activity(0)])
+            raise RuntimeError('range failed')
+
+        with pytest.raises(RuntimeError):
+            cache.write_range('login', failing_frames(), start, end, batch_rows=1)
+        assert not list(tmp_path.rglob('*.parquet'))
+        assert cache.missing_ranges('login', start, end) == [(start, end)]
+
+        # the pages of a range are buffered into a single file per day
+        frames = [flatten([make_activity(i)]) for i in range(3)]
+        frames[1]['nested'] = [{'key': 'value'}]
+        cache.write_range('login', frames, start, end)
+        assert len(list(tmp_path.rglob('*.parquet'))) == 1
+        assert cache.missing_ranges('login', start, end) == []
+        df = pd.concat(cache.iter_frames('login', start, end))
+        assert sorted(df['etag']) == ['etag-0', 'etag-1', 'etag-2']
+        assert df.set_index('etag')['nested'].to_dict() == {'etag-0': None, 'etag-1': {'key': 'value'},
+                                                            'etag-2': None}
+
+
+class TestAuditFlatten:
+    """Test flattening of audit activities."""
+
+    @staticmethod
+    def activities() -> list:
+        activities = [make_activity(i) for i in range(4)]
+        # multiple events, a nested value and activities with differing fields
+        activities[1]['events'].append({'type': 'login', 'name': 'logout', 'parameters': [
+            {'name': 'login_type', 'value': 'saml'},
+            {'name': 'affected_email_address', 'multiValue': ['a@example.com']},
+        ]})
+        activities[2]['events'][0]['nested'] = {'key': 'value', 'items': [1, 2]}
+        del activities[3]['ipAddress']
+        activities[3]['ownerDomain'] = 'example.com'
+        return activities
+
+    def test_matches_legacy_flattening(self):
+        activities = self.activities()
+        expected = legacy_flatten_activities(copy.deepcopy(activities))
+        flattened = make_command([]).flatten_activities(activities)
+        pd.testing.assert_frame_equal(flattened, expected)
+
+    def test_event_values_take_precedence(self):
+        activities = [make_activity(0)]
+        # an explicit None event value and a repeated parameter name replace the earlier values
+        activities[0]['events'][0]['ipAddress'] = None
+        activities[0]['events'][0]['parameters'].append({'name': 'login_type', 'value': 'saml'})
+        expected = legacy_flatten_activities(copy.deepcopy(activities))
+        flattened = make_command([]).flatten_activities(activities)
+        pd.testing.assert_frame_equal(flattened, expected)
+        assert flattened['ipAddress'].isna().all() and list(flattened['login_type']) == ['saml']
+
+    def test_does_not_mutate_activities(self):
+        activities = self.activities()
+        make_command([]).flatten_activities(activities)
+        assert activities == self.activities()
+
+    def test_empty_page(self):
+        assert make_command([]).flatten_activities([]).empty
+
+
+class TestAuditFilters:
+    """Test splitting filters between the Reports API and local filtering."""
+
+    def test_parse_filters(self):
+        args = audit_command.parser.parse_args(['login', '1h', '--filters', 'name=login_success', "email='a@example.com'"])
+        assert args.filters == {'name': 'login_success', 'email': 'a@example.com'}
+        assert audit_command.parser.parse_args(['login', '1h']).filters == {}
+
+    def test_split_filters(self):
+        query, local = Filters({'email': 'a@example.com', 'ipAddress': '10.0.0.1', 'type': 'login',
+                                'login_type': '*saml*'}).split()
+        assert query == {'userKey': 'a@example.com', 'actorIpAddress': '10.0.0.1'}
+        assert local == {'type': 'login', 'login_type': '*saml*'}
+
+    def test_split_parameter_filters(self):
+        filters = Filters({'login_type': 'saml', 'is_second_factor': 'true'})
+        assert filters.split() == ({}, {'login_type': 'saml', 'is_second_factor': 'true'})
+
+        filters.filters['name'] = 'login_success'
+        query, local = filters.split()
+        assert query == {'eventName': 'login_success', 'filters': 'login_type==saml,is_second_factor==true'}
+        assert not local
+
+    def test_split_without_pushdown(self):
+        assert Filters({'name': 'login_success'}).split(pushdown=False) == ({}, {'name': 'login_success'})
+        filters = Filters({'email': 'a@example.com', 'actorIpAddress': '10.0.0.1', 'eventName': 'login_success'})
+        assert filters.split(pushdown=False) == ({}, {'actor.email': 'a@example.com', 'ipAddress': '10.0.0.1',
+                                                      'name': 'login_success'})
+        with pytest.raises(ValueError):
+            Filters({'orgUnitID': 'ou'}).split(pushdown=False)
+
+    def test_split_duplicate_aliases(self):
+        query, local = Filters({'email': 'a@example.com', 'userKey': '*b*'}).split()
+        assert query == {'userKey': 'a@example.com'} and local == {'actor.email': '*b*'}
+
+    def test_local_query_filters(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('swat.audit_store.AUDIT_DIR', tmp_path)
+        pages = [[make_activity(i) for i in range(6)]]
+        command = make_command(pages, filters={'email': 'user1@example.com', 'actorIpAddress': '10.0.0.1'},
+                               incremental=True)
+        command.state = AuditState.from_file(tmp_path / 'state.json')
+        assert list(command.fetch_data()['etag']) == ['etag-1', 'etag-3', 'etag-5']
+
+        command = make_command(pages, filters={'email': '*USER0*'})
+        assert list(command.fetch_data()['etag']) == ['etag-0', 'etag-2', 'etag-4']
+
+    def test_query_parameters_sent(self):
+        command = make_command([[make_activity(1)]], filters={'email': 'user1@example.com', 'type': 'login'})
+        df = command.fetch_data()
+        assert len(df) == 1
+        params = command.service.activities().requests[0].params
+        assert params['userKey'] == 'user1@example.com' and 'type' not in params
+
+
+class TestAuditColumns:
+    """Test selecting audit columns."""
+
+    def test_match_columns_once_in_order(self):
+        columns = ('kind', 'id', 'actor', 'event_name', 'name_type', 'ipAddress')
+        assert match_columns(columns, ('name', 'type', 'actor')) == ('actor', 'event_name', 'name_type')
+
+    def test_match_columns_case_insensitive_patterns(self):
+        columns = ('events_0_name', 'events_1_name', 'IPADDRESS')
+        assert match_columns(columns, (r'events_\d+_name', 'ipaddress')) == columns
+        assert match_columns(columns, ()) == ()
+
+    def test_filter_columns(self):
+        df = make_command([], columns=['name', 'login']).flatten_activities([make_activity(1)])
+        assert list(make_command([], columns=['name', 'login']).filter_columns(df).columns) == ['name', 'login_type']
+
+
+class TestAuditExport:
+    """Test incremental export of audit data."""
+
+    @staticmethod
+    def frame(start: int, count: int) -> pd.DataFrame:
+        return pd.DataFrame({'etag': [f'etag-{i}' for i in range(start, start + count)], 'name': 'login_success'})
+
+    @pytest.mark.parametrize('compression', [None, 'gzip'])
+    def test_csv_adds_later_columns(self, tmp_path, compression):
+        with ExportWriter(tmp_path / 'out.csv', compression=compression) as writer:
+            writer.write(self.frame(0, 2))
+            writer.write(self.frame(2, 2).assign(extra='x, "y"')[['extra', 'name', 'etag']])
+        assert len(writer.paths) == 1
+        exported = pd.read_csv(writer.paths[0], keep_default_na=False)
+        assert list(exported.columns) == ['etag', 'name', 'extra']
+        assert list(exported['etag']) == [f'etag-{i}' for i in range(4)]
+        assert list(exported['extra']) == ['', '', 'x, "y"', 'x, "y"']
+
+    def test_rotated_csv_adds_later_columns(self, tmp_path):
+        with ExportWriter(tmp_path / 'out.csv', max_bytes=1000) as writer:
+            writer.write(self.frame(0, 2))
+            writer.write(self.frame(2, 2).assign(extra='x'))
+        first, second = (pd.read_csv(p) for p in writer.paths)
+        assert list(first.columns) == ['etag', 'name'] and list(second.columns) == ['etag', 'name', 'extra']
+
+    def test_gzip_ndjson(self, tmp_path):
+        with ExportWriter(tmp_path / 'out.ndjson', export_format='ndjson', compression='gzip') as writer:
+            writer.write(self.frame(0, 3))
+            writer.write(self.frame(3, 3))
+        assert writer.paths == [tmp_path / 'out.ndjson.gz']
+        with gzip.open(writer.paths[0], 'rt') as f:
+            assert len(pd.read_json(io.StringIO(f.read()), lines=True)) == 6
+
+    def test_zstd(self, tmp_path):
+        zstandard = pytest.importorskip('zstandard')
+        with ExportWriter(tmp_path / 'out.csv', compression='zstd') as writer:
+            writer.write(self.frame(0, 3))
+        with zstandard.open(writer.paths[0], 'rt') as f:
+            assert len(pd.read_csv(f)) == 3
+
+    def test_rotation(self, tmp_path):
+        with ExportWriter(tmp_path / 'out.csv', max_bytes=100, chunk_size=2) as writer:
+            writer.write(self.frame(0, 10))
+        assert len(writer.paths) > 1 and writer.paths[0].name == 'out-0001.csv'
+        frames = [pd.read_csv(p) for p in writer.paths]
+        assert all(list(f.columns) == ['etag', 'name'] for f in frames)
+        assert sum(len(f) for f in frames) == writer.rows == 10
+
+    def test_rotation_counts_bytes(self, tmp_path):
+        # two byte characters, so each row is twice as long in bytes as in characters
+        frame = pd.DataFrame({'name': ['é' * 30] * 6})
+        with ExportWriter(tmp_path / 'out.csv', max_bytes=100, chunk_size=1) as writer:
+            writer.write(frame)
+        assert len(writer.paths) == 6
+        assert all(p.stat().st_size <= 100 for p in writer.paths)
+
+    def test_export_path(self, tmp_path):
+        command = make_command([], export_path=tmp_path)
+        assert command.export_path == tmp_path / 'login_1h.csv'
+        command = make_command([], export_path=tmp_path / 'events.csv')
+        assert command.export_path == tmp_path / 'events.csv'
+
+
+class TestAuditApplications:
+    """Test fetching several applications at once."""
+
+    @staticmethod
+    def pages(application: str, seconds: list) -> list:
+        return [[make_activity(i, application, f'2023-10-01T00:00:{i:02d}.000Z') for i in seconds]]
+
+    def test_parse_applications(self):
+        args = audit_command.parser.parse_args(['login', 'drive', '1d'])
+        assert args.application == ['login', 'drive'] and args.duration == '1d'
+
+    def test_all_applications(self):
+        command = make_command([], application=['all'])
+        assert command.applications == list(APPLICATIONS)
+        assert command.application == 'all'
+
+    def test_merged_fetch(self, monkeypatch):
+        pages = {'login': self.pages('login', [50, 30, 10]), 'drive': self.pages('drive', [40, 20])}
+        command = make_command([], application=['login', 'drive'])
+        services = iter([FakeService(pages['login']), FakeService(pages['drive'])])
+        monkeypatch.setattr(command, 'build_service', lambda: next(services))
+
+        df = command.fetch_data()
+        assert list(df['application']) == ['login', 'drive', 'login', 'drive', 'login']
+        assert list(df['etag']) == ['etag-50', 'etag-40', 'etag-30', 'etag-20', 'etag-10']
+        assert command.filter_columns(df).columns[0] == 'application'
+
+    def test_merged_incremental_fetch(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('swat.audit_store.AUDIT_DIR', tmp_path)
+        pages = {'login': self.pages('login', [50, 30, 10]), 'drive': self.pages('drive', [40, 20])}
+        command = make_command([], application=['login', 'drive'], incremental=True)
+        command.state = AuditState.from_file(tmp_path / 'state.json')
+        services = iter([FakeService(pages['login']), FakeService(pages['drive'])])
+        monkeypatch.setattr(command, 'build_service', lambda: next(services))
+
+        assert len(command.fetch_data()) == 5
+        state = AuditState.from_file(tmp_path / 'state.json')
+        assert state.get('login').unique_qualifiers == ['50'] and state.get('drive').unique_qualifiers == ['40']
+        assert len(pd.read_json(get_event_store_path('login'), lines=True)) == 3
+        assert len(pd.read_json(get_event_store_path('drive'), lines=True)) == 2
+
+    def test_merge_batches(self):
+        frames = [pd.DataFrame({'id': [{'time': t} for t in times]}) for times in (['3', '1'], ['4', '2', '0'])]
+        merged = list(merge_frames([iter(frames[:1]), iter(frames[1:])], batch_size=2))
+        assert [len(df) for df in merged] == [2, 2, 1]
+        assert [row['time'] for df in merged for row in df['id']] == ['4', '3', '2', '1', '0']
+
+    def test_prefetch_raises(self):
+        def items():
+            yield 1
+            raise ValueError('failed')
+
+        with ThreadPoolExecutor() as executor:
+            stream = prefetch(items(), executor)
+            assert next(stream) == 1
+            with pytest.raises(ValueError):
+                next(stream)
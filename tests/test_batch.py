@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+from swat.api import RequestExecutor
+from swat.batch import BatchRunner, parse_batch
+from swat.commands.base_command import BaseCommand
+
+
+class SleepCommand(BaseCommand):
+    """Command sleeping for its first argument in seconds, recording when it ran."""
+
+    runs = []
+    lock = threading.Lock()
+
+    def execute(self) -> None:
+        start = time.monotonic()
+        time.sleep(float(self.args[0]) if self.args else 0)
+        with self.lock:
+            self.runs.append((self.command, start, time.monotonic()))
+
+
+class FailCommand(BaseCommand):
+
+    def execute(self) -> None:
+        raise ValueError('bad arguments')
+
+
+class LogErrorCommand(BaseCommand):
+
+    def execute(self) -> None:
+        self.logger.error('Missing credentials')
+
+
+class FalseCommand(BaseCommand):
+
+    def execute(self) -> bool:
+        return False
+
+
+COMMANDS = {'sleep': SleepCommand, 'fail': FailCommand, 'auth': SleepCommand, 'log_error': LogErrorCommand,
+            'false': FalseCommand}
+
+
+def make_runner(workers: int = 1) -> tuple[BatchRunner, list]:
+    loaded = []
+
+    def load_command(name):
+        loaded.append(name)
+        return COMMANDS.get(name)
+
+    SleepCommand.runs = []
+    obj = SimpleNamespace(executor=RequestExecutor(quotas={}))
+    return BatchRunner(obj, load_command, workers=workers), loaded
+
+
+class TestBatch:
+    """Test running batches of commands without the shell."""
+
+    def test_parse_script(self):
+        commands = parse_batch('# nightly\nauth session --default\n\n  emulate admin_add_creds_to_users  --x 1\n')
+        assert [(c.line, c.name, c.args) for c in commands] == [
+            (2, 'auth', ['session', '--default']),
+            (4, 'emulate', ['admin_add_creds_to_users', '--x', '1']),
+        ]
+
+    def test_parse_json(self):
+        commands = parse_batch('["coverage view", ["audit", "login", "1d", "--columns", "id time"]]')
+        assert [(c.line, c.name, c.args) for c in commands] == [
+            (1, 'coverage', ['view']),
+            (2, 'audit', ['login', '1d', '--columns', 'id time']),
+        ]
+
+    def test_run_resolves_commands_once(self):
+        runner, loaded = make_runner()
+        results = runner.run(parse_batch('sleep\nfail\nsleep\nunknown'))
+        assert [r.status for r in results] == ['succeeded', 'failed', 'succeeded', 'unknown']
+        assert results[1].error == 'bad arguments' and results[1].command == 'fail'
+        assert loaded == ['sleep', 'fail', 'unknown']
+
+        report = runner.report(results, 1.0)
+        assert report['status'] == 'failed' and [c['line'] for c in report['commands']] == [1, 2, 3, 4]
+
+    def test_logged_errors_fail(self):
+        runner, _ = make_runner(workers=2)
+        results = runner.run(parse_batch('log_error\nsleep\nfalse'))
+        assert [r.status for r in results] == ['failed', 'succeeded', 'failed']
+        assert results[0].error == 'Missing credentials'
+        assert runner.recorder not in logging.getLogger().handlers
+
+    def test_parallel_stages(self):
+        runner, _ = make_runner(workers=4)
+        commands = parse_batch('sleep 0.1\nsleep 0.1\nauth\nsleep 0')
+        assert [[c.line for c in stage] for stage in runner.stages(commands)] == [[1, 2], [3], [4]]
+
+        results = runner.run(commands)
+        assert all(r.status == 'succeeded' for r in results)
+        runs = {(name, start): end for name, start, end in SleepCommand.runs}
+        first, second = sorted(start for name, start in runs if name == 'sleep')[:2]
+        auth_start = next(start for name, start in runs if name == 'auth')
+        assert second < runs[('sleep', first)]
+        assert auth_start >= max(runs[('sleep', first)], runs[('sleep', second)])
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+import yaml
+
+from swat.commands.campaign import Command, Playbook
+
+ROLES = 'admin_add_admin_roles_to_users'
+CREDS = 'admin_add_creds_to_users'
+TWO_SV = 'admin_disable_2sv_for_user'
+KEYS = 'drive_access_private_keys'
+
+
+class FakeEmulation:
+    """Emulation recording when it ran."""
+
+    def __init__(self, services: list[str], seconds: float = 0.1, error: bool = False) -> None:
+        self.services = services
+        self.seconds = seconds
+        self.error = error
+        self.started = self.finished = None
+
+    def execute(self) -> None:
+        self.started = time.monotonic()
+        time.sleep(self.seconds)
+        self.finished = time.monotonic()
+        if self.error:
+            raise RuntimeError('emulation failed')
+
+
+def make_command(tmp_path, steps: list[dict], *args: str, **playbook) -> Command:
+    path = tmp_path / 'playbook.yaml'
+    path.write_text(yaml.safe_dump({'name': 'test', 'steps': steps, **playbook}))
+    return Command(command='campaign', args=[str(path), *args], obj=None)
+
+
+class TestPlaybook:
+    """Test playbook validation."""
+
+    @pytest.mark.parametrize('steps', [
+        [],
+        [{'emulation': 'unknown'}],
+        [{'emulation': ROLES, 'needs': ['unknown']}],
+        [{'emulation': ROLES}, {'emulation': ROLES}],
+        [{'id': 'a', 'emulation': ROLES, 'needs': 'b'}, {'id': 'b', 'emulation': CREDS, 'needs': 'a'}],
+    ])
+    def test_invalid(self, steps):
+        with pytest.raises(ValueError):
+            Playbook.from_dict({'steps': steps})
+
+    def test_stages(self):
+        playbook = Playbook.from_dict({'steps': [
+            {'emulation': ROLES, 'args': '--username alice'},
+            {'emulation': CREDS, 'needs': ROLES},
+            {'emulation': TWO_SV, 'needs': [ROLES]},
+            {'emulation': KEYS},
+        ]})
+        assert playbook.steps[ROLES].args == ['--username', 'alice']
+        assert playbook.stages() == [[ROLES, KEYS], [CREDS, TWO_SV]]
+
+
+class TestCampaign:
+    """Test running playbooks as a dependency graph."""
+
+    def test_runs_independent_steps_concurrently(self, tmp_path):
+        command = make_command(tmp_path, [
+            {'id': 'a', 'emulation': ROLES},
+            {'id': 'b', 'emulation': CREDS, 'needs': ['a']},
+            {'id': 'c', 'emulation': TWO_SV, 'needs': ['a']},
+            {'id': 'd', 'emulation': KEYS, 'needs': ['b', 'c']},
+        ])
+        emulations = {step: FakeEmulation(['admin']) for step in 'abcd'}
+        results = command.run(emulations)
+
+        assert all(result.status == 'succeeded' for result in results.values())
+        a, b, c, d = (emulations[step] for step in 'abcd')
+        assert b.started >= a.finished and c.started >= a.finished
+        assert b.started < c.finished and c.started < b.finished
+        assert d.started >= max(b.finished, c.finished)
+
+    def test_skips_dependents_of_failed_steps(self, tmp_path):
+        command = make_command(tmp_path, [
+            {'id': 'a', 'emulation': ROLES},
+            {'id': 'b', 'emulation': CREDS, 'needs': ['a']},
+            {'id': 'c', 'emulation': TWO_SV, 'needs': ['b']},
+            {'id': 'd', 'emulation': KEYS},
+        ])
+        emulations = {step: FakeEmulation([], seconds=0, error=step == 'a') for step in 'abcd'}
+        results = command.run(emulations)
+
+        assert {step: result.status for step, result in results.items()} == \
+            {'a': 'failed', 'b': 'skipped', 'c': 'skipped', 'd': 'succeeded'}
+        assert emulations['b'].started is None and emulations['c'].started is None
+
+    def test_service_limit(self, tmp_path):
+        command = make_command(tmp_path, [{'emulation': name} for name in (ROLES, CREDS, TWO_SV, KEYS)],
+                               '--service-limit', '1', service_limits={'drive': 2})
+        emulations = {name: FakeEmulation(['admin'], seconds=0.05) for name in (ROLES, CREDS, TWO_SV)}
+        emulations[KEYS] = FakeEmulation(['drive'], seconds=0.05)
+
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def tracked(emulation: FakeEmulation):
+            execute = emulation.execute
+
+            def wrapper():
+                with lock:
+                    active[0] += 'admin' in emulation.services
+                    peak[0] = max(peak[0], active[0])
+                execute()
+                with lock:
+                    active[0] -= 'admin' in emulation.services
+            return wrapper
+
+        for emulation in emulations.values():
+            emulation.execute = tracked(emulation)
+        results = command.run(emulations)
+
+        assert all(result.status == 'succeeded' for result in results.values())
+        assert peak[0] == 1
+        drive = command.semaphores['drive']
+        assert drive.acquire(blocking=False) and drive.acquire(blocking=False) and not drive.acquire(blocking=False)
@@ -0,0 +1,272 @@
+import datetime
+import json
+import pickle
+import threading
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.auth import credentials
+from google.auth.credentials import AnonymousCredentials
+from google.auth.exceptions import RefreshError
+
+from swat import base
+from swat.base import SWAT, Cred, CredStore, DelegatedCredentialPool, OAuthCreds, ServiceAccountCreds, TokenRefresher
+
+
+class FakeSession(credentials.Credentials):
+    """Session whose token expires after the given seconds, counting refreshes."""
+
+    def __init__(self, expires_in=None, fail: bool = False) -> None:
+        super().__init__()
+        self.refreshes = 0
+        self.fail = fail
+        if expires_in is not None:
+            self.token = 'token'
+            self.expiry = self.utcnow() + datetime.timedelta(seconds=expires_in)
+
+    @staticmethod
+    def utcnow() -> datetime.datetime:
+        return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+    def refresh(self, request) -> None:
+        if self.fail:
+            raise RefreshError('invalid_grant')
+        self.refreshes += 1
+        self.token = f'token{self.refreshes}'
+        self.expiry = self.utcnow() + datetime.timedelta(hours=1)
+
+
+def make_creds(client_id: str) -> OAuthCreds:
+    return OAuthCreds(auth_provider_x509_cert_url='', auth_uri='', client_id=client_id, client_secret='secret',
+                      project_id='project', redirect_uris=[], token_uri='')
+
+
+class TestCredStore:
+    """Test the SQLite backed credential store."""
+
+    def make_store(self, path, count: int = 3) -> CredStore:
+        cred_store = CredStore(path=path)
+        for n in range(count):
+            cred_store.add(f'key{n}', creds=make_creds(f'client{n}'))
+        cred_store.add('session', session=AnonymousCredentials())
+        cred_store.save()
+        return cred_store
+
+    def test_loads_creds_lazily(self, tmp_path):
+        self.make_store(tmp_path / 'store.sqlite')
+        cred_store = CredStore.from_file(tmp_path / 'store.sqlite', tmp_path / 'missing.pkl')
+        assert len(cred_store.store) == 4 and cred_store.has_sessions
+        assert not cred_store.store.loaded
+
+        assert cred_store.get('key1').creds.client_id == 'client1'
+        assert cred_store.get_by_client_id('client2').client_id == 'client2'
+        assert cred_store.get_by_client_id('unknown') is None
+        assert set(cred_store.store.loaded) == {'key1', 'key2'}
+
+    def test_incremental_save(self, tmp_path):
+        path = tmp_path / 'store.sqlite'
+        self.make_store(path)
+        cred_store = CredStore(path=path)
+        cred_store.get('key0').creds.client_secret = 'rotated'
+        assert cred_store.remove('key1') and not cred_store.remove('key1')
+        cred_store.add('key3', creds=make_creds('client3'))
+        cred_store.save()
+
+        reopened = CredStore(path=path)
+        assert sorted(reopened.store) == ['key0', 'key2', 'key3', 'session']
+        assert reopened.get('key0').creds.client_secret == 'rotated'
+        assert reopened.get_by_client_id('client1') is None
+        assert reopened.get_by_client_id('client3').client_id == 'client3'
+
+    def test_session_set_in_place(self, tmp_path):
+        path = tmp_path / 'store.sqlite'
+        self.make_store(path)
+        cred_store = CredStore(path=path)
+        assert cred_store.store.session_keys() == ['session']
+
+        cred_store.get('key0').session = AnonymousCredentials()
+        assert cred_store.store.session_keys() == ['key0', 'session']
+        cred_store.save()
+        assert sorted(CredStore(path=path).store.session_keys()) == ['key0', 'session']
+
+    def test_migrates_pickled_store(self, tmp_path):
+        legacy = tmp_path / '.cred_store.pkl'
+        legacy_store = CredStore(path=tmp_path / 'unused.sqlite')
+        legacy_store.store = {'default': Cred(creds=make_creds('client'), session=None)}
+        legacy.write_bytes(pickle.dumps(legacy_store))
+
+        cred_store = CredStore.from_file(tmp_path / 'store.sqlite', legacy)
+        assert not legacy.exists() and (tmp_path / '.cred_store.pkl.migrated').exists()
+        assert CredStore(path=tmp_path / 'store.sqlite').get('default').client_id == 'client'
+        assert cred_store.get_by_client_id('client').client_id == 'client'
+
+
+class TestTokenRefresher:
+    """Test refreshing session tokens ahead of their expiry."""
+
+    def make_store(self, tmp_path, **sessions) -> CredStore:
+        cred_store = CredStore(path=tmp_path / 'store.sqlite')
+        for key, session in sessions.items():
+            cred_store.add(key, session=session)
+        return cred_store
+
+    def test_refreshes_expiring_sessions(self, tmp_path):
+        expiring, fresh, missing, failing = FakeSession(600), FakeSession(3600), FakeSession(), FakeSession(0, True)
+        cred_store = self.make_store(tmp_path, expiring=expiring, fresh=fresh, missing=missing, failing=failing,
+                                     anonymous=AnonymousCredentials())
+        cred_store.add('creds', creds=make_creds('client'))
+        refresher = TokenRefresher(cred_store, request=None, margin=900)
+
+        assert refresher.refresh() == 2
+        assert (expiring.refreshes, fresh.refreshes, missing.refreshes) == (1, 0, 1)
+        assert refresher.refresh() == 0
+
+    def test_refreshes_stored_sessions(self, tmp_path):
+        # sessions stored by an earlier run have usually expired, they are refreshed before their first use
+        cred_store = self.make_store(tmp_path, expired=FakeSession(-1), fresh=FakeSession(3600))
+        cred_store.save()
+        cred_store = CredStore(path=tmp_path / 'store.sqlite')
+        assert not cred_store.store.loaded
+        assert TokenRefresher(cred_store, request=None).refresh() == 1
+        assert cred_store.get('expired', missing_error=False).session.refreshes == 1
+
+    def test_thread_survives_errors(self, tmp_path, monkeypatch):
+        refresher = TokenRefresher(self.make_store(tmp_path), request=None, interval=0.01)
+        calls = []
+
+        def refresh():
+            calls.append(len(calls))
+            if len(calls) == 1:
+                raise RuntimeError('unexpected')
+            refresher.stopped.set()
+            refresher.wakeup.set()
+            return 0
+
+        monkeypatch.setattr(refresher, 'refresh', refresh)
+        refresher.start()
+        refresher.thread.join(5)
+        assert calls == [0, 1] and not refresher.thread.is_alive()
+
+    def test_accessor_refreshes_expired_sessions(self, tmp_path):
+        expired, expiring = FakeSession(-1), FakeSession(600)
+        cred_store = self.make_store(tmp_path, expired=expired, expiring=expiring)
+        assert cred_store.session('expired') is expired and expired.refreshes == 1
+        # sessions expiring soon are left to the refresher
+        assert cred_store.session('expiring') is expiring and expiring.refreshes == 0
+
+    def test_background_thread(self, tmp_path):
+        session = FakeSession()
+        cred_store = self.make_store(tmp_path)
+        obj = SWAT({'settings': {'token_refresh': {'enabled': True, 'interval': 60}}}, cred_store=cred_store)
+        assert obj.refresher.thread is None
+        obj.refresher.start()
+        try:
+            cred_store.add('default', session=session)
+            obj.refresher.wake()
+            deadline = time.monotonic() + 5
+            while not session.refreshes and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert session.refreshes == 1 and session.valid
+        finally:
+            obj.refresher.stop()
+        assert not obj.refresher.thread.is_alive()
+        assert SWAT({}, cred_store=cred_store).refresher is None
+
+
+def make_service_account() -> ServiceAccountCreds:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode()
+    return ServiceAccountCreds(auth_provider_x509_cert_url='', auth_uri='', client_email='swat@project.test',
+                               client_id='client', client_x509_cert_url='', private_key_id='key', private_key=pem,
+                               project_id='project', token_uri='https://oauth2.test/token', type='service_account',
+                               universe_domain='googleapis.com')
+
+
+@pytest.fixture(scope='module')
+def service_account() -> ServiceAccountCreds:
+    return make_service_account()
+
+
+class TokenEndpoint:
+    """Token endpoint counting the tokens it grants."""
+
+    def __init__(self, delay: float = 0) -> None:
+        self.grants = 0
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self, url, method='GET', body=None, headers=None, **kwargs):
+        time.sleep(self.delay)
+        with self.lock:
+            self.grants += 1
+        data = json.dumps({'access_token': f'token{self.grants}', 'expires_in': 3600}).encode()
+        return type('Response', (), {'status': 200, 'headers': {}, 'data': data})()
+
+
+class TestDelegatedCredentialPool:
+    """Test the pool of domain-wide delegated sessions."""
+
+    def make_pool(self, tmp_path, service_account, **kwargs) -> DelegatedCredentialPool:
+        cred_store = CredStore(path=tmp_path / 'store.sqlite')
+        cred_store.add('default', creds=service_account)
+        cred_store.add('oauth', creds=make_creds('client'))
+        return DelegatedCredentialPool(cred_store, TokenEndpoint(), **kwargs)
+
+    def test_caches_sessions(self, tmp_path, service_account):
+        pool = self.make_pool(tmp_path, service_account)
+        session = pool.get('alice@example.test', ['gmail.send', 'gmail.readonly'])
+        assert session.valid and session._subject == 'alice@example.test'
+        assert pool.get('alice@example.test', ['gmail.readonly', 'gmail.send']) is session
+        assert pool.get('bob@example.test', ['gmail.send']) is not session
+        assert pool.get('alice@example.test', ['gmail.send']) is not session
+        assert pool.request.grants == 3
+
+        with pytest.raises(ValueError):
+            pool.get('alice@example.test', ['gmail.send'], key='oauth')
+        with pytest.raises(ValueError):
+            pool.get('alice@example.test')
+
+    def test_eviction(self, tmp_path, service_account, monkeypatch):
+        now = [0.0]
+        monkeypatch.setattr(base.time, 'monotonic', lambda: now[0])
+        pool = self.make_pool(tmp_path, service_account, ttl=60, max_size=2)
+        scopes = ['gmail.send']
+
+        alice = pool.get('alice@example.test', scopes)
+        now[0] = 30
+        assert pool.get('alice@example.test', scopes) is alice
+        pool.get('bob@example.test', scopes)
+        pool.get('carol@example.test', scopes)
+        assert [subject for _, subject, _ in pool.sessions] == ['bob@example.test', 'carol@example.test']
+
+        now[0] = 95
+        pool.get('dave@example.test', scopes)
+        assert [subject for _, subject, _ in pool.sessions] == ['dave@example.test']
+
+    def test_concurrent_workers_share_token(self, tmp_path, service_account):
+        pool = self.make_pool(tmp_path, service_account)
+        pool.request.delay = 0.05
+        sessions = []
+        threads = [threading.Thread(target=lambda: sessions.append(pool.get('alice@example.test', ['drive'])))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len({id(session) for session in sessions}) == 1 and pool.request.grants == 1
+
+    def test_build_service(self, tmp_path, service_account):
+        obj = SWAT({}, cred_store=self.make_pool(tmp_path, service_account).cred_store)
+        obj.delegated.request = TokenEndpoint()
+        scopes = ['admin.directory.user']
+        alice = obj.build_service('admin', 'directory_v1', subject='alice@example.test', scopes=scopes)
+        again = obj.build_service('admin', 'directory_v1', subject='alice@example.test', scopes=scopes)
+        bob = obj.build_service('admin', 'directory_v1', subject='bob@example.test', scopes=scopes)
+        assert alice._http.credentials._subject == 'alice@example.test'
+        assert bob._http.credentials._subject == 'bob@example.test'
+        # the services share the pooled session, and are not memoized beyond it
+        assert again._http.credentials is alice._http.credentials and obj.delegated.request.grants == 2
+        assert not obj.services
@@ -1,11 +1,17 @@
+import argparse
+import io
+import logging
+import threading
 import warnings
 from typing import List, Type
+from unittest import mock
 
 import pytest
 
 from swat.commands.base_command import BaseCommand
 from swat.commands.emulate import Command as emulate_command
-from swat.emulations.base_emulation import BaseEmulation
+from swat.emulations.base_emulation import RESUMABLE_UPLOAD_THRESHOLD, BaseEmulation, map_file, media_upload
+from swat.emulations.collection.drive_access_private_keys import Emulation as DriveAccessPrivateKeys
 
 
 class TestEmulations:
@@ -33,4 +39,62 @@ class TestEmulations:
     def test_required_attributes(self, emulation: Type[BaseEmulation], attribute: str, error_msg: str):
         """Test if required attributes are defined in emulation."""
 
-        assert hasattr(emulation, attribute), f'Emulation "{emulation.name}" {error_msg}'
\ No newline at end of file
+        assert hasattr(emulation, attribute), f'Emulation "{emulation.name}" {error_msg}'
+
+class TestUploads:
+    """Test in-memory media uploads."""
+
+    def test_small_upload_single_request(self):
+        for data in (b'key', io.BytesIO(b'key')):
+            media = media_upload(data, 'text/plain')
+            assert not media.resumable() and media.size() == 3 and media.getbytes(0, 3) == b'key'
+
+    def test_large_upload_resumable(self):
+        assert media_upload(bytes(RESUMABLE_UPLOAD_THRESHOLD + 1)).resumable()
+
+    def test_mapped_file(self, tmp_path):
+        path = tmp_path / 'payload.bin'
+        path.write_bytes(b'0123456789')
+        with map_file(path) as mapped:
+            media = media_upload(mapped)
+            assert media.size() == 10 and media.getbytes(2, 3) == b'234'
+
+        path.write_bytes(b'')
+        with map_file(path) as mapped:
+            assert media_upload(mapped).size() == 0
+
+
+class TestDriveAccessPrivateKeys:
+    """Test staging key files in Drive with a mocked service."""
+
+    def test_stage_files(self):
+        emulation = DriveAccessPrivateKeys.__new__(DriveAccessPrivateKeys)
+        emulation.args = argparse.Namespace(workers=3)
+        emulation.folder_id = 'folder'
+        emulation.file_extensions = ['pem', 'key', 'p12']
+        emulation.elogger = logging.getLogger(__name__)
+        emulation.service = mock.MagicMock()
+        emulation.obj = mock.MagicMock()
+        emulation.obj.executor.execute_batch.side_effect = lambda service, batch: {
+            name: ({'id': name}, None) for name in batch
+        }
+
+        # every upload waits for the others, so they only complete if they run on separate workers
+        barrier = threading.Barrier(3, timeout=5)
+
+        def upload_to_drive(service, content, metadata, mimetype, fields=None):
+            barrier.wait()
+            if metadata['name'].endswith('.key'):
+                raise RuntimeError('upload failed')
+            return {'id': f'id-{metadata["name"]}'}
+
+        emulation.upload_to_drive = upload_to_drive
+        links = emulation.stage_files()
+        assert sorted(links) == ['https://drive.google.com/file/d/id-fake_file.p12/view',
+                                 'https://drive.google.com/file/d/id-fake_file.pem/view']
+
+        emulation.obj.executor.execute_batch.assert_called_once()
+        _, batch = emulation.obj.executor.execute_batch.call_args.args
+        assert sorted(batch) == ['fake_file.p12', 'fake_file.pem']
+        file_ids = sorted(call.kwargs['fileId'] for call in emulation.service.permissions().create.call_args_list)
+        assert file_ids == ['id-fake_file.p12', 'id-fake_file.pem']
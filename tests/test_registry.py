@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from swat import registry
+from swat.commands.emulate import Command as emulate_command
+from swat.registry import Registry
+
+EMULATION = """
+from ..base_emulation import BaseEmulation
+
+
+class Emulation(BaseEmulation):
+
+    parser = BaseEmulation.load_parser(description='Does things.')
+
+    techniques = ['t1098']
+    name = 'Example'
+    services = ['admin']
+    scopes = ['admin.directory.user']
+"""
+
+
+class TestRegistry:
+    """Test the registry of commands and emulations."""
+
+    @pytest.fixture
+    def emulations_dir(self, tmp_path, monkeypatch):
+        emulations_dir = tmp_path / 'emulations'
+        (emulations_dir / 'persistence').mkdir(parents=True)
+        (emulations_dir / 'persistence' / 'example.py').write_text(EMULATION)
+        (emulations_dir / 'persistence' / '__init__.py').write_text('')
+        (emulations_dir / 'base_emulation.py').write_text('')
+        monkeypatch.setattr(registry, 'EMULATIONS_DIR', emulations_dir)
+        return emulations_dir
+
+    def test_matches_emulation_classes(self):
+        emulations = Registry.build().emulations
+        classes = emulate_command.load_all_emulation_classes()
+        assert len(emulations) == len(classes)
+        for cls in classes:
+            info = emulations[cls.__module__.split('.')[-1]]
+            assert (info.name, info.techniques, info.scopes, info.services) == \
+                (cls.name, cls.techniques, cls.scopes, cls.services)
+            assert info.parser_description == cls.parser.description
+            assert f'swat.emulations.{info.dotted_path}' == cls.__module__
+
+    def test_commands(self):
+        commands = Registry.build().commands
+        assert commands['emulate'] == 'emulate' and 'base_command' not in commands
+
+    def test_static_metadata(self, emulations_dir):
+        info = Registry.build().emulations['example']
+        assert (info.dotted_path, info.tactic, info.name) == ('persistence.example', 'persistence', 'Example')
+        assert info.parser_description == 'Does things.' and info.description is None
+
+    def test_manifest(self, emulations_dir, tmp_path, monkeypatch):
+        manifest_path = tmp_path / 'registry.json'
+        Registry.build(manifest_path)
+        assert manifest_path.exists()
+
+        parsed = []
+        parse_emulation = registry.parse_emulation
+        monkeypatch.setattr(registry, 'parse_emulation', lambda path: parsed.append(path) or parse_emulation(path))
+        assert Registry.build(manifest_path).emulations['example'].name == 'Example'
+        assert not parsed
+
+        path = emulations_dir / 'persistence' / 'example.py'
+        path.write_text(EMULATION.replace("'Example'", "'Changed'"))
+        os.utime(path, (0, 0))
+        assert Registry.build(manifest_path).emulations['example'].name == 'Changed'
+        assert parsed == [path]
+
+    def test_ambiguous(self, emulations_dir):
+        (emulations_dir / 'collection').mkdir()
+        (emulations_dir / 'collection' / 'example.py').write_text(EMULATION)
+        with pytest.raises(AssertionError):
+            Registry.build().get_dotted_emulation_path('example')
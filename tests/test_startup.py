@@ -0,0 +1,44 @@
+import subprocess
+import sys
+
+import pytest
+
+# cumulative import time of the shell, in seconds, measured with -X importtime
+STARTUP_BUDGET = 1.0
+# dependencies loaded at first use rather than when the shell starts
+LAZY_MODULES = ('selenium', 'pandas', 'numpy', 'pyarrow', 'tabulate')
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Import a module in a fresh interpreter, returning the cumulative import time of each module in microseconds."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.fixture(scope='module')
+def shell_import_times() -> dict[str, int]:
+    return import_times('swat.shell')
+
+
+class TestStartup:
+    """Test the import cost of starting the shell."""
+
+    def test_startup_budget(self, shell_import_times):
+        seconds = shell_import_times['swat.shell'] / 1e6
+        assert seconds < STARTUP_BUDGET, f'Importing the shell took {seconds:.2f}s'
+
+    @pytest.mark.parametrize('module', LAZY_MODULES)
+    def test_lazy_imports(self, shell_import_times, module):
+        assert not any(name == module or name.startswith(f'{module}.') for name in shell_import_times)
+
+    def test_commands_not_imported(self, shell_import_times):
+        assert 'swat.commands.audit' not in shell_import_times
+        assert not any(name.startswith('swat.emulations.') and name != 'swat.emulations.base_emulation'
+                       for name in shell_import_times)
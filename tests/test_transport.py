@@ -0,0 +1,109 @@
+import gzip
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.http import HttpRequest
+from requests.adapters import HTTPAdapter
+
+from swat.api import RequestExecutor
+from swat.transport import Transport
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+
+    def do_GET(self):
+        self.connections.add(self.client_address)
+        body = gzip.compress(b'{"ok": true}')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FlakyAdapter(HTTPAdapter):
+    """Adapter failing the first requests with the given errors."""
+
+    def __init__(self, errors: list) -> None:
+        super().__init__()
+        self.errors = errors
+
+    def send(self, request, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        return super().send(request, **kwargs)
+
+
+@pytest.fixture
+def server():
+    Handler.connections = set()
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestTransport:
+    """Test the shared HTTP transport."""
+
+    def test_connections_reused(self, server):
+        transport = Transport(pool_size=2)
+        http = transport.authorized_http(AnonymousCredentials())
+        for _ in range(3):
+            assert transport.get(server).json() == {'ok': True}
+            http.request(server)
+        assert len(Handler.connections) == 1
+
+    def test_concurrent_requests_wait_for_pool(self, server, caplog):
+        transport = Transport(pool_size=1)
+        with caplog.at_level(logging.WARNING), ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(lambda _: transport.get(server).json(), range(16)))
+        assert responses == [{'ok': True}] * 16
+        assert len(Handler.connections) == 1 and 'pool is full' not in caplog.text
+
+    def test_authorized_http_response(self, server):
+        http = Transport().authorized_http(AnonymousCredentials())
+        response, content = http.request(f'{server}/path', 'GET')
+        assert response.status == 200 and response['content-type'] == 'application/json'
+        assert content == b'{"ok": true}' and 'content-encoding' not in response
+
+    def test_from_config(self):
+        transport = Transport.from_config({'settings': {'http': {'pool_size': 4, 'timeout': 5, 'pool_block': False}}})
+        assert transport.pool_size == 4 and transport.timeout == 5 and not transport.pool_block
+
+    def test_connection_errors_retried(self, server, monkeypatch):
+        monkeypatch.setattr('swat.api.time.sleep', lambda seconds: None)
+        transport = Transport()
+        transport.adapter = FlakyAdapter([requests.exceptions.ConnectionError('reset'),
+                                          requests.exceptions.ReadTimeout('timed out')])
+        http = transport.authorized_http(AnonymousCredentials())
+        request = HttpRequest(http, lambda response, content: json.loads(content), server,
+                              methodId='directory.users.get')
+
+        executor = RequestExecutor(quotas={})
+        assert executor.execute(request) == {'ok': True}
+        assert executor.stats['directory'] == {'requests': 3, 'retries': 2}
+
+    def test_connection_errors_raised_as_builtin(self):
+        transport = Transport()
+        transport.adapter = FlakyAdapter([requests.exceptions.ConnectTimeout('timed out'),
+                                          requests.exceptions.ConnectionError('refused')])
+        http = transport.authorized_http(AnonymousCredentials())
+        with pytest.raises(TimeoutError):
+            http.request('http://127.0.0.1:9/')
+        with pytest.raises(ConnectionError):
+            http.request('http://127.0.0.1:9/')